@@ -0,0 +1,169 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+import asyncio
+import math
+import time
+from typing import Callable, Dict, Optional
+
+import anyio
+from fastapi.responses import StreamingResponse
+from opentelemetry import metrics
+from opentelemetry.metrics import CallbackOptions, Observation
+from starlette.types import Receive, Scope, Send
+
+meter = metrics.get_meter(__name__)
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a stream cannot be admitted.
+
+    :param retry_after: The number of seconds the client should wait before retrying.
+    """
+
+    def __init__(self, message: str, retry_after: int) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Per-worker limit of concurrently active upstream streams.
+
+    Requests over the limit wait in a bounded queue; a request is rejected when
+    the queue is full or it waited for longer than ``queue_timeout``.
+
+    :param max_active: The maximal number of active streams. 0 disables the limit.
+    :param max_queue: The maximal number of requests waiting for a stream slot.
+    :param queue_timeout: The maximal time in seconds a request waits for a slot.
+    """
+
+    def __init__(self, max_active: int = 32, max_queue: int = 64, queue_timeout: float = 10.0) -> None:
+        """Constructor."""
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max(max_active, 1))
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+        self._wait_time_histogram = meter.create_histogram(
+            "chat.admission.wait_time", unit="s", description="Time spent waiting for a stream slot")
+        self._rejected_counter = meter.create_counter(
+            "chat.admission.rejected", description="Chat requests rejected with 429")
+        meter.create_observable_gauge(
+            "chat.admission.queue_depth", callbacks=[self._observe_queue_depth],
+            description="Chat requests waiting for a stream slot")
+        meter.create_observable_gauge(
+            "chat.admission.active_streams", callbacks=[self._observe_active],
+            description="Active upstream streams")
+
+    def _observe_queue_depth(self, options: CallbackOptions):
+        yield Observation(self.waiting)
+
+    def _observe_active(self, options: CallbackOptions):
+        yield Observation(self.active)
+
+    @property
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.queue_timeout))
+
+    def _reject(self, message: str) -> AdmissionRejected:
+        self.rejected += 1
+        self._rejected_counter.add(1)
+        return AdmissionRejected(message, self.retry_after)
+
+    async def acquire(self) -> None:
+        """
+        Wait for a stream slot.
+
+        :raises AdmissionRejected: if the queue is full or the wait timed out.
+        """
+        if self.max_active <= 0:
+            self.active += 1
+            return
+        if self._semaphore.locked():
+            if self.waiting >= self.max_queue:
+                raise self._reject("Too many concurrent chat requests.")
+            self.waiting += 1
+            start = time.monotonic()
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.timed_out += 1
+                raise self._reject("Timed out waiting for a chat stream slot.")
+            finally:
+                self.waiting -= 1
+                waited = time.monotonic() - start
+                self.wait_time_total += waited
+                self.wait_time_max = max(self.wait_time_max, waited)
+                self._wait_time_histogram.record(waited)
+        else:
+            await self._semaphore.acquire()
+            self._wait_time_histogram.record(0.0)
+        self.active += 1
+        self.admitted += 1
+
+    def release(self) -> None:
+        """Release a stream slot taken by acquire."""
+        self.active -= 1
+        if self.max_active > 0:
+            self._semaphore.release()
+
+    def stats(self) -> Dict[str, float]:
+        """Return the counters of the controller."""
+        return {
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "wait_time_total": self.wait_time_total,
+            "wait_time_max": self.wait_time_max,
+        }
+
+
+class ReleasingStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse, which calls ``on_close``, if given, once the response is finished.
+
+    The callback runs even if the client disconnects before the body generator
+    was started, so a stream slot is never leaked. A disconnect is detected
+    while the body generator waits for upstream events, not only when a send
+    fails; the generator is then closed right away and the background task
+    still runs.
+    """
+
+    def __init__(self, *args, on_close: Optional[Callable[[], None]] = None, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._on_close = on_close
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            async with anyio.create_task_group() as task_group:
+
+                async def stream() -> None:
+                    try:
+                        await self.stream_response(send)
+                    except OSError:
+                        pass
+                    task_group.cancel_scope.cancel()
+
+                task_group.start_soon(stream)
+                await self.listen_for_disconnect(receive)
+                task_group.cancel_scope.cancel()
+
+            # Close the body generator now rather than when it is garbage collected.
+            with anyio.CancelScope(shield=True):
+                await self.body_iterator.aclose()
+                if self.background is not None:
+                    await self.background()
+        finally:
+            if self._on_close is not None:
+                self._on_close()
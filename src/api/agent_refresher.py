@@ -0,0 +1,116 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+import asyncio
+import logging
+import random
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
+
+from azure.core.exceptions import ResourceNotModifiedError
+from opentelemetry import metrics
+
+if TYPE_CHECKING:
+    from azure.ai.projects.aio import AIProjectClient
+    from azure.ai.projects.models import AgentObject, AgentVersionObject
+
+logger = logging.getLogger("azureaiapp")
+meter = metrics.get_meter(__name__)
+
+
+def same_agent_name(agent_id: Optional[str], current_agent_id: str) -> bool:
+    """Return True if both "name:version" agent IDs belong to the same agent, whatever their versions."""
+    return bool(agent_id) and agent_id.partition(":")[0] == current_agent_id.partition(":")[0]
+
+
+class AgentVersionRefresher:
+    """
+    Follows the latest version of the agent without restarting the worker.
+
+    The agent is polled every ``interval`` seconds, with jitter so the workers
+    do not poll together. A request sends the ETag of the previous response
+    in If-None-Match, and an unchanged latest version is not swapped in.
+    A new version replaces ``state.agent_version_obj`` with a single assignment:
+    new requests use the new version, while the running streams keep the
+    version object they were started with.
+
+    :param project_client: The project client of the worker.
+    :param state: The app.state holding agent_version_obj.
+    :param interval: The time in seconds between two polls.
+    """
+
+    def __init__(self, project_client: "AIProjectClient", state: Any, interval: float = 60.0) -> None:
+        """Constructor."""
+        self._project_client = project_client
+        self._state = state
+        self.interval = interval
+        self._etag: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+        self.polls = 0
+        self.not_modified = 0
+        self.swaps = 0
+        self.errors = 0
+
+        self._polls_counter = meter.create_counter(
+            "agent.refresh.polls", description="Polls of the latest agent version by result "
+                                               "(unchanged, not_modified, swapped, error)")
+
+    def start(self) -> None:
+        """Start polling the agent."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Stop polling."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval * random.uniform(0.9, 1.1))
+            await self.refresh()
+
+    async def _get_agent(self, agent_name: str) -> Tuple["AgentObject", Optional[str]]:
+        headers = {"If-None-Match": self._etag} if self._etag else {}
+        return await self._project_client.agents.get(
+            agent_name, headers=headers,
+            cls=lambda pipeline_response, agent, _: (agent, pipeline_response.http_response.headers.get("ETag")))
+
+    async def refresh(self) -> bool:
+        """Poll the agent once; return True if a new version was swapped in."""
+        current: "AgentVersionObject" = self._state.agent_version_obj
+        self.polls += 1
+        try:
+            agent, self._etag = await self._get_agent(current.name)
+        except ResourceNotModifiedError:
+            self.not_modified += 1
+            self._polls_counter.add(1, {"result": "not_modified"})
+            return False
+        except Exception as e:
+            self.errors += 1
+            self._polls_counter.add(1, {"result": "error"})
+            logger.warning(f"Error polling agent {current.name}: {e}")
+            return False
+
+        latest: "AgentVersionObject" = agent.versions.latest
+        if latest.version == current.version:
+            self._polls_counter.add(1, {"result": "unchanged"})
+            return False
+        self._state.agent_version_obj = latest
+        self.swaps += 1
+        self._polls_counter.add(1, {"result": "swapped"})
+        logger.info(f"Agent {current.name} moved from version {current.version} to {latest.version}")
+        return True
+
+    def stats(self) -> Dict[str, float]:
+        """Return the counters of the refresher."""
+        return {
+            "polls": self.polls,
+            "not_modified": self.not_modified,
+            "swaps": self.swaps,
+            "errors": self.errors,
+        }
@@ -0,0 +1,68 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+import hashlib
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from opentelemetry import metrics
+
+from .cache import TTLCache
+
+meter = metrics.get_meter(__name__)
+
+# Request header to skip the answer cache, e.g. "X-Answer-Cache: bypass"
+ANSWER_CACHE_HEADER = "X-Answer-Cache"
+
+
+@dataclass
+class CachedAnswer:
+    """The completed messages of an agent run, as sent in completed_message events."""
+    messages: List[Dict]
+
+
+def normalize_question(message: str) -> str:
+    """Normalize the user message, so trivially different spellings share an entry."""
+    return " ".join(message.casefold().split()).rstrip("?!. ")
+
+
+class AnswerCache(TTLCache[str, CachedAnswer]):
+    """
+    Per-worker cache of answers to repeated questions.
+
+    Entries are keyed by the agent name and version and the normalized user
+    message.
+
+    :param max_size: The maximal number of cached answers. 0 disables the cache.
+    :param ttl: The time to live of a cached answer in seconds.
+    """
+
+    def __init__(self, max_size: int = 0, ttl: float = 3600.0) -> None:
+        """Constructor."""
+        super().__init__(max_size=max_size, ttl=ttl)
+        self.bypassed = 0
+        self._lookups = meter.create_counter(
+            "chat.answer_cache.lookups", description="Answer cache lookups by result (hit, miss, bypass)")
+
+    @staticmethod
+    def make_key(agent_name: str, agent_version: str, message: str) -> str:
+        question = normalize_question(message)
+        digest = hashlib.sha256(f"{agent_name}\0{agent_version}\0{question}".encode("utf-8"))
+        return digest.hexdigest()
+
+    def lookup(self, key: str) -> Optional[CachedAnswer]:
+        """Return the cached answer and count the lookup."""
+        answer = self.get(key)
+        self._lookups.add(1, {"result": "hit" if answer else "miss"})
+        return answer
+
+    def record_bypass(self) -> None:
+        self.bypassed += 1
+        self._lookups.add(1, {"result": "bypass"})
+
+    def stats(self) -> Dict[str, float]:
+        stats = super().stats()
+        lookups = stats["hits"] + stats["misses"]
+        stats["bypassed"] = self.bypassed
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,99 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+import asyncio
+import collections
+from dataclasses import dataclass
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, List, Optional
+
+BATCH_MEDIA_TYPE = "application/x-ndjson"
+# The attempts to get a stream slot for an item before it is reported as rejected.
+BATCH_ADMISSION_ATTEMPTS = 3
+
+
+@dataclass
+class BatchItem:
+    """A message of a batch request, with its position in the request."""
+    index: int
+    message: str
+    id: Optional[str] = None
+    conversation_id: Optional[str] = None
+
+
+def parse_batch_items(data: Any, max_items: int) -> List[BatchItem]:
+    """
+    Parse the body of a batch request.
+
+    The body is {"items": [...]}, an item being a message string or an object
+    {"message": ..., "id": ..., "conversation_id": ...} of which only the
+    message is required.
+
+    :raises ValueError: If the body is malformed or has more than ``max_items`` items.
+    """
+    items = data.get("items") if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        raise ValueError("expected a non-empty 'items' list")
+    if len(items) > max_items:
+        raise ValueError(f"a batch has at most {max_items} items, got {len(items)}")
+    parsed = []
+    for index, item in enumerate(items):
+        if isinstance(item, str):
+            item = {"message": item}
+        if not isinstance(item, dict) or not isinstance(item.get("message"), str):
+            raise ValueError(f"item {index} has no 'message' string")
+        item_id = item.get("id")
+        conversation_id = item.get("conversation_id")
+        parsed.append(BatchItem(
+            index=index,
+            message=item["message"],
+            id=str(item_id) if item_id is not None else None,
+            conversation_id=str(conversation_id) if conversation_id else None,
+        ))
+    return parsed
+
+
+def group_by_conversation(items: List[BatchItem]) -> List[List[BatchItem]]:
+    """
+    Group the items which share a conversation, in request order.
+
+    Runs of one conversation cannot overlap, so the items of a group run one
+    after the other; every item without a conversation is a group of its own.
+    """
+    groups: Dict[Any, List[BatchItem]] = {}
+    for item in items:
+        key = item.conversation_id if item.conversation_id else ("item", item.index)
+        groups.setdefault(key, []).append(item)
+    return list(groups.values())
+
+
+async def run_bounded(
+        groups: List[List[BatchItem]],
+        run_item: Callable[[BatchItem], Awaitable[Dict]],
+        concurrency: int
+    ) -> AsyncGenerator[Dict, None]:
+    """
+    Run the items with at most ``concurrency`` items at a time and yield their results as they complete.
+
+    Closing the generator cancels the running items.
+
+    :param groups: The items, grouped as by group_by_conversation.
+    :param run_item: Returns the result of an item; it must not raise.
+    :param concurrency: The maximal number of items running at a time.
+    """
+    pending = collections.deque(groups)
+    results: asyncio.Queue = asyncio.Queue()
+    remaining = sum(len(group) for group in groups)
+
+    async def work() -> None:
+        while pending:
+            for item in pending.popleft():
+                await results.put(await run_item(item))
+
+    workers = [asyncio.create_task(work()) for _ in range(min(max(concurrency, 1), len(groups)))]
+    try:
+        for _ in range(remaining):
+            yield await results.get()
+    finally:
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
@@ -0,0 +1,95 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+import time
+from collections import OrderedDict
+from typing import Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class TTLCache(Generic[K, V]):
+    """
+    Per-worker TTL + LRU cache.
+
+    Entries expire after ``ttl`` seconds and the least recently used entry is
+    evicted when ``max_size`` is reached.
+
+    :param max_size: The maximal number of entries. 0 disables the cache.
+    :param ttl: The time to live of an entry in seconds.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 300.0) -> None:
+        """Constructor."""
+        self._max_size = max_size
+        self._ttl = ttl
+        self._entries: "OrderedDict[K, Tuple[float, V]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._max_size > 0
+
+    def get(self, key: K) -> Optional[V]:
+        """
+        Return the cached value or None if it is absent or expired.
+
+        :param key: The key of the entry.
+        :return: The cached value.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def peek(self, key: K) -> Optional[V]:
+        """
+        Return the cached value without counting a hit or miss or refreshing its LRU position.
+
+        :param key: The key of the entry.
+        :return: The cached value, None if it is absent or expired.
+        """
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    def set(self, key: K, value: V) -> None:
+        """
+        Add or refresh the entry.
+
+        :param key: The key of the entry.
+        :param value: The value to be cached.
+        """
+        if not self.enabled:
+            return
+        self._entries[key] = (time.monotonic() + self._ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: K) -> None:
+        """
+        Remove the entry from the cache.
+
+        :param key: The key of the entry.
+        """
+        self._entries.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        """Return the hit/miss counters and the current size of the cache."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._entries),
+        }
@@ -0,0 +1,130 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+import asyncio
+import logging
+from typing import TYPE_CHECKING, Dict, Optional, Set
+
+from opentelemetry import metrics
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI, AsyncStream
+
+logger = logging.getLogger("azureaiapp")
+meter = metrics.get_meter(__name__)
+
+
+class UpstreamCanceller:
+    """
+    Cancels the upstream responses of streams whose client disconnected or cancelled.
+
+    Closing the upstream stream stops the generation, ``responses.cancel`` is
+    called in addition when ``cancel_responses`` is set; it only cancels
+    responses created with ``background=True``, which the app does not create.
+    The work runs in background tasks, since the disconnected request's task
+    is being cancelled.
+
+    The tokens and seconds saved are estimated from the moving average of the
+    output tokens and durations of the completed responses.
+
+    :param openai_client: The worker's shared OpenAI client.
+    :param cancel_responses: Whether to call responses.cancel after closing the stream.
+    :param smoothing: The weight of the newest completed response in the moving averages.
+    """
+
+    def __init__(
+            self,
+            openai_client: "AsyncOpenAI",
+            cancel_responses: bool = False,
+            smoothing: float = 0.1
+        ) -> None:
+        """Constructor."""
+        self._openai_client = openai_client
+        self.cancel_responses = cancel_responses
+        self.smoothing = smoothing
+        self._tasks: Set[asyncio.Task] = set()
+        self.average_output_tokens: Optional[float] = None
+        self.average_duration: Optional[float] = None
+        self.cancelled = 0
+        self.tokens_saved = 0
+        self.seconds_saved = 0.0
+
+        self._cancelled_counter = meter.create_counter(
+            "chat.cancellation.streams", description="Upstream responses cancelled after a client disconnect")
+        self._tokens_saved_counter = meter.create_counter(
+            "chat.cancellation.tokens_saved", unit="{token}",
+            description="Estimated output tokens not generated thanks to cancellations")
+        self._seconds_saved_counter = meter.create_counter(
+            "chat.cancellation.seconds_saved", unit="s",
+            description="Estimated stream seconds saved by cancellations")
+
+    def _average(self, average: Optional[float], value: float) -> float:
+        if average is None:
+            return value
+        return average + self.smoothing * (value - average)
+
+    def record_completed(self, output_tokens: int, duration: float) -> None:
+        """
+        Add a completed response to the averages used for the estimates.
+
+        :param output_tokens: The output tokens of the response.
+        :param duration: The duration of the stream in seconds.
+        """
+        self.average_output_tokens = self._average(self.average_output_tokens, output_tokens)
+        self.average_duration = self._average(self.average_duration, duration)
+
+    def cancel(
+            self,
+            stream: Optional["AsyncStream"],
+            response_id: Optional[str],
+            streamed_tokens: int,
+            elapsed: float) -> None:
+        """
+        Cancel the upstream response of a stopped stream in the background.
+
+        :param stream: The upstream event stream, if it was created.
+        :param response_id: The ID of the response, if known.
+        :param streamed_tokens: The number of output tokens received so far.
+        :param elapsed: The time in seconds since the stream was started.
+        """
+        tokens_saved = max(round((self.average_output_tokens or 0) - streamed_tokens), 0)
+        seconds_saved = max((self.average_duration or 0.0) - elapsed, 0.0)
+        self.cancelled += 1
+        self.tokens_saved += tokens_saved
+        self.seconds_saved += seconds_saved
+        self._cancelled_counter.add(1)
+        self._tokens_saved_counter.add(tokens_saved)
+        self._seconds_saved_counter.add(seconds_saved)
+        logger.info(
+            f"Client stopped the stream, cancelling response {response_id} after {elapsed:.2f}s; "
+            f"estimated {tokens_saved} tokens and {seconds_saved:.2f}s saved"
+        )
+        task = asyncio.create_task(self._cancel(stream, response_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _cancel(self, stream: Optional["AsyncStream"], response_id: Optional[str]) -> None:
+        if stream is not None:
+            try:
+                await stream.close()
+            except Exception as e:
+                logger.warning(f"Error closing the stream of response {response_id}: {e}")
+        if self.cancel_responses and response_id:
+            try:
+                await self._openai_client.responses.cancel(response_id)
+            except Exception as e:
+                # Only background responses can be cancelled; closing the stream suffices otherwise.
+                logger.info(f"Response {response_id} was not cancelled: {e}")
+
+    async def close(self) -> None:
+        """Wait for the pending cancellations."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, float]:
+        """Return the counters of the canceller."""
+        return {
+            "cancelled": self.cancelled,
+            "tokens_saved": self.tokens_saved,
+            "seconds_saved": self.seconds_saved,
+        }
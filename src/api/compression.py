@@ -0,0 +1,139 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+import zlib
+from typing import Dict, Iterable, Optional
+
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipResponder, IdentityResponder
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ModuleNotFoundError:
+    brotli = None
+
+# Media types which are compressed already; compressing them again only costs CPU.
+INCOMPRESSIBLE_CONTENT_TYPES = (
+    "image/png", "image/jpeg", "image/gif", "image/webp", "image/avif",
+    "font/woff", "font/woff2", "application/zip", "application/gzip", "audio/", "video/",
+)
+
+
+class SkipCompressedMixin:
+    async def send_with_compression(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            content_type = Headers(raw=message["headers"]).get("content-type", "")
+            await super().send_with_compression(message)
+            self.content_type_is_excluded = (
+                self.content_type_is_excluded or content_type.startswith(INCOMPRESSIBLE_CONTENT_TYPES))
+            return
+        await super().send_with_compression(message)
+
+
+class BrotliResponder(SkipCompressedMixin, IdentityResponder):
+    content_encoding = "br"
+
+    def __init__(self, app: ASGIApp, minimum_size: int, quality: int = 4) -> None:
+        super().__init__(app, minimum_size)
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        # Each streamed chunk is flushed, so it can be decoded on arrival.
+        compressed = self.compressor.process(body)
+        if more_body:
+            return compressed + self.compressor.flush()
+        return compressed + self.compressor.finish()
+
+
+class FlushingGZipResponder(SkipCompressedMixin, GZipResponder):
+    def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        # Each streamed chunk is flushed, as with brotli; GZipResponder holds it back otherwise.
+        self.gzip_file.write(body)
+        if more_body:
+            self.gzip_file.flush(zlib.Z_SYNC_FLUSH)
+        else:
+            self.gzip_file.close()
+        compressed = self.gzip_buffer.getvalue()
+        self.gzip_buffer.seek(0)
+        self.gzip_buffer.truncate()
+        return compressed
+
+
+def parse_accept_encoding(value: str) -> Dict[str, float]:
+    """Return the accepted encodings with their q-values."""
+    encodings = {}
+    for part in value.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        encodings[coding] = q
+    return encodings
+
+
+def select_encoding(accept_encoding: str, candidates: Iterable[str]) -> Optional[str]:
+    """Return the candidate encoding with the highest q-value, the first one on ties, or None."""
+    accepted = parse_accept_encoding(accept_encoding)
+    wildcard = accepted.get("*", 0.0)
+    best = None
+    best_q = 0.0
+    for coding in candidates:
+        q = accepted.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+class CompressionMiddleware:
+    """
+    Compress responses with brotli or gzip, depending on the Accept-Encoding header.
+
+    Brotli is preferred when the brotli package is installed. Responses smaller
+    than ``minimum_size``, ``text/event-stream`` responses, responses with a
+    Content-Encoding and compressed media like images are sent as is.
+    Streamed responses, like the NDJSON of /chat/batch, are flushed per chunk.
+
+    :param app: The ASGI application.
+    :param minimum_size: The minimal size of a response body to be compressed.
+    :param gzip_level: The gzip compression level.
+    :param brotli_quality: The brotli quality.
+    """
+
+    def __init__(
+            self,
+            app: ASGIApp,
+            minimum_size: int = 500,
+            gzip_level: int = 6,
+            brotli_quality: int = 4
+        ) -> None:
+        """Constructor."""
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def select_encoding(self, accept_encoding: str) -> Optional[str]:
+        return select_encoding(accept_encoding, ["br", "gzip"] if brotli is not None else ["gzip"])
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = self.select_encoding(Headers(scope=scope).get("Accept-Encoding", ""))
+        responder: ASGIApp
+        if encoding == "br":
+            responder = BrotliResponder(self.app, self.minimum_size, quality=self.brotli_quality)
+        elif encoding == "gzip":
+            responder = FlushingGZipResponder(self.app, self.minimum_size, compresslevel=self.gzip_level)
+        else:
+            responder = IdentityResponder(self.app, self.minimum_size)
+        await responder(scope, receive, send)
@@ -0,0 +1,31 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+from typing import TYPE_CHECKING
+
+from .cache import TTLCache
+
+if TYPE_CHECKING:
+    from openai.types.conversations import Conversation
+
+
+class ConversationCache(TTLCache[str, "Conversation"]):
+    """
+    Per-worker TTL + LRU cache of the conversations known to exist.
+
+    The cache avoids a remote ``conversations.retrieve`` for conversations this
+    worker has seen recently. Other workers write the metadata of the same
+    conversations, so it is not cached: a cached conversation has its metadata
+    set to None, and whoever needs the created_at timestamps retrieves them.
+
+    :param max_size: The maximal number of cached conversations. 0 disables the cache.
+    :param ttl: The time to live of a cache entry in seconds.
+    """
+
+    def put(self, conversation: "Conversation") -> None:
+        """
+        Add or refresh the conversation in the cache, without its metadata.
+
+        :param conversation: The conversation to be cached.
+        """
+        self.set(conversation.id, conversation.model_copy(update={"metadata": None}))
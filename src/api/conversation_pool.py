@@ -0,0 +1,189 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+import asyncio
+import collections
+import logging
+import time
+from typing import TYPE_CHECKING, Deque, Dict, List, Optional, Set, Tuple
+
+from opentelemetry import metrics
+from opentelemetry.metrics import CallbackOptions, Observation
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+    from openai.types.conversations import Conversation
+
+logger = logging.getLogger("azureaiapp")
+meter = metrics.get_meter(__name__)
+
+
+class ConversationPool:
+    """
+    Per-worker pool of pre-created, empty conversations.
+
+    A new visitor takes a conversation from the pool instead of waiting for
+    ``conversations.create``; a background task refills the pool. The task
+    also evicts and deletes the pooled conversations once they are older than
+    ``max_age``, and the conversations still pooled at shutdown are deleted
+    too, so none is left behind unused.
+
+    :param openai_client: The worker's shared OpenAI client.
+    :param size: The number of conversations to keep ready. 0 disables the pool.
+    :param max_age: The maximal age in seconds of a pooled conversation.
+    :param retry_delay: The time in seconds to wait after a failed create.
+    """
+
+    def __init__(
+            self,
+            openai_client: "AsyncOpenAI",
+            size: int = 0,
+            max_age: float = 3600.0,
+            retry_delay: float = 5.0
+        ) -> None:
+        """Constructor."""
+        self._openai_client = openai_client
+        self.size = size
+        self.max_age = max_age
+        self.retry_delay = retry_delay
+        # (conversation, time of creation), oldest first.
+        self._pool: Deque[Tuple["Conversation", float]] = collections.deque()
+        # The times the pool went below its size, not yet refilled.
+        self._shortfalls: Deque[float] = collections.deque()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._deletions: Set[asyncio.Task] = set()
+        self.taken = 0
+        self.empty = 0
+        self.created = 0
+        self.expired = 0
+        self.errors = 0
+        self.refill_lag_max = 0.0
+
+        self._takes_counter = meter.create_counter(
+            "chat.conversation_pool.takes", description="Conversation pool takes by result (hit, empty)")
+        self._refill_lag_histogram = meter.create_histogram(
+            "chat.conversation_pool.refill_lag", unit="s",
+            description="Time from a take until the pool got its replacement conversation")
+        meter.create_observable_gauge(
+            "chat.conversation_pool.depth", callbacks=[self._observe_depth],
+            description="Pre-created conversations ready in the pool")
+
+    def _observe_depth(self, options: CallbackOptions):
+        yield Observation(len(self._pool))
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0
+
+    def start(self) -> None:
+        """Start the background refilling task."""
+        if self.enabled and self._task is None:
+            now = time.monotonic()
+            self._shortfalls.extend([now] * self.size)
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Stop refilling and delete the conversations still in the pool."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        pooled, self._pool = self._pool, collections.deque()
+        await asyncio.gather(self._delete([conversation for conversation, _ in pooled]), *self._deletions)
+
+    async def _delete(self, conversations: List["Conversation"]) -> None:
+        results = await asyncio.gather(
+            *(self._openai_client.conversations.delete(conversation.id) for conversation in conversations),
+            return_exceptions=True)
+        failed = [r for r in results if isinstance(r, Exception)]
+        if failed:
+            logger.warning(f"Failed to delete {len(failed)} pooled conversation(s): {failed[0]}")
+
+    def take(self) -> Optional["Conversation"]:
+        """
+        Return a pooled conversation, or None if the pool is empty.
+
+        Expired conversations are evicted by the refilling task, so only the
+        oldest one is checked, in case the task has not run since it expired.
+        """
+        now = time.monotonic()
+        conversation = None
+        if self._pool and now - self._pool[0][1] < self.max_age:
+            conversation, _ = self._pool.popleft()
+            self._shortfalls.append(now)
+        self._wakeup.set()
+        if conversation is None:
+            self.empty += 1
+            self._takes_counter.add(1, {"result": "empty"})
+            return None
+        self.taken += 1
+        self._takes_counter.add(1, {"result": "hit"})
+        return conversation
+
+    def _evict_expired(self) -> None:
+        now = time.monotonic()
+        expired = []
+        # The pool is oldest first, so the expired conversations are at its start.
+        while self._pool and now - self._pool[0][1] >= self.max_age:
+            conversation, _ = self._pool.popleft()
+            self._shortfalls.append(now)
+            expired.append(conversation)
+        if expired:
+            self.expired += len(expired)
+            # Deleted while the pool is refilled.
+            task = asyncio.create_task(self._delete(expired))
+            self._deletions.add(task)
+            task.add_done_callback(self._deletions.discard)
+
+    def _time_to_expiry(self) -> Optional[float]:
+        if not self._pool:
+            return None
+        return max(0.0, self._pool[0][1] + self.max_age - time.monotonic())
+
+    async def _run(self) -> None:
+        while True:
+            self._evict_expired()
+            while len(self._pool) < self.size:
+                # The missing conversations are created concurrently.
+                results = await asyncio.gather(
+                    *(self._openai_client.conversations.create() for _ in range(self.size - len(self._pool))),
+                    return_exceptions=True)
+                now = time.monotonic()
+                for result in results:
+                    if isinstance(result, Exception):
+                        self.errors += 1
+                        continue
+                    self._pool.append((result, now))
+                    self.created += 1
+                    if self._shortfalls:
+                        lag = now - self._shortfalls.popleft()
+                        self.refill_lag_max = max(self.refill_lag_max, lag)
+                        self._refill_lag_histogram.record(lag)
+                failed = [result for result in results if isinstance(result, Exception)]
+                if failed:
+                    logger.warning(f"Error pre-creating {len(failed)} conversation(s): {failed[0]}")
+                    await asyncio.sleep(self.retry_delay)
+            self._wakeup.clear()
+            try:
+                # Woken by a take, or when the oldest conversation expires; see
+                # CreatedAtWriter._run for why this is not wait_for.
+                async with asyncio.timeout(self._time_to_expiry()):
+                    await self._wakeup.wait()
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> Dict[str, float]:
+        """Return the counters of the pool."""
+        return {
+            "depth": len(self._pool),
+            "taken": self.taken,
+            "empty": self.empty,
+            "created": self.created,
+            "expired": self.expired,
+            "errors": self.errors,
+            "refill_lag_max": self.refill_lag_max,
+        }
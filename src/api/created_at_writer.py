@@ -0,0 +1,204 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Dict, List, Mapping, Optional
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+    from openai.types.conversations import Conversation
+
+from .history_cache import HistoryCache
+from .metrics import record_stage
+
+logger = logging.getLogger("azureaiapp")
+
+
+def get_created_at_label(message_id: str) -> str:
+    return f"{message_id}_created_at"
+
+
+def cleanup_created_at_metadata(metadata: Mapping[str, str]) -> None:
+    """Remove oldest created_at timestamp entries to keep metadata under 16 items limit."""
+    if not metadata:
+        return
+
+    # metadata go to be up to 16 items.  If there is more than that, remove the one ended with _created_at key with smallest value
+    while len(metadata) > 16:
+        created_at_keys = [k for k in metadata if k.endswith("_created_at")]
+        if not created_at_keys:
+            break  # No more _created_at keys to remove
+        min_key = min(created_at_keys, key=metadata.get)
+        del metadata[min_key]
+
+
+def get_input_message_id(response) -> Optional[str]:
+    """
+    Return the ID of the user message among the input items of a created response,
+    or None if the service does not report them; the writer looks the message up then.
+    """
+    for item in reversed(getattr(response, "input", None) or []):
+        if not isinstance(item, dict):
+            item = vars(item)
+        if item.get("role") == "user" and item.get("id"):
+            return item["id"]
+    return None
+
+
+@dataclass
+class _PendingTurn:
+    """The created_at of one user message, waiting to be written."""
+    created_at: float
+    # The first output item of the response. The user message is the item right before it.
+    anchor_item_id: Optional[str]
+    # The ID of the user message, if it is already known.
+    message_id: Optional[str] = None
+
+
+@dataclass
+class _PendingConversation:
+    conversation: "Conversation"
+    turns: List[_PendingTurn] = field(default_factory=list)
+
+
+class CreatedAtWriter:
+    """
+    Write-behind queue for the created_at timestamps of user messages.
+
+    ``get_result`` enqueues the timestamp together with the ID of the user message,
+    if the created response reported it, and the first output item id seen in the
+    stream, and the write happens after the SSE stream was closed. All timestamps
+    pending for one conversation are merged into a single ``conversations.update``
+    call on a fresh ``conversations.retrieve``; a message whose ID is not known is
+    looked up with one more ``conversations.items.list`` call.
+
+    :param openai_client: The worker's shared OpenAI client.
+    :param history_cache: The history cache, which gets the IDs of the user messages.
+    :param flush_delay: The time in seconds to wait for more writes before flushing.
+    :param max_interval: The maximal time in seconds a write stays in the queue.
+    """
+
+    def __init__(
+            self,
+            openai_client: "AsyncOpenAI",
+            history_cache: Optional[HistoryCache] = None,
+            flush_delay: float = 0.05,
+            max_interval: float = 5.0
+        ) -> None:
+        """Constructor."""
+        self._openai_client = openai_client
+        self._history_cache = history_cache
+        self._flush_delay = flush_delay
+        self._max_interval = max_interval
+        self._pending: Dict[str, _PendingConversation] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Start the background flushing task."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Stop the background task and write everything still pending."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def enqueue(
+            self,
+            conversation: "Conversation",
+            created_at: float,
+            anchor_item_id: Optional[str] = None,
+            message_id: Optional[str] = None) -> None:
+        """
+        Queue the created_at of the last user message of the conversation.
+
+        :param conversation: The conversation the message belongs to.
+        :param created_at: The timestamp of the user message.
+        :param anchor_item_id: The ID of the first output item of the response, if any.
+        :param message_id: The ID of the user message, if known; no lookup is done then.
+        """
+        pending = self._pending.get(conversation.id)
+        if pending is None:
+            pending = self._pending[conversation.id] = _PendingConversation(conversation)
+        pending.turns.append(_PendingTurn(created_at, anchor_item_id, message_id))
+
+    def is_pending(self, conversation_id: str) -> bool:
+        """Return True if timestamps of the conversation wait to be written."""
+        return conversation_id in self._pending
+
+    def schedule_flush(self) -> None:
+        """Ask the background task to flush; called once the response was sent."""
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                # asyncio.timeout, unlike wait_for, never swallows a cancellation which
+                # races with the wakeup, so close cannot hang.
+                async with asyncio.timeout(self._max_interval):
+                    await self._wakeup.wait()
+                # Give concurrent streams a chance to add their writes to the same batch.
+                await asyncio.sleep(self._flush_delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Write all pending timestamps, one update per conversation."""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        await asyncio.gather(*(self._write(item) for item in pending.values()))
+
+    async def _find_user_message_id(
+            self,
+            conversation_id: str,
+            anchor_item_id: Optional[str]) -> Optional[str]:
+        from openai.types.conversations.message import Message
+        # With an anchor only the single item preceding it is fetched. Without one
+        # (e.g. the run failed before any output) fall back to the newest user message.
+        if anchor_item_id:
+            items = await self._openai_client.conversations.items.list(
+                conversation_id=conversation_id, order="desc", after=anchor_item_id, limit=1)
+        else:
+            items = await self._openai_client.conversations.items.list(
+                conversation_id=conversation_id, order="desc")
+        async for item in items:
+            if isinstance(item, Message) and item.role == "user":
+                return item.id
+            if anchor_item_id:
+                break
+        return None
+
+    async def _write(self, pending: _PendingConversation) -> None:
+        # The metadata is replaced as a whole, and other workers write to it too, so the
+        # timestamps are merged into a fresh copy; a cached one may miss their timestamps.
+        started = time.perf_counter()
+        try:
+            conversation = await self._openai_client.conversations.retrieve(conversation_id=pending.conversation.id)
+            conversation.metadata = conversation.metadata or {}
+            logger.info(f"Saving created_at for {len(pending.turns)} message(s) of conversation {conversation.id}.")
+            for turn in pending.turns:
+                message_id = turn.message_id or await self._find_user_message_id(conversation.id, turn.anchor_item_id)
+                if message_id:
+                    conversation.metadata[get_created_at_label(message_id)] = str(turn.created_at)
+                    if self._history_cache and not turn.message_id:
+                        self._history_cache.resolve_user_message(conversation.id, turn.anchor_item_id, message_id)
+            cleanup_created_at_metadata(conversation.metadata)
+
+            await self._openai_client.conversations.update(conversation.id, metadata=conversation.metadata)
+            logger.info("Successfully saved created_at for user message")
+            record_stage("created_at_write", time.perf_counter() - started)
+        except Exception as e:
+            logger.error(f"Error updating message created_at: {e}")
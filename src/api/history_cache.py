@@ -0,0 +1,114 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+import asyncio
+import hashlib
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from .cache import TTLCache
+
+
+@dataclass
+class CachedHistory:
+    """
+    The formatted messages of a conversation, newest first.
+
+    Only the newest part of the conversation is cached; ``cursor`` is the ID of
+    the oldest item read from the Conversations API and ``has_more`` tells if
+    there are older items. ``newest_item_id`` is the ID of the newest item of
+    the conversation the history has, to tell if other workers added turns.
+    """
+    messages: List[Dict] = field(default_factory=list)
+    cursor: Optional[str] = None
+    has_more: bool = True
+    newest_item_id: Optional[str] = None
+    # Serializes the reads of older items by concurrent requests.
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+
+class HistoryCache(TTLCache[str, CachedHistory]):
+    """
+    Per-worker cache of the formatted history of conversations.
+
+    The history is extended with every turn completed by this worker, so that
+    history loads only ask the Conversations API for the newest item, which
+    tells if another worker extended the conversation since.
+
+    :param max_size: The maximal number of cached conversations. 0 disables the cache.
+    :param ttl: The time to live of a cache entry in seconds.
+    """
+
+    def add_turn(self, conversation_id: str, messages: List[Dict]) -> None:
+        """
+        Add the messages of a completed turn to the cached history.
+
+        :param conversation_id: The conversation ID.
+        :param messages: The messages of the turn, oldest first.
+        """
+        history = self.peek(conversation_id)
+        if history is not None:
+            history.messages[:0] = reversed(messages)
+            if messages:
+                history.newest_item_id = messages[-1]["id"]
+            self.set(conversation_id, history)
+
+    def resolve_user_message(self, conversation_id: str, anchor_item_id: Optional[str], message_id: str) -> None:
+        """
+        Set the ID of a user message added by add_turn.
+
+        The ID is known only after the turn, it is the item preceding the
+        first output item of the response.
+
+        :param conversation_id: The conversation ID.
+        :param anchor_item_id: The ID of the first output item of the response.
+        :param message_id: The ID of the user message.
+        """
+        history = self.peek(conversation_id)
+        if history is None:
+            return
+        for message in history.messages:
+            if message["id"] is None and message.get("anchor") == anchor_item_id:
+                message["id"] = message_id
+                return
+
+
+def render_history_message(message: Dict) -> Dict:
+    """Return the message as sent by /chat/history."""
+    return {
+        "id": message["id"],
+        "content": message["content"],
+        "annotations": message["annotations"],
+        "role": message["role"],
+        "created_at": message["created_at"],
+    }
+
+
+def compute_history_etag(conversation_id: str, messages: List[Dict], before: Optional[str], limit: int) -> str:
+    """
+    Compute the ETag of a history page.
+
+    The tag changes with the newest item of the page and with any created_at
+    written since, so a page is revalidated without formatting it again.
+    """
+    digest = hashlib.blake2b(digest_size=12)
+    digest.update(f"{conversation_id}|{before}|{limit}".encode("utf-8"))
+    for message in messages:
+        digest.update(f"|{message['id']}:{message['created_at']}".encode("utf-8"))
+    return f'W/"{digest.hexdigest()}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    Return True if the If-None-Match header matches the ETag.
+
+    The header is a list of tags or "*"; tags are compared weakly, ignoring the W/ prefix.
+    """
+    def opaque(tag: str) -> str:
+        return tag[2:] if tag.startswith("W/") else tag
+
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or (tag and opaque(tag) == opaque(etag)):
+            return True
+    return False
@@ -0,0 +1,82 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from dataclasses import dataclass
+from typing import List, Optional
+
+SRC_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@dataclass
+class ImportTime:
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def profile_imports(module: str = "api.main", cwd: str = SRC_DIRECTORY) -> List[ImportTime]:
+    """
+    Import the module in a new interpreter with ``-X importtime`` and return the time of every import.
+
+    :param module: The module to import.
+    :param cwd: The directory the interpreter runs in, which is on its path.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd, capture_output=True, text=True, check=False,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        imports.append(ImportTime(
+            module=name.strip(),
+            self_us=int(self_us),
+            cumulative_us=int(cumulative_us),
+            depth=(len(name) - len(name.lstrip()) - 1) // 2,
+        ))
+    return imports
+
+
+def total_import_time(imports: List[ImportTime], module: str) -> Optional[float]:
+    """Return the time in seconds the module took to import, with its dependencies."""
+    for item in imports:
+        if item.module == module:
+            return item.cumulative_us / 1e6
+    return None
+
+
+def report(imports: List[ImportTime], module: str, top: int = 20) -> List[str]:
+    """Return the total and the slowest direct imports of the module and of its dependencies."""
+    lines = [f"{module}: {total_import_time(imports, module) or 0:.3f}s"]
+    children = [item for item in imports if item.depth == 1]
+    lines.append(f"Slowest imports of {module}, with their dependencies:")
+    for item in sorted(children, key=lambda i: i.cumulative_us, reverse=True)[:top]:
+        lines.append(f"  {item.cumulative_us / 1000:8.1f}ms  {item.module}")
+    lines.append("Slowest modules, without their dependencies:")
+    for item in sorted(imports, key=lambda i: i.self_us, reverse=True)[:top]:
+        lines.append(f"  {item.self_us / 1000:8.1f}ms  {item.module}")
+    return lines
+
+
+if __name__ == "__main__":
+    # python -m api.import_profile [module] [--top N] [--json]
+    parser = argparse.ArgumentParser(description="Report the import time of a module in a new interpreter.")
+    parser.add_argument("module", nargs="?", default="api.main")
+    parser.add_argument("--top", type=int, default=20, help="The number of imports listed.")
+    parser.add_argument("--json", action="store_true", help="Print the total in seconds as JSON.")
+    args = parser.parse_args()
+    imports = profile_imports(args.module)
+    if args.json:
+        print(json.dumps({"module": args.module, "seconds": total_import_time(imports, args.module)}))
+    else:
+        print("\n".join(report(imports, args.module, args.top)))
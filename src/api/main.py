@@ -3,28 +3,50 @@
 
 import contextlib
 import os
-
-from azure.ai.projects.aio import AIProjectClient
-from azure.identity.aio import DefaultAzureCredential
-from azure.ai.projects.telemetry import AIProjectInstrumentor
+import secrets
 
 import fastapi
-from fastapi.staticfiles import StaticFiles
 from fastapi import Request
 from fastapi.responses import JSONResponse
 from dotenv import load_dotenv
 from util import get_env_file_path
 
 from logging_config import configure_logging
+from .admission import AdmissionController
+from .agent_refresher import AgentVersionRefresher
+from .answer_cache import AnswerCache
+from .cancellation import UpstreamCanceller
+from .conversation_cache import ConversationCache
+from .conversation_pool import ConversationPool
+from .created_at_writer import CreatedAtWriter
+from .history_cache import HistoryCache
+from .metrics import PrometheusMetrics, ServerTimingMiddleware, get_metrics_directory
+from .resumable import ResumableStreams, load_stream_store
+from .session import SessionCodec, load_session_secret
+from .static_files import PrecompressedStaticFiles, get_hashed_files, load_vite_manifest, render_index_page
+from .openai_client import create_openai_client
+from .compression import CompressionMiddleware
 
 enable_trace = False
 logger = None
 
 @contextlib.asynccontextmanager
 async def lifespan(app: fastapi.FastAPI):
+    # The SDKs are imported here, not with the module: with preload_app gunicorn.conf.py
+    # has loaded them already, and otherwise their cost is not paid before the app exists.
+    from azure.ai.projects.aio import AIProjectClient
+    from azure.identity.aio import DefaultAzureCredential
+
     agent_version_obj = None
     proj_endpoint = os.environ.get("AZURE_EXISTING_AIPROJECT_ENDPOINT")
     agent_id = os.environ.get("AZURE_EXISTING_AGENT_ID")    
+    prometheus_metrics = None
+    # Opt-in: /metrics is only protected by the Basic auth of the app, if that is configured,
+    # and the metrics are exported to Application Insights through the exporter's MeterProvider.
+    if os.getenv("PROMETHEUS_METRICS_ENABLED", "false").lower() == "true":
+        prometheus_metrics = PrometheusMetrics(
+            get_metrics_directory(), interval=float(os.getenv("PROMETHEUS_METRICS_INTERVAL", "5"))
+        )
     try:
 
         async with (
@@ -45,12 +67,22 @@ async def lifespan(app: fastapi.FastAPI):
                     logger.error("Enable it via the 'Tracing' tab in your AI Foundry project page.")
                     exit()
                 else:
+                    from azure.ai.projects.telemetry import AIProjectInstrumentor
                     from azure.monitor.opentelemetry import configure_azure_monitor
-                    configure_azure_monitor(connection_string=application_insights_connection_string)
+                    # With Prometheus metrics, the MeterProvider is set by PrometheusMetrics.configure.
+                    configure_azure_monitor(
+                        connection_string=application_insights_connection_string,
+                        disable_metrics=prometheus_metrics is not None,
+                    )
                     AIProjectInstrumentor().instrument(True)
                     app.state.application_insights_connection_string = application_insights_connection_string
                     logger.info("Configured Application Insights for tracing.")                        
 
+            if prometheus_metrics:
+                prometheus_metrics.configure(getattr(app.state, "application_insights_connection_string", None))
+                app.state.prometheus_metrics = prometheus_metrics
+                logger.info(f"Prometheus metrics are written to {prometheus_metrics.directory}")
+
             if agent_id:
                 if agent_id.count(":") != 1:
                     message = "AZURE_EXISTING_AGENT_ID must be in the format 'agent_name:agent_version'."
@@ -72,7 +104,94 @@ async def lifespan(app: fastapi.FastAPI):
 
             app.state.ai_project = project_client
             app.state.agent_version_obj = agent_version_obj
-            yield
+            app.state.openai_client = await create_openai_client(project_client)
+            app.state.conversation_cache = ConversationCache(
+                max_size=int(os.getenv("CONVERSATION_CACHE_SIZE", "1024")),
+                ttl=float(os.getenv("CONVERSATION_CACHE_TTL", "300")),
+            )
+            app.state.conversation_pool = ConversationPool(
+                app.state.openai_client,
+                size=int(os.getenv("CONVERSATION_POOL_SIZE", "0")),
+                max_age=float(os.getenv("CONVERSATION_POOL_MAX_AGE", "3600")),
+            )
+            app.state.admission_controller = AdmissionController(
+                max_active=int(os.getenv("CHAT_MAX_ACTIVE_STREAMS", "32")),
+                max_queue=int(os.getenv("CHAT_MAX_QUEUED_STREAMS", "64")),
+                queue_timeout=float(os.getenv("CHAT_QUEUE_TIMEOUT", "10")),
+            )
+            app.state.upstream_canceller = UpstreamCanceller(
+                app.state.openai_client,
+                cancel_responses=os.getenv("CHAT_CANCEL_UPSTREAM_RESPONSES", "false").lower() == "true",
+            )
+            resume_ttl = float(os.getenv("CHAT_RESUME_TTL", "0"))
+            app.state.resumable_streams = ResumableStreams(
+                load_stream_store(
+                    os.getenv("CHAT_RESUME_STORE", "memory"),
+                    max_events=int(os.getenv("CHAT_RESUME_MAX_EVENTS", "1024")),
+                    ttl=resume_ttl,
+                ),
+                grace=float(os.getenv("CHAT_RESUME_GRACE", "10")),
+            ) if resume_ttl > 0 else None
+            app.state.answer_cache = AnswerCache(
+                max_size=int(os.getenv("ANSWER_CACHE_SIZE", "0")),
+                ttl=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+            )
+            app.state.history_cache = HistoryCache(
+                max_size=int(os.getenv("HISTORY_CACHE_SIZE", "256")),
+                ttl=float(os.getenv("HISTORY_CACHE_TTL", "300")),
+            )
+            app.state.created_at_writer = CreatedAtWriter(
+                app.state.openai_client,
+                history_cache=app.state.history_cache,
+                flush_delay=float(os.getenv("CREATED_AT_FLUSH_DELAY", "0.05")),
+            )
+            refresh_interval = float(os.getenv("AGENT_REFRESH_INTERVAL", "0"))
+            app.state.agent_refresher = AgentVersionRefresher(
+                project_client, app.state, interval=refresh_interval,
+            ) if refresh_interval > 0 else None
+            if os.getenv("SESSION_COOKIE_ENABLED", "true").lower() == "true":
+                session_secret = load_session_secret()
+                if not session_secret:
+                    # gunicorn.conf.py shares a secret between the workers; this one only holds for the process.
+                    logger.warning("SESSION_SECRET is not set, session cookies are signed with a process-local secret.")
+                    session_secret = secrets.token_bytes(32)
+                app.state.session_codec = SessionCodec(
+                    session_secret, max_age=float(os.getenv("SESSION_MAX_AGE", "3600"))
+                )
+            else:
+                app.state.session_codec = None
+            app.state.created_at_writer.start()
+            app.state.conversation_pool.start()
+            if app.state.agent_refresher:
+                app.state.agent_refresher.start()
+            if prometheus_metrics:
+                prometheus_metrics.start()
+            if app.state.resumable_streams:
+                app.state.resumable_streams.start()
+            try:
+                yield
+            finally:
+                if app.state.agent_refresher:
+                    await app.state.agent_refresher.close()
+                if app.state.resumable_streams:
+                    await app.state.resumable_streams.close()
+                await app.state.conversation_pool.close()
+                await app.state.upstream_canceller.close()
+                await app.state.created_at_writer.close()
+                await app.state.openai_client.close()
+                if prometheus_metrics:
+                    await prometheus_metrics.close()
+            logger.info(f"Conversation cache stats: {app.state.conversation_cache.stats()}")
+            logger.info(f"Conversation pool stats: {app.state.conversation_pool.stats()}")
+            logger.info(f"Admission stats: {app.state.admission_controller.stats()}")
+            logger.info(f"Cancellation stats: {app.state.upstream_canceller.stats()}")
+            if app.state.resumable_streams:
+                logger.info(f"Resumable stream stats: {app.state.resumable_streams.stats()}")
+            logger.info(f"Answer cache stats: {app.state.answer_cache.stats()}")
+            if app.state.session_codec:
+                logger.info(f"Session cookie stats: {app.state.session_codec.stats()}")
+            if app.state.agent_refresher:
+                logger.info(f"Agent refresh stats: {app.state.agent_refresher.stats()}")
 
     except Exception as e:
         logger.error(f"Error during startup: {e}", exc_info=True)
@@ -117,15 +236,28 @@ def create_app():
 
     directory = os.path.join(os.path.dirname(__file__), "static")
     app = fastapi.FastAPI(lifespan=lifespan)
-    app.mount("/static", StaticFiles(directory=directory), name="static")
-    
-    # Mount React static files
-    # Uncomment the following lines if you have a React frontend
-    # react_directory = os.path.join(os.path.dirname(__file__), "static/react")
-    # app.mount("/static/react", StaticFiles(directory=react_directory), name="react")
+    # Compress JSON and HTML responses; the SSE stream of /chat is never compressed.
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=int(os.getenv("COMPRESSION_MINIMUM_SIZE", "500")),
+        gzip_level=int(os.getenv("COMPRESSION_GZIP_LEVEL", "6")),
+        brotli_quality=int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4")),
+    )
+    # Server-Timing header with the stages of the request, and the requests in flight.
+    app.add_middleware(ServerTimingMiddleware)
+    # The React build is under static/react; its files with hashed names are cached for good.
+    manifest = load_vite_manifest(os.path.join(directory, "react"))
+    app.mount("/static", PrecompressedStaticFiles(
+        directory,
+        immutable=get_hashed_files(manifest, prefix="react/"),
+        cache_size=int(os.getenv("STATIC_CACHE_SIZE", "256")),
+        cache_ttl=float(os.getenv("STATIC_CACHE_TTL", "300")),
+        max_file_size=int(os.getenv("STATIC_CACHE_MAX_FILE_SIZE", str(1024 * 1024))),
+    ), name="static")
 
     from . import routes  # Import routes
     app.include_router(routes.router)
+    app.state.index_page = render_index_page(routes.templates, manifest, base_url="/static/react/")
 
     # Global exception handler for any unhandled exceptions
     @app.exception_handler(Exception)
@@ -0,0 +1,360 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+import asyncio
+import contextvars
+import copy
+import glob
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from opentelemetry import metrics
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger("azureaiapp")
+meter = metrics.get_meter(__name__)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Bucket boundaries of the histograms in seconds; the SDK default is made for milliseconds.
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+stage_duration = meter.create_histogram(
+    "chat.stage.duration", unit="s",
+    description="Duration of the stages of the chat requests: conversation, history, responses_create, "
+                "first_delta, stream and created_at_write")
+tokens_counter = meter.create_counter(
+    "chat.tokens", unit="{token}", description="Tokens of the completed responses by type (input, output)")
+stream_bytes_counter = meter.create_counter(
+    "chat.stream.bytes", unit="By", description="Bytes of the SSE frames of the chat streams")
+streams_in_flight = meter.create_up_down_counter(
+    "chat.streams.in_flight", description="Chat streams being produced")
+requests_in_flight = meter.create_up_down_counter(
+    "http.server.active_requests", description="HTTP requests being handled")
+
+# The stage timings of the current request, sent in its Server-Timing header.
+_server_timing: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar(
+    "server_timing", default=None)
+
+
+def record_stage(stage: str, seconds: float, **attributes: str) -> None:
+    """Record the duration of a stage in the histogram and in the Server-Timing header of the request."""
+    stage_duration.record(seconds, {"stage": stage, **attributes})
+    timings = _server_timing.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+
+class ServerTimingMiddleware:
+    """
+    Add a Server-Timing header with the stages recorded before the response
+    started, and count the requests in flight.
+
+    Streamed responses start before their stream stage ends, so their header
+    only has the stages which precede the stream, like the conversation lookup.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        timings: List[Tuple[str, float]] = []
+        token = _server_timing.set(timings)
+
+        async def send_with_timing(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings]
+                entries.append(f"app;dur={(time.perf_counter() - started) * 1000:.1f}")
+                MutableHeaders(scope=message).append("Server-Timing", ", ".join(entries))
+            await send(message)
+
+        requests_in_flight.add(1)
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            requests_in_flight.add(-1)
+            _server_timing.reset(token)
+
+
+def get_metrics_directory() -> str:
+    """Return the directory in which the workers write their metrics, from PROMETHEUS_MULTIPROC_DIR."""
+    return os.getenv("PROMETHEUS_MULTIPROC_DIR") or os.path.join(tempfile.gettempdir(), "azureaiapp-metrics")
+
+
+def clear_metrics_directory(directory: str) -> None:
+    """Remove the metrics of a previous run; called by the gunicorn master before it forks the workers."""
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, "*.json")):
+        os.remove(path)
+
+
+def is_process_alive(pid: int) -> bool:
+    """Return True if a process with the pid runs on this machine."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _write_json(path: str, data: Dict) -> None:
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "w") as f:
+        json.dump(data, f)
+    os.replace(temporary, path)
+
+
+def _read_json(path: str) -> Optional[Dict]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _point_key(point: Dict) -> str:
+    return json.dumps(point["attributes"], sort_keys=True)
+
+
+def merge_snapshots(snapshots: List[Dict], live: bool = True) -> Dict[str, Dict]:
+    """
+    Merge the metrics of several workers.
+
+    Counters and histograms are summed. Gauges and up-down counters are
+    summed too, e.g. the streams in flight of all workers, but only over the
+    live workers; ``live=False`` drops them, as for the exited workers.
+    """
+    merged: Dict[str, Dict] = {}
+    for snapshot in snapshots:
+        for name, metric in snapshot["metrics"].items():
+            if not live and metric["kind"] in ("gauge", "updowncounter"):
+                continue
+            target = merged.setdefault(name, {**metric, "points": {}})
+            for point in metric["points"]:
+                key = _point_key(point)
+                existing = target["points"].get(key)
+                if existing is None:
+                    target["points"][key] = copy.deepcopy(point)
+                elif metric["kind"] == "histogram" and existing["bounds"] == point["bounds"]:
+                    existing["counts"] = [a + b for a, b in zip(existing["counts"], point["counts"])]
+                    existing["sum"] += point["sum"]
+                    existing["count"] += point["count"]
+                elif metric["kind"] != "histogram":
+                    existing["value"] += point["value"]
+    for metric in merged.values():
+        metric["points"] = list(metric["points"].values())
+    return merged
+
+
+def mark_process_dead(pid: int, directory: Optional[str] = None) -> None:
+    """
+    Fold the metrics of an exited worker into the totals of the exited workers.
+
+    Called from the child_exit hook of gunicorn, in the master process, so the
+    counters of recycled workers are kept without a file per worker. The totals
+    carry the pid of the master, so they are ignored once it exited.
+    """
+    directory = directory or get_metrics_directory()
+    path = os.path.join(directory, f"worker-{pid}.json")
+    snapshot = _read_json(path)
+    if snapshot is None:
+        return
+    exited_path = os.path.join(directory, "exited.json")
+    exited = _read_json(exited_path) or {"metrics": {}}
+    _write_json(exited_path, {"pid": os.getpid(), "metrics": merge_snapshots([exited, snapshot], live=False)})
+    os.remove(path)
+
+
+_UNIT_SUFFIXES = {"s": "seconds", "ms": "milliseconds", "By": "bytes"}
+
+
+def _metric_name(name: str, unit: str) -> str:
+    name = re.sub(r"[^a-zA-Z0-9_:]", "_", name)
+    suffix = _UNIT_SUFFIXES.get(unit)
+    if suffix and not name.endswith(f"_{suffix}"):
+        name = f"{name}_{suffix}"
+    return name
+
+
+def _labels(attributes: Dict[str, Any], extra: Optional[Tuple[str, str]] = None) -> str:
+    items = [(re.sub(r"[^a-zA-Z0-9_]", "_", key), str(value)) for key, value in sorted(attributes.items())]
+    if extra:
+        items.append(extra)
+    if not items:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in items)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(items, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus(merged: Dict[str, Dict]) -> str:
+    """Render merged metrics in the Prometheus text exposition format."""
+    lines: List[str] = []
+    for otel_name, metric in sorted(merged.items()):
+        name = _metric_name(otel_name, metric["unit"])
+        kind = metric["kind"]
+        prometheus_type = {"counter": "counter", "histogram": "histogram"}.get(kind, "gauge")
+        lines.append(f"# HELP {name} {metric['description']}")
+        lines.append(f"# TYPE {name} {prometheus_type}")
+        for point in metric["points"]:
+            attributes = point["attributes"]
+            if kind == "histogram":
+                cumulative = 0
+                for bound, count in zip(point["bounds"] + ["+Inf"], point["counts"]):
+                    cumulative += count
+                    le = "+Inf" if bound == "+Inf" else _format_value(float(bound))
+                    lines.append(f"{name}_bucket{_labels(attributes, ('le', le))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(attributes)} {_format_value(point['sum'])}")
+                lines.append(f"{name}_count{_labels(attributes)} {point['count']}")
+            elif kind == "counter":
+                lines.append(f"{name}_total{_labels(attributes)} {_format_value(point['value'])}")
+            else:
+                lines.append(f"{name}{_labels(attributes)} {_format_value(point['value'])}")
+    return "\n".join(lines) + "\n"
+
+
+class PrometheusMetrics:
+    """
+    Prometheus exposition of the OpenTelemetry metrics of all gunicorn workers.
+
+    Every worker collects its metrics with an in-memory reader and writes them
+    to ``<directory>/worker-<pid>.json`` every ``interval`` seconds and on
+    shutdown. /metrics merges the files of all workers, so the worker which
+    serves the scrape does not matter; the other workers' values are up to
+    ``interval`` seconds old. The gunicorn hooks clear the directory on start
+    and fold the files of exited workers into ``exited.json``, see
+    mark_process_dead. Files written by processes which are not running any
+    more are ignored, e.g. those left by a previous run under uvicorn or a
+    crashed master.
+
+    :param directory: The directory shared by the workers.
+    :param interval: The time in seconds between two writes of the worker's metrics.
+    """
+
+    def __init__(self, directory: str, interval: float = 5.0) -> None:
+        """Constructor."""
+        from opentelemetry.sdk.metrics.export import InMemoryMetricReader
+
+        self.directory = directory
+        self.interval = interval
+        self.reader = InMemoryMetricReader()
+        self._path = os.path.join(directory, f"worker-{os.getpid()}.json")
+        self._task: Optional[asyncio.Task] = None
+        os.makedirs(directory, exist_ok=True)
+
+    def configure(self, application_insights_connection_string: Optional[str] = None) -> None:
+        """
+        Set the global MeterProvider, with the reader of this exporter.
+
+        With a connection string the metrics are exported to Application
+        Insights as well; configure_azure_monitor must then be called with
+        disable_metrics=True, as a MeterProvider can only be set once.
+        """
+        from opentelemetry.sdk.metrics import Histogram, MeterProvider
+        from opentelemetry.sdk.metrics.view import ExplicitBucketHistogramAggregation, View
+
+        readers = [self.reader]
+        if application_insights_connection_string:
+            from azure.monitor.opentelemetry.exporter import AzureMonitorMetricExporter
+            from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
+            readers.append(PeriodicExportingMetricReader(
+                AzureMonitorMetricExporter(connection_string=application_insights_connection_string)))
+        metrics.set_meter_provider(MeterProvider(
+            metric_readers=readers,
+            views=[View(
+                instrument_type=Histogram, instrument_unit="s",
+                aggregation=ExplicitBucketHistogramAggregation(SECONDS_BUCKETS))],
+        ))
+
+    def start(self) -> None:
+        """Start writing the worker's metrics periodically."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Stop the periodic writes and write the final metrics of the worker."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.write()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.write()
+            except Exception as e:
+                logger.warning(f"Error writing the worker metrics: {e}")
+
+    def snapshot(self) -> Dict:
+        """Return the metrics of the worker in the format of the metric files."""
+        from opentelemetry.sdk.metrics.export import Gauge, Histogram, Sum
+
+        result: Dict[str, Dict] = {}
+        data = self.reader.get_metrics_data()
+        for resource_metrics in (data.resource_metrics if data else []):
+            for scope_metrics in resource_metrics.scope_metrics:
+                for metric in scope_metrics.metrics:
+                    if isinstance(metric.data, Histogram):
+                        kind = "histogram"
+                        points = [{
+                            "attributes": dict(point.attributes or {}), "bounds": list(point.explicit_bounds),
+                            "counts": list(point.bucket_counts), "sum": point.sum, "count": point.count
+                        } for point in metric.data.data_points]
+                    else:
+                        if isinstance(metric.data, Sum):
+                            kind = "counter" if metric.data.is_monotonic else "updowncounter"
+                        elif isinstance(metric.data, Gauge):
+                            kind = "gauge"
+                        else:
+                            continue
+                        points = [
+                            {"attributes": dict(point.attributes or {}), "value": point.value}
+                            for point in metric.data.data_points
+                        ]
+                    result[metric.name] = {
+                        "kind": kind, "unit": metric.unit or "", "description": metric.description or "",
+                        "points": points
+                    }
+        return {"pid": os.getpid(), "metrics": result}
+
+    def write(self) -> None:
+        """Write the metrics of the worker to its file."""
+        _write_json(self._path, self.snapshot())
+
+    def iter_snapshots(self) -> Iterator[Tuple[str, Dict]]:
+        """Yield the file names and the contents of the metric files of the running processes."""
+        for path in glob.glob(os.path.join(self.directory, "*.json")):
+            snapshot = _read_json(path)
+            if snapshot is not None and is_process_alive(snapshot.get("pid", os.getpid())):
+                yield os.path.basename(path), snapshot
+
+    def render(self) -> str:
+        """Return the metrics of all workers in the Prometheus text format, with this worker's up to date."""
+        self.write()
+        live, exited = [], []
+        for name, snapshot in self.iter_snapshots():
+            (exited if name == "exited.json" else live).append(snapshot)
+        merged = merge_snapshots(live)
+        if exited:
+            merged = merge_snapshots([{"metrics": merged}, *exited])
+        return render_prometheus(merged)
@@ -0,0 +1,51 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+import logging
+import os
+from typing import TYPE_CHECKING
+
+import httpx
+
+if TYPE_CHECKING:
+    from azure.ai.projects.aio import AIProjectClient
+    from openai import AsyncOpenAI
+
+logger = logging.getLogger("azureaiapp")
+
+
+async def create_openai_client(project_client: "AIProjectClient") -> "AsyncOpenAI":
+    """
+    Create the long-lived, connection-pooled OpenAI client of the worker.
+
+    The pool is configured with the environment variables OPENAI_MAX_CONNECTIONS,
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS, OPENAI_KEEPALIVE_EXPIRY and OPENAI_HTTP2.
+    The client must be closed on shutdown.
+
+    :param project_client: The project client, providing the endpoint and the credentials.
+    :return: The AsyncOpenAI client to be shared by all requests.
+    """
+    from openai import DefaultAsyncHttpxClient
+    limits = httpx.Limits(
+        max_connections=int(os.getenv("OPENAI_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20")),
+        keepalive_expiry=float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "30")),
+    )
+    http2 = os.getenv("OPENAI_HTTP2", "").lower() == "true"
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ModuleNotFoundError:
+            logger.error("HTTP/2 requested, but the h2 package is not installed; using HTTP/1.1.")
+            logger.error("Please make sure httpx[http2] is installed.")
+            http2 = False
+
+    # get_openai_client sets up the endpoint and the token provider, but does not
+    # accept an http_client, so the pooled transport is swapped in on a copy.
+    base_client = project_client.get_openai_client()
+    openai_client = base_client.with_options(
+        http_client=DefaultAsyncHttpxClient(limits=limits, http2=http2)
+    )
+    await base_client.close()
+    logger.info(f"Created pooled OpenAI client (limits: {limits}, http2: {http2})")
+    return openai_client
@@ -0,0 +1,313 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+import abc
+import asyncio
+import collections
+import contextlib
+import importlib
+import itertools
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import AsyncGenerator, Callable, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("azureaiapp")
+
+# An SSE frame with its sequence number within the stream.
+Frame = Tuple[int, bytes]
+
+
+def parse_last_event_id(value: Optional[str]) -> Optional[Tuple[str, int]]:
+    """Parse a Last-Event-ID header into the stream ID and the sequence number."""
+    if not value:
+        return None
+    stream_id, _, seq = value.strip().rpartition(":")
+    if not stream_id or not seq.isdigit():
+        return None
+    return stream_id, int(seq)
+
+
+def split_frames(chunk: bytes) -> List[Frame]:
+    """Split a chunk of SSE frames with ``id:`` lines into numbered frames."""
+    frames = []
+    for frame in chunk.split(b"\n\n"):
+        if not frame.startswith(b"id: "):
+            continue
+        event_id = frame[4:frame.index(b"\n")].decode("ascii")
+        frames.append((int(event_id.rpartition(":")[2]), frame + b"\n\n"))
+    return frames
+
+
+@dataclass
+class StoredStream:
+    """The frames of a stream after the requested sequence number."""
+    frames: List[Frame]
+    finished: bool
+
+
+class StreamStore(abc.ABC):
+    """
+    Store of the recent frames of the SSE streams, from which clients resume.
+
+    The in-memory implementation only serves the worker which runs the stream:
+    with several workers, a client which reconnects to another one gets a 204
+    and loses the rest of the answer. An implementation backed by a shared
+    store (e.g. Redis) lets a client resume on any worker. It is configured
+    with ``CHAT_RESUME_STORE``, see load_stream_store.
+    """
+
+    @abc.abstractmethod
+    async def append(self, stream_id: str, frames: List[Frame]) -> None:
+        """Add frames to the stream, creating it if needed."""
+
+    @abc.abstractmethod
+    async def finish(self, stream_id: str) -> None:
+        """Mark the stream as finished; it expires after the retention TTL."""
+
+    @abc.abstractmethod
+    async def read(self, stream_id: str, after: int) -> Optional[StoredStream]:
+        """
+        Return the frames after the sequence number ``after``.
+
+        :return: None if the stream is unknown, expired, or the frames after
+            ``after`` were already dropped from the buffer.
+        """
+
+    @abc.abstractmethod
+    async def touch(self, stream_id: str) -> None:
+        """Record that a client is reading the stream."""
+
+    @abc.abstractmethod
+    async def last_read(self, stream_id: str) -> Optional[float]:
+        """Return the time.time() of the last touch of the stream."""
+
+    async def wait(self, stream_id: str, after: int, timeout: float) -> None:
+        """Wait up to ``timeout`` seconds for frames after ``after``; polls by default."""
+        await asyncio.sleep(min(timeout, 0.1))
+
+    async def close(self) -> None:
+        """Release the resources of the store."""
+
+
+@dataclass
+class _MemoryStream:
+    frames: Deque[Frame]
+    finished: bool = False
+    updated_at: float = field(default_factory=time.monotonic)
+    last_read: float = field(default_factory=time.time)
+    changed: asyncio.Event = field(default_factory=asyncio.Event)
+
+
+class MemoryStreamStore(StreamStore):
+    """
+    Per-worker StreamStore, keeping a ring buffer of frames for each stream.
+
+    :param max_events: The maximal number of frames kept per stream.
+    :param ttl: The time in seconds a stream is kept after its last frame.
+    """
+
+    def __init__(self, max_events: int = 1024, ttl: float = 30.0) -> None:
+        """Constructor."""
+        self.max_events = max_events
+        self.ttl = ttl
+        self._streams: Dict[str, _MemoryStream] = {}
+
+    def _get(self, stream_id: str) -> Optional[_MemoryStream]:
+        stream = self._streams.get(stream_id)
+        if stream is not None and stream.finished and time.monotonic() - stream.updated_at > self.ttl:
+            del self._streams[stream_id]
+            return None
+        return stream
+
+    def _purge(self) -> None:
+        now = time.monotonic()
+        expired = [
+            stream_id for stream_id, stream in self._streams.items()
+            if stream.finished and now - stream.updated_at > self.ttl
+        ]
+        for stream_id in expired:
+            del self._streams[stream_id]
+
+    def _notify(self, stream: _MemoryStream) -> None:
+        changed, stream.changed = stream.changed, asyncio.Event()
+        stream.updated_at = time.monotonic()
+        changed.set()
+
+    async def append(self, stream_id: str, frames: List[Frame]) -> None:
+        stream = self._streams.get(stream_id)
+        if stream is None:
+            self._purge()
+            stream = self._streams[stream_id] = _MemoryStream(collections.deque(maxlen=self.max_events))
+        stream.frames.extend(frames)
+        self._notify(stream)
+
+    async def finish(self, stream_id: str) -> None:
+        stream = self._streams.get(stream_id)
+        if stream is not None:
+            stream.finished = True
+            self._notify(stream)
+
+    async def read(self, stream_id: str, after: int) -> Optional[StoredStream]:
+        stream = self._get(stream_id)
+        if stream is None:
+            return None
+        if not stream.frames:
+            return StoredStream([], stream.finished)
+        first_seq = stream.frames[0][0]
+        if after < first_seq - 1:
+            return None
+        start = after - first_seq + 1
+        return StoredStream(list(itertools.islice(stream.frames, start, None)), stream.finished)
+
+    async def touch(self, stream_id: str) -> None:
+        stream = self._streams.get(stream_id)
+        if stream is not None:
+            stream.last_read = time.time()
+
+    async def last_read(self, stream_id: str) -> Optional[float]:
+        stream = self._streams.get(stream_id)
+        return stream.last_read if stream is not None else None
+
+    async def wait(self, stream_id: str, after: int, timeout: float) -> None:
+        stream = self._streams.get(stream_id)
+        if stream is None or stream.finished or (stream.frames and stream.frames[-1][0] > after):
+            return
+        with contextlib.suppress(TimeoutError):
+            async with asyncio.timeout(timeout):
+                await stream.changed.wait()
+
+
+def load_stream_store(spec: str, max_events: int, ttl: float) -> StreamStore:
+    """
+    Create the StreamStore named by ``spec``.
+
+    :param spec: "memory", or "package.module:factory" of a custom store, which
+        is called with the ``max_events`` and ``ttl`` keyword arguments.
+    """
+    if spec == "memory":
+        return MemoryStreamStore(max_events=max_events, ttl=ttl)
+    module_name, _, attribute = spec.partition(":")
+    factory = getattr(importlib.import_module(module_name), attribute)
+    return factory(max_events=max_events, ttl=ttl)
+
+
+class ResumableStreams:
+    """
+    Runs SSE streams detached from the requests which started them.
+
+    The frames of a stream are produced by a background task into the store,
+    and every request, the first one and those resuming with Last-Event-ID,
+    tails the store. A stream which nobody read for ``grace`` seconds is
+    cancelled, so a client which does not come back still stops the upstream run.
+
+    :param store: The store of the frames.
+    :param grace: The time in seconds a stream runs without a reading client.
+    :param read_timeout: The time in seconds a tailing request waits for frames before touching the stream again.
+    """
+
+    def __init__(self, store: StreamStore, grace: float = 10.0, read_timeout: float = 1.0) -> None:
+        """Constructor."""
+        self.store = store
+        self.grace = grace
+        self.read_timeout = read_timeout
+        self._producers: Dict[str, asyncio.Task] = {}
+        self._watchdog: Optional[asyncio.Task] = None
+        self.started = 0
+        self.resumed = 0
+        self.abandoned = 0
+
+    def start(self) -> None:
+        """Start the task cancelling the streams without readers."""
+        if self._watchdog is None:
+            self._watchdog = asyncio.create_task(self._watch())
+
+    async def close(self) -> None:
+        """Cancel the running streams and close the store."""
+        tasks = list(self._producers.values())
+        if self._watchdog is not None:
+            tasks.append(self._watchdog)
+            self._watchdog = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.store.close()
+
+    async def begin(self, stream_id: str, body: AsyncGenerator[bytes, None], on_finish: Callable[[], None]) -> None:
+        """
+        Start producing the frames of ``body`` into the store.
+
+        :param stream_id: The ID of the stream, used in the event IDs of its frames.
+        :param body: The generator of the SSE frames, with ``id:`` lines.
+        :param on_finish: Called once the body is exhausted or cancelled.
+        """
+        # Create the stream, so it can be tailed before its first frame.
+        await self.store.append(stream_id, [])
+        await self.store.touch(stream_id)
+        self._producers[stream_id] = asyncio.create_task(self._produce(stream_id, body, on_finish))
+        self.started += 1
+
+    async def _produce(self, stream_id: str, body: AsyncGenerator[bytes, None], on_finish: Callable[[], None]) -> None:
+        try:
+            async with contextlib.aclosing(body):
+                async for chunk in body:
+                    await self.store.append(stream_id, split_frames(chunk))
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.exception(f"Error producing stream {stream_id}: {e}")
+        finally:
+            del self._producers[stream_id]
+            try:
+                await self.store.finish(stream_id)
+            except Exception as e:
+                logger.warning(f"Error finishing stream {stream_id}: {e}")
+            on_finish()
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(1.0)
+            now = time.time()
+            for stream_id, task in list(self._producers.items()):
+                try:
+                    last_read = await self.store.last_read(stream_id)
+                except Exception as e:
+                    logger.warning(f"Error reading the state of stream {stream_id}: {e}")
+                    continue
+                if last_read is not None and now - last_read > self.grace:
+                    logger.info(f"No client read stream {stream_id} for {self.grace}s, cancelling it")
+                    self.abandoned += 1
+                    task.cancel()
+
+    async def exists(self, stream_id: str, after: int) -> bool:
+        """Return True if the stream can be resumed after the sequence number ``after``."""
+        return await self.store.read(stream_id, after) is not None
+
+    async def tail(self, stream_id: str, after: int = 0) -> AsyncGenerator[bytes, None]:
+        """Yield the frames of the stream after the sequence number ``after`` until it is finished."""
+        if after:
+            self.resumed += 1
+        touched_at = 0.0
+        while True:
+            if time.monotonic() - touched_at >= self.read_timeout:
+                await self.store.touch(stream_id)
+                touched_at = time.monotonic()
+            stored = await self.store.read(stream_id, after)
+            if stored is None:
+                return
+            if stored.frames:
+                after = stored.frames[-1][0]
+                yield b"".join(frame for _, frame in stored.frames)
+            if stored.finished:
+                return
+            if not stored.frames:
+                await self.store.wait(stream_id, after, self.read_timeout)
+
+    def stats(self) -> Dict[str, float]:
+        """Return the counters of the streams."""
+        return {
+            "running": len(self._producers),
+            "started": self.started,
+            "resumed": self.resumed,
+            "abandoned": self.abandoned,
+        }
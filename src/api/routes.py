@@ -2,34 +2,55 @@
 # Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
 
 import asyncio
+import base64
+import contextlib
 import json
 import os
+import time
+import uuid
 from datetime import datetime, timezone
-from typing import AsyncGenerator, Mapping, Optional, Dict
+from types import SimpleNamespace
+from typing import AsyncGenerator, Mapping, Optional, Dict, List, Tuple
 
 
 import fastapi
-from fastapi import Request, Depends, HTTPException
+from fastapi import Request, Depends, HTTPException, WebSocket, WebSocketDisconnect
+from starlette.requests import HTTPConnection
 from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import JSONResponse
+from starlette.background import BackgroundTask
 
 import logging
 from opentelemetry.trace.propagation.tracecontext import TraceContextTextMapPropagator
 from azure.ai.projects.models import AgentVersionObject, AgentReference
 from openai.types.conversations.message import Message
-from openai.types.responses import Response, ResponseOutputText, ResponseOutputMessage, ResponseInputText, ResponseInputMessageItem
+from openai.types.responses import ResponseOutputMessage
 from openai.types.conversations import Conversation
-from openai.types.responses.response_output_text import AnnotationFileCitation
 
 from azure.ai.projects.aio import AIProjectClient
 
-from openai.types.responses import ResponseTextDeltaEvent, ResponseCompletedEvent, ResponseTextDoneEvent, ResponseCreatedEvent, ResponseOutputItemDoneEvent
+from openai import AsyncOpenAI, AsyncStream, NotFoundError
 
-from openai import AsyncOpenAI
+from .admission import AdmissionController, AdmissionRejected, ReleasingStreamingResponse
+from .agent_refresher import same_agent_name
+from .answer_cache import ANSWER_CACHE_HEADER, AnswerCache, CachedAnswer
+from .batch import BATCH_ADMISSION_ATTEMPTS, BATCH_MEDIA_TYPE, BatchItem, group_by_conversation, parse_batch_items, run_bounded
+from .cancellation import UpstreamCanceller
+from .conversation_cache import ConversationCache
+from .conversation_pool import ConversationPool
+from .created_at_writer import CreatedAtWriter, get_created_at_label, get_input_message_id
+from .history_cache import CachedHistory, HistoryCache, compute_history_etag, etag_matches, render_history_message
+from .metrics import (
+    PROMETHEUS_CONTENT_TYPE, PrometheusMetrics, record_stage, stream_bytes_counter, streams_in_flight, tokens_counter
+)
+from .resumable import ResumableStreams, parse_last_event_id
+from .session import SESSION_COOKIE, Session, SessionCodec
+from .sse import SSEEncoder, dumps_json, iterate_with_deadline
 
 # Create a logger for this module
 logger = logging.getLogger("azureaiapp")
+# Logger for per-event messages of the streams; rate limited by configure_logging
+stream_logger = logging.getLogger("azureaiapp.stream")
 
 # Set the log level for the azure HTTP logging policy to WARNING (or ERROR)
 logging.getLogger("azure.core.pipeline.policies.http_logging_policy").setLevel(logging.WARNING)
@@ -45,9 +66,9 @@ templates = Jinja2Templates(directory=directory)
 # Create a new FastAPI router
 router = fastapi.APIRouter()
 
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import status
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
-from typing import Optional
+from fastapi.security.utils import get_authorization_scheme_param
 import secrets
 
 security = HTTPBasic()
@@ -56,15 +77,25 @@ username = os.getenv("WEB_APP_USERNAME")
 password = os.getenv("WEB_APP_PASSWORD")
 basic_auth = username and password
 
+# When the agent version is refreshed in place, the conversations of its earlier versions are kept,
+# unless AGENT_REFRESH_RESET_CONVERSATIONS asks for a new conversation as on a restart with a new version.
+keep_conversations_across_versions = (
+    float(os.getenv("AGENT_REFRESH_INTERVAL", "0")) > 0
+    and os.getenv("AGENT_REFRESH_RESET_CONVERSATIONS", "false").lower() != "true"
+)
+
+def credentials_valid(credentials: HTTPBasicCredentials) -> bool:
+    correct_username = secrets.compare_digest(credentials.username, username)
+    correct_password = secrets.compare_digest(credentials.password, password)
+    return correct_username and correct_password
+
 def authenticate(credentials: Optional[HTTPBasicCredentials] = Depends(security)) -> None:
 
     if not basic_auth:
         logger.info("Skipping authentication: WEB_APP_USERNAME or WEB_APP_PASSWORD not set.")
         return
     
-    correct_username = secrets.compare_digest(credentials.username, username)
-    correct_password = secrets.compare_digest(credentials.password, password)
-    if not (correct_username and correct_password):
+    if not credentials_valid(credentials):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials",
@@ -74,18 +105,18 @@ def authenticate(credentials: Optional[HTTPBasicCredentials] = Depends(security)
 
 auth_dependency = Depends(authenticate) if basic_auth else None
 
-def cleanup_created_at_metadata(metadata: Mapping[str, str]) -> None:
-    """Remove oldest created_at timestamp entries to keep metadata under 16 items limit."""
-    if not metadata:
-        return
-
-    # metadata go to be up to 16 items.  If there is more than that, remove the one ended with _created_at key with smallest value
-    while len(metadata) > 16:
-        created_at_keys = [k for k in metadata if k.endswith("_created_at")]
-        if not created_at_keys:
-            break  # No more _created_at keys to remove
-        min_key = min(created_at_keys, key=metadata.get)
-        del metadata[min_key]
+def authenticate_websocket(websocket: WebSocket) -> bool:
+    """Check the Basic credentials of the WebSocket handshake."""
+    if not basic_auth:
+        return True
+    scheme, param = get_authorization_scheme_param(websocket.headers.get("Authorization"))
+    if scheme.lower() != "basic":
+        return False
+    try:
+        user, separator, secret = base64.b64decode(param).decode("utf-8").partition(":")
+    except (ValueError, UnicodeDecodeError):
+        return False
+    return bool(separator) and credentials_valid(HTTPBasicCredentials(username=user, password=secret))
 
 def get_project_client(request: Request) -> AIProjectClient:
     return request.app.state.ai_project
@@ -93,29 +124,82 @@ def get_project_client(request: Request) -> AIProjectClient:
 def get_agent_version_obj(request: Request) -> AgentVersionObject:
     return request.app.state.agent_version_obj
 
-def get_openai_client(request: Request) -> AsyncOpenAI:
-    return get_project_client(request).get_openai_client()
+def get_conversation_cache(request: Request) -> Optional[ConversationCache]:
+    return getattr(request.app.state, "conversation_cache", None)
+
+def get_conversation_pool(request: Request) -> Optional[ConversationPool]:
+    return getattr(request.app.state, "conversation_pool", None)
+
+def get_answer_cache(request: Request) -> Optional[AnswerCache]:
+    return getattr(request.app.state, "answer_cache", None)
 
-def get_created_at_label(message_id: str) -> str:
-    return f"{message_id}_created_at"
+def get_history_cache(request: Request) -> Optional[HistoryCache]:
+    return getattr(request.app.state, "history_cache", None)
 
-def serialize_sse_event(data: Dict) -> str:
-    return f"data: {json.dumps(data)}\n\n"
+def get_admission_controller(request: Request) -> AdmissionController:
+    return request.app.state.admission_controller
+
+def get_created_at_writer(request: Request) -> CreatedAtWriter:
+    return request.app.state.created_at_writer
+
+def get_upstream_canceller(request: Request) -> UpstreamCanceller:
+    return request.app.state.upstream_canceller
+
+def get_resumable_streams(request: Request) -> Optional[ResumableStreams]:
+    return getattr(request.app.state, "resumable_streams", None)
+
+def get_prometheus_metrics(request: Request) -> Optional[PrometheusMetrics]:
+    return getattr(request.app.state, "prometheus_metrics", None)
+
+def get_session_codec(request: Request) -> Optional[SessionCodec]:
+    return getattr(request.app.state, "session_codec", None)
+
+def get_openai_client(request: Request) -> AsyncOpenAI:
+    return request.app.state.openai_client
+
+def get_sse_encoder(stream_id: Optional[str] = None) -> SSEEncoder:
+    return SSEEncoder(
+        window=float(os.getenv("SSE_COALESCE_WINDOW_MS", "30")) / 1000,
+        max_bytes=int(os.getenv("SSE_COALESCE_MAX_BYTES", "1024")),
+        stream_id=stream_id,
+    )
 
 async def get_or_create_conversation(
     openai_client: AsyncOpenAI,
     conversation_id: Optional[str],
     agent_id: Optional[str],
-    current_agent_id: str
+    current_agent_id: str,
+    conversation_cache: Optional[ConversationCache] = None,
+    conversation_pool: Optional[ConversationPool] = None,
+    session: Optional[Session] = None
 ) -> Conversation:
     """
     Get an existing conversation or create a new one.
+    A verified session of the same conversation and agent and then the worker's
+    conversation cache are consulted before the remote retrieve, and a new
+    conversation is taken from the worker's pool if it has one ready.
+    The cache only knows that the conversation exists, its metadata is None.
     Returns the conversation_id.
     """
     conversation: Optional[Conversation] = None
+    started = time.perf_counter()
+    source = "retrieve"
     
     # Attempt to get an existing conversation if we have matching agent and conversation IDs
-    if conversation_id and agent_id == current_agent_id:
+    if conversation_id and (agent_id == current_agent_id or (
+            keep_conversations_across_versions and same_agent_name(agent_id, current_agent_id))):
+        if session and session.conversation_id == conversation_id and session.agent_id == agent_id:
+            # The metadata is only as recent as the cookie, which carries this client's turns.
+            logger.info(f"Using conversation with ID {conversation_id} from the session")
+            record_stage("conversation", time.perf_counter() - started, source="session")
+            return session.to_conversation()
+        if conversation_cache:
+            conversation = conversation_cache.get(conversation_id)
+            trace.get_current_span().set_attribute("conversation_cache.hit", conversation is not None)
+            if conversation:
+                logger.info(f"Using cached conversation with ID {conversation_id}")
+                record_stage("conversation", time.perf_counter() - started, source="cache")
+                return conversation
         try:
             logger.info(f"Using existing conversation with ID {conversation_id}")
             conversation = await openai_client.conversations.retrieve(conversation_id=conversation_id)
@@ -123,8 +207,17 @@ async def get_or_create_conversation(
         except Exception as e:
             logger.error(f"Error retrieving conversation: {e}")
 
+    # Take a pre-created conversation from the pool if we don't have one
+    if not conversation and conversation_pool and conversation_pool.enabled:
+        conversation = conversation_pool.take()
+        trace.get_current_span().set_attribute("conversation_pool.hit", conversation is not None)
+        if conversation:
+            source = "pool"
+            logger.info(f"Took conversation ID {conversation.id} from the pool")
+
     # Create a new conversation if we don't have one
     if not conversation:
+        source = "create"
         try:
             logger.info("Creating a new conversation")
             conversation = await openai_client.conversations.create()
@@ -132,31 +225,82 @@ async def get_or_create_conversation(
         except Exception as e:
             logger.error(f"Error creating conversation: {e}")
             raise HTTPException(status_code=400, detail=f"Error handling conversation: {e}")
-    
+
+    if conversation_cache:
+        conversation_cache.put(conversation)
+    record_stage("conversation", time.perf_counter() - started, source=source)
     return conversation
 
-async def get_message_and_annotations(event: Message | ResponseOutputMessage) -> Dict:
-    annotations = []
-    # Get file annotations for the file search.
+def read_session(cookies: Mapping[str, str], session_codec: Optional[SessionCodec]) -> Optional[Session]:
+    """Return the verified session of the request cookies, if any."""
+    return session_codec.decode(cookies.get(SESSION_COOKIE)) if session_codec else None
+
+def is_secure_connection(connection: HTTPConnection) -> bool:
+    """Return True if the client connected over TLS, to the app or to the proxy in front of it."""
+    forwarded_proto = connection.headers.get("X-Forwarded-Proto", "").split(",")[0].strip().lower()
+    return connection.url.scheme in ("https", "wss") or forwarded_proto == "https"
+
+def set_conversation_cookies(
+    response: fastapi.Response,
+    conversation: Conversation,
+    agent: AgentVersionObject,
+    session_codec: Optional[SessionCodec],
+    pending: bool = False,
+    secure: bool = False
+) -> None:
+    """
+    Persist the conversation and agent IDs in the cookies, and in a signed session
+    cookie with the created_at timestamps if sessions are enabled.
+    ``pending`` marks a session issued before a turn whose timestamp it lacks,
+    as is one of a cached conversation, whose timestamps are unknown.
+    ``secure`` restricts the cookies to HTTPS, see is_secure_connection. The
+    session cookie is not readable by scripts; the page clears the others for a new chat.
+    """
+    response.set_cookie("conversation_id", conversation.id, samesite="lax", secure=secure)
+    response.set_cookie("agent_id", agent.id, samesite="lax", secure=secure)
+    if session_codec:
+        pending = pending or conversation.metadata is None
+        response.set_cookie(
+            SESSION_COOKIE, session_codec.issue(conversation, agent.id, pending=pending),
+            httponly=True, samesite="lax", secure=secure
+        )
+
+def format_annotation(annotation, offset: int = 0) -> Optional[Dict]:
+    """
+    Format a file or URL citation for the client, or return None for other annotations.
+    The index is moved by ``offset``, the length of the preceding content parts of the message.
+    """
+    if isinstance(annotation, dict):
+        annotation = SimpleNamespace(**annotation)
+    annotation_type = getattr(annotation, "type", None)
+    if annotation_type == "file_citation":
+        return {'label': annotation.filename, 'index': annotation.index + offset}
+    if annotation_type == "url_citation":
+        return {'label': annotation.title, 'index': annotation.start_index + offset}
+    return None
+
+async def get_message_and_annotations(
+    event: Message | ResponseOutputMessage,
+    annotations: Optional[List[Dict]] = None
+) -> Dict:
+    """
+    Get the text and the citations of a message.
+    The text parts of the message are joined; the indices of their annotations are moved accordingly.
+    Annotations already collected while streaming can be passed, so they are not extracted again.
+    """
+    collect = annotations is None
+    annotations = [] if collect else annotations
     text = ""
-    content = event.content[0]
-    if content.type == "output_text" or content.type == "input_text":
-        text = content.text
-    if content.type == "output_text":
-        for annotation in content.annotations:
-            if annotation.type == "file_citation":
-                ann = {
-                    'label': annotation.filename,
-                    "index": annotation.index
-                }
-                annotations.append(ann)
-            elif annotation.type == "url_citation":
-                ann = {
-                    'label': annotation.title,
-                    "index": annotation.start_index
-                }
-                annotations.append(ann)
-            
+    for content in event.content:
+        if content.type == "output_text" and collect:
+            # Get file annotations for the file search.
+            for annotation in content.annotations:
+                ann = format_annotation(annotation, len(text))
+                if ann:
+                    annotations.append(ann)
+        if content.type == "output_text" or content.type == "input_text":
+            text += content.text
+
     return {
         'content': text,
         'annotations': annotations
@@ -165,125 +309,473 @@ async def get_message_and_annotations(event: Message | ResponseOutputMessage) ->
 
 @router.get("/", response_class=HTMLResponse)
 async def index(request: Request, _ = auth_dependency):
-    return templates.TemplateResponse(
-        "index.html", 
-        {
-            "request": request,
-        }
+    # The page is rendered once by create_app and answered from memory, with its ETag.
+    return request.app.state.index_page.response(request.headers)
+
+async def create_response_stream(
+    openai_client: AsyncOpenAI,
+    agent: AgentVersionObject,
+    conversation: Conversation,
+    user_message: str
+) -> AsyncStream:
+    """Create the streamed response of the agent in the conversation."""
+    started = time.monotonic()
+    response = await openai_client.responses.create(
+        conversation=conversation.id,
+        input=user_message,
+        extra_body={"agent": AgentReference(name=agent.name, version=agent.version).as_dict()},
+        stream=True
     )
+    record_stage("responses_create", time.monotonic() - started)
+    return response
 
-async def save_user_message_created_at(openai_client: AsyncOpenAI, conversation: Conversation,  input_created_at: float):
-    conversation.metadata = conversation.metadata  or {}
-    try:
-        logger.info(f"Saving created_at.")
-        messages = await openai_client.conversations.items.list(conversation_id=conversation.id, order="desc")
-        last_input_message = None
-        async for message in messages:
-            if isinstance(message, Message) and message.role == "user":
-                last_input_message = message
-                break
-        if last_input_message:
-            conversation.metadata[get_created_at_label(last_input_message.id)] = str(input_created_at)
-        cleanup_created_at_metadata(conversation.metadata)
-
-        await openai_client.conversations.update(conversation.id, metadata=conversation.metadata)
-        
-        logger.info(f"Successfully saved created_at for user message")
-        return  # Success, exit the retry loop
+async def start_response(
+    openai_client: AsyncOpenAI,
+    agent: AgentVersionObject,
+    conversation: Conversation,
+    user_message: str,
+    conversation_cache: Optional[ConversationCache] = None,
+    conversation_pool: Optional[ConversationPool] = None
+) -> Tuple[Conversation, "asyncio.Future[AsyncStream]"]:
+    """
+    Create the streamed response before the cookies of the conversation are sent.
+    A conversation of the session or the cache may have been deleted since, which
+    responses.create answers with 404; a new conversation is used then.
+    Returns the conversation and the future of the response, which get_result awaits,
+    so it reports any other error in the stream.
+    """
+    upstream = await settle(create_response_stream(openai_client, agent, conversation, user_message))
+    if isinstance(upstream.exception(), NotFoundError):
+        logger.warning(f"Conversation {conversation.id} was not found, starting a new one: {upstream.exception()}")
+        if conversation_cache:
+            conversation_cache.invalidate(conversation.id)
+        conversation = await get_or_create_conversation(
+            openai_client, None, None, agent.id, conversation_cache, conversation_pool)
+        upstream = await settle(create_response_stream(openai_client, agent, conversation, user_message))
+    return conversation, upstream
 
-    except Exception as e:
-        logger.error(f"Error updating message created_at.")
-        
+async def settle(coroutine) -> asyncio.Future:
+    """Run the coroutine to its end and return its future, which is cancelled with the caller."""
+    future = asyncio.ensure_future(coroutine)
+    try:
+        await asyncio.wait([future])
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    return future
 
+def abandon_response(
+    conversation: Conversation,
+    upstream: "asyncio.Future[AsyncStream]",
+    created_at_writer: CreatedAtWriter,
+    upstream_canceller: UpstreamCanceller,
+    history_cache: Optional[HistoryCache] = None
+) -> None:
+    """
+    Clean up a response created by start_response whose stream get_result never started,
+    because the client disconnected before the body was sent or the route failed.
+    The upstream stream is closed, and the user message, which is in the conversation
+    already, gets its created_at as in get_result.
+    """
+    if upstream.cancelled() or upstream.exception() is not None:
+        return
+    upstream_canceller.cancel(upstream.result(), None, 0, 0.0)
+    created_at_writer.enqueue(conversation, datetime.now(timezone.utc).timestamp())
+    created_at_writer.schedule_flush()
+    if history_cache:
+        history_cache.invalidate(conversation.id)
+    record_stage("stream", 0.0, outcome="disconnected")
 
 async def get_result(
     agent: AgentVersionObject,
     conversation: Conversation,
     user_message: str, 
-    project_client: AIProjectClient,
-    carrier: Dict[str, str]
-) -> AsyncGenerator[str, None]:
+    openai_client: AsyncOpenAI,
+    carrier: Dict[str, str],
+    created_at_writer: CreatedAtWriter,
+    upstream_canceller: UpstreamCanceller,
+    history_cache: Optional[HistoryCache] = None,
+    answer_cache: Optional[AnswerCache] = None,
+    answer_cache_key: Optional[str] = None,
+    stream_id: Optional[str] = None,
+    run_stats: Optional[Dict] = None,
+    upstream: Optional["asyncio.Future[AsyncStream]"] = None,
+    requested_at: Optional[float] = None
+) -> AsyncGenerator[bytes, None]:
+    """
+    Stream the response of the agent to the user message as SSE frames.
+    ``upstream`` is the response already created by start_response, if any, and
+    ``requested_at`` the time.monotonic() before it was, the start of first_delta.
+    """
     ctx = TraceContextTextMapPropagator().extract(carrier=carrier)
-    with tracer.start_as_current_span('get_result', context=ctx):
-        async with project_client.get_openai_client() as openai_client:
-            logger.info(f"get_result invoked for conversation={conversation.id}")
-            input_created_at = datetime.now(timezone.utc).timestamp()
-            try:
-                response = await openai_client.responses.create(
-                    conversation=conversation.id,
-                    input=user_message,
-                    extra_body={"agent": AgentReference(name=agent.name, version=agent.version).as_dict()},
-                    stream=True
-                )
-                logger.info("Successfully created stream; starting to process events")
-                async for event in response:
-                    if event.type == "response.created":
+    with tracer.start_as_current_span('get_result', context=ctx) as span:
+        logger.info(f"get_result invoked for conversation={conversation.id}")
+        input_created_at = datetime.now(timezone.utc).timestamp()
+        started = time.monotonic()
+        first_output_item_id: Optional[str] = None
+        input_message_id: Optional[str] = None
+        completed_messages: List[Dict] = []
+        # The citations sent for each output item, and the text lengths of its finished content parts.
+        citations: Dict[str, List[Dict]] = {}
+        part_lengths: Dict[str, List[int]] = {}
+        completed = False
+        disconnected = False
+        response = None
+        response_id: Optional[str] = None
+        encoder = get_sse_encoder(stream_id)
+        first_delta = True
+        streams_in_flight.add(1)
+        try:
+            response = await (upstream or create_response_stream(openai_client, agent, conversation, user_message))
+            logger.info("Successfully created stream; starting to process events")
+            async with contextlib.aclosing(iterate_with_deadline(response, encoder.time_until_due)) as events:
+                async for event in events:
+                    if event is None:
+                        # The coalescing window of the buffered deltas has passed.
+                        yield encoder.flush()
+                    elif event.type == "response.created":
+                        response_id = event.response.id
+                        input_message_id = get_input_message_id(event.response)
                         logger.info(f"Stream response created with ID: {event.response.id}")
+                    elif event.type == "response.output_item.added" and first_output_item_id is None:
+                        first_output_item_id = event.item.id
                     elif event.type == "response.output_text.delta":
-                        logger.info(f"Delta: {event.delta}")
-                        stream_data = {'content': event.delta, 'type': "message"}
-                        yield serialize_sse_event(stream_data)
+                        stream_logger.info("Delta: %s", event.delta)
+                        if first_delta:
+                            first_delta = False
+                            record_stage("first_delta", time.monotonic() - (requested_at or started))
+                        frame = encoder.message(event.delta)
+                        if frame:
+                            yield frame
+                    elif event.type == "response.content_part.done":
+                        part_lengths.setdefault(event.item_id, []).append(
+                            len(getattr(event.part, "text", None) or ""))
+                    elif event.type == "response.output_text.annotation.added":
+                        # Sent as it arrives, so the client need not wait for the completed message.
+                        offset = sum(part_lengths.get(event.item_id, [])[:event.content_index])
+                        citation = format_annotation(event.annotation, offset)
+                        if citation:
+                            citations.setdefault(event.item_id, []).append(citation)
+                            yield encoder.event({**citation, 'type': "citation"})
                     elif event.type == "response.output_item.done" and event.item.type == "message":
-                        stream_data = await get_message_and_annotations(event.item)
+                        stream_data = await get_message_and_annotations(event.item, citations.pop(event.item.id, None))
+                        completed_messages.append({**stream_data, 'id': event.item.id, 'role': event.item.role, 'created_at': ""})
                         stream_data['type'] = "completed_message"
-                        yield serialize_sse_event(stream_data)
+                        yield encoder.event(stream_data)
                     elif event.type == "response.completed":
                         logger.info(f"Response completed with full message: {event.response.output_text}")
-                                                        
-            except Exception as e:
-                logger.exception(f"Exception in get_result: {e}")
-                error_data = {
-                    'content': str(e),
-                    'annotations': [],
-                    'type': "completed_message"
-                }
-                yield serialize_sse_event(error_data)
-            finally:
-                stream_data = {'type': "stream_end"}
-                await save_user_message_created_at(openai_client, conversation, input_created_at)
-                yield serialize_sse_event(stream_data)           
+                        completed = True
+                        usage = event.response.usage
+                        if usage:
+                            upstream_canceller.record_completed(usage.output_tokens, time.monotonic() - started)
+                            tokens_counter.add(usage.input_tokens, {"type": "input"})
+                            tokens_counter.add(usage.output_tokens, {"type": "output"})
+                        if run_stats is not None and usage:
+                            run_stats['usage'] = {
+                                'input_tokens': usage.input_tokens,
+                                'output_tokens': usage.output_tokens,
+                                'total_tokens': usage.total_tokens,
+                            }
+
+        except (asyncio.CancelledError, GeneratorExit):
+            # The client disconnected, see ReleasingStreamingResponse.
+            disconnected = True
+            raise
+        except Exception as e:
+            logger.exception(f"Exception in get_result: {e}")
+            if run_stats is not None:
+                run_stats['error'] = str(e)
+            error_data = {
+                'content': str(e),
+                'annotations': [],
+                'type': "completed_message"
+            }
+            yield encoder.event(error_data)
+        finally:
+            stream_data = {'type': "stream_end"}
+            if run_stats is not None:
+                # Read by the callers which need more than the SSE frames, see run_batch_item.
+                run_stats.update(completed=completed, response_id=response_id)
+            if disconnected and not completed:
+                upstream_canceller.cancel(
+                    response, response_id, encoder.stats()['deltas'], time.monotonic() - started)
+            # Written by the background writer once the response is closed. The output
+            # item of an unfinished run may not exist, so the anchor is not used then.
+            created_at_writer.enqueue(
+                conversation, input_created_at, first_output_item_id if completed else None, input_message_id)
+            if history_cache:
+                if completed:
+                    # Unless the response reported it, the user message ID is set by the writer,
+                    # see resolve_user_message.
+                    user_entry = {
+                        'id': input_message_id, 'anchor': first_output_item_id, 'role': "user",
+                        'content': user_message, 'annotations': [], 'created_at': str(input_created_at)
+                    }
+                    history_cache.add_turn(conversation.id, [user_entry] + completed_messages)
+                else:
+                    history_cache.invalidate(conversation.id)
+            if answer_cache and answer_cache_key and completed and completed_messages:
+                answer_cache.set(answer_cache_key, CachedAnswer([
+                    {'content': m['content'], 'annotations': m['annotations']} for m in completed_messages
+                ]))
+            end_frame = encoder.event(stream_data)
+            stats = encoder.stats()
+            outcome = "completed" if completed else "disconnected" if disconnected else "failed"
+            record_stage("stream", time.monotonic() - started, outcome=outcome)
+            stream_bytes_counter.add(stats['bytes'])
+            streams_in_flight.add(-1)
+            span.set_attributes({f"sse.{key}": value for key, value in stats.items()})
+            logger.info(
+                f"SSE stream stats: {stats['deltas']} deltas in {stats['frames']} frames, "
+                f"{stats['frames_per_second']:.1f} frames/s, {stats['bytes_per_frame']:.1f} bytes/frame"
+            )
+            if not disconnected:
+                yield end_frame
+
+
+
+def lookup_answer(
+    answer_cache: Optional[AnswerCache],
+    agent: AgentVersionObject,
+    message: str,
+    bypass: bool
+) -> Tuple[Optional[str], Optional[CachedAnswer], Optional[str]]:
+    """
+    Look up the answer cache.
+    Returns the cache key to store the answer under, the cached answer, and
+    the cache status (hit, miss or bypass); all None if the cache is disabled.
+    """
+    if not (answer_cache and answer_cache.enabled):
+        return None, None, None
+    if bypass:
+        answer_cache.record_bypass()
+        return None, None, "bypass"
+    answer_cache_key = AnswerCache.make_key(agent.name, agent.version, message)
+    cached_answer = answer_cache.lookup(answer_cache_key)
+    return answer_cache_key, cached_answer, "hit" if cached_answer else "miss"
+
+async def is_first_turn(
+    openai_client: AsyncOpenAI,
+    conversation: Conversation,
+    history_cache: Optional[HistoryCache],
+    session: Optional[Session] = None,
+    created_at_writer: Optional[CreatedAtWriter] = None,
+    created: bool = False
+) -> bool:
+    """
+    Return True if the conversation has no messages yet.
+    A conversation ``created`` for this turn has none. Otherwise the metadata, the session,
+    the pending created_at writes and the history of this worker are asked for a turn first.
+    The created_at timestamps are written behind the turns, by any worker, so if none of
+    them knows of a turn the newest item of the conversation is listed.
+    """
+    if created:
+        return True
+    if conversation.metadata is None:
+        # A cached conversation, whose turns other workers may have added.
+        return False
+    if any(key.endswith("_created_at") for key in conversation.metadata):
+        return False
+    if session and session.pending and session.conversation_id == conversation.id:
+        return False
+    if created_at_writer and created_at_writer.is_pending(conversation.id):
+        return False
+    history = history_cache.peek(conversation.id) if history_cache else None
+    if history and history.messages:
+        return False
+    page = await openai_client.conversations.items.list(conversation_id=conversation.id, order="desc", limit=1)
+    return not page.data
 
+async def replay_answer(
+    answer: CachedAnswer,
+    conversation: Conversation
+) -> AsyncGenerator[bytes, None]:
+    """Send a cached answer with the same SSE event sequence as get_result."""
+    with tracer.start_as_current_span('replay_answer'):
+        logger.info(f"Replaying cached answer for conversation={conversation.id}")
+        chunk_size = int(os.getenv("ANSWER_CACHE_REPLAY_CHUNK_SIZE", "0"))
+        delay = float(os.getenv("ANSWER_CACHE_REPLAY_DELAY_MS", "0")) / 1000
+        encoder = get_sse_encoder()
+        for message in answer.messages:
+            content = message['content']
+            step = chunk_size if chunk_size > 0 else max(len(content), 1)
+            for start in range(0, len(content), step):
+                yield encoder.event({'content': content[start:start + step], 'type': "message"})
+                if delay:
+                    await asyncio.sleep(delay)
+            yield encoder.event({**message, 'type': "completed_message"})
+        yield encoder.event({'type': "stream_end"})
+
+async def record_cached_turn(
+    openai_client: AsyncOpenAI,
+    conversation: Conversation,
+    user_message: str,
+    answer: CachedAnswer,
+    input_created_at: float,
+    created_at_writer: CreatedAtWriter,
+    history_cache: Optional[HistoryCache]
+) -> None:
+    """Add a turn answered from the answer cache to the conversation, after the response was sent."""
+    try:
+        items = [{'type': "message", 'role': "user", 'content': user_message}]
+        items += [{'type': "message", 'role': "assistant", 'content': m['content']} for m in answer.messages]
+        created = await openai_client.conversations.items.create(conversation.id, items=items)
+        user_item, *answer_items = created.data
+        created_at_writer.enqueue(conversation, input_created_at, message_id=user_item.id)
+        created_at_writer.schedule_flush()
+        if history_cache:
+            history_cache.add_turn(conversation.id, [
+                {'id': user_item.id, 'role': "user", 'content': user_message, 'annotations': [],
+                 'created_at': str(input_created_at)}
+            ] + [
+                {**m, 'id': item.id, 'role': "assistant", 'created_at': ""}
+                for item, m in zip(answer_items, answer.messages)
+            ])
+    except Exception as e:
+        logger.error(f"Error recording cached answer in conversation {conversation.id}: {e}")
+        if history_cache:
+            history_cache.invalidate(conversation.id)
+
+async def is_history_current(openai_client: AsyncOpenAI, conversation_id: str, history: CachedHistory) -> bool:
+    """Return True if the newest item of the conversation is the newest item of the cached history."""
+    page = await openai_client.conversations.items.list(conversation_id=conversation_id, order="desc", limit=1)
+    return (page.data[0].id if page.data else None) == history.newest_item_id
+
+async def load_history_page(
+    openai_client: AsyncOpenAI,
+    conversation: Conversation,
+    history_cache: Optional[HistoryCache],
+    before: Optional[str],
+    limit: int
+) -> Tuple[List[Dict], bool]:
+    """
+    Get up to ``limit`` formatted messages older than the ``before`` item, newest first.
+
+    Messages are served from the history cache and only the missing part is
+    read from the Conversations API. The first page is served from the cache
+    only if it has the newest item of the conversation, since other workers
+    add turns too; the created_at of the messages are taken from the metadata,
+    which is retrieved only if the conversation lacks it and the page needs it.
+    Returns the messages and whether older messages exist.
+    """
+    metadata: Optional[Dict[str, str]] = conversation.metadata
+
+    async def get_metadata() -> Dict[str, str]:
+        nonlocal metadata
+        if metadata is None:
+            # The conversation cache does not keep the metadata.
+            metadata = (await openai_client.conversations.retrieve(conversation_id=conversation.id)).metadata or {}
+        return metadata
+
+    history = history_cache.get(conversation.id) if history_cache else None
+    if history is not None and before is None and not await is_history_current(openai_client, conversation.id, history):
+        history_cache.invalidate(conversation.id)
+        history = None
+    if history is None:
+        history = CachedHistory(cursor=before)
+        if history_cache and before is None:
+            history_cache.set(conversation.id, history)
+        start = 0
+    elif before is None:
+        start = 0
+    else:
+        ids = [message['id'] for message in history.messages]
+        if before in ids:
+            start = ids.index(before) + 1
+        elif before == history.cursor:
+            start = len(history.messages)
+        else:
+            # The cursor is outside of the cached part, read it without caching.
+            history = CachedHistory(cursor=before)
+            start = 0
+
+    async with history.lock:
+        while len(history.messages) - start < limit and history.has_more:
+            created_at_by_label = await get_metadata()
+            page = await openai_client.conversations.items.list(
+                conversation_id=conversation.id, order="desc", limit=min(limit, 100),
+                **({"after": history.cursor} if history.cursor else {}))
+            if page.data and not history.cursor:
+                history.newest_item_id = page.data[0].id
+            for item in page.data:
+                if item.type == "message":
+                    formatted_message = await get_message_and_annotations(item)
+                    formatted_message['id'] = item.id
+                    formatted_message['role'] = item.role
+                    formatted_message['created_at'] = created_at_by_label.get(get_created_at_label(item.id), "")
+                    history.messages.append(formatted_message)
+            history.has_more = bool(page.data) and bool(page.has_more)
+            if page.data:
+                history.cursor = page.last_id or page.data[-1].id
+
+    end = start + limit
+    has_more = len(history.messages) > end or history.has_more
+    while has_more and end - start > 1 and not history.messages[end - 1]['id']:
+        # The next page is asked for before the last message, whose ID the writer
+        # has not set yet, so that message starts the next page instead.
+        end -= 1
+    messages = history.messages[start:end]
+    if metadata is not None or any(m['role'] == "user" and m['id'] and not m['created_at'] for m in messages):
+        created_at_by_label = await get_metadata()
+        for message in messages:
+            # Written after the message was cached, possibly by another worker.
+            if message['id'] and get_created_at_label(message['id']) in created_at_by_label:
+                message['created_at'] = created_at_by_label[get_created_at_label(message['id'])]
+    return messages, has_more
 
 
 @router.get("/chat/history")
 async def history(
     request: Request,
+    before: Optional[str] = None,
+    limit: int = fastapi.Query(16, ge=1, le=100),
     agent: AgentVersionObject = Depends(get_agent_version_obj),
     openai_client : AsyncOpenAI = Depends(get_openai_client),
+    conversation_cache: Optional[ConversationCache] = Depends(get_conversation_cache),
+    conversation_pool: Optional[ConversationPool] = Depends(get_conversation_pool),
+    history_cache: Optional[HistoryCache] = Depends(get_history_cache),
+    created_at_writer: CreatedAtWriter = Depends(get_created_at_writer),
+    session_codec: Optional[SessionCodec] = Depends(get_session_codec),
 	_ = auth_dependency
 ):
     with tracer.start_as_current_span("chat_history"):
-        async with openai_client:
-            conversation_id = request.cookies.get('conversation_id')
-            agent_id = request.cookies.get('agent_id')
+        conversation_id = request.cookies.get('conversation_id')
+        agent_id = request.cookies.get('agent_id')
+        # The created_at of the messages must be complete, which a pending session's are not.
+        session = read_session(request.cookies, session_codec)
+        if session and session.pending:
+            session = None
 
-            # Get or create conversation using the reusable function
-            conversation = await get_or_create_conversation(
-                openai_client, conversation_id, agent_id, agent.id
-            )
-            agent_id = agent.id
-            # Create a new message from the user's input.
-            try:
-                content = []
-                items = await openai_client.conversations.items.list(conversation_id=conversation.id, order="desc", limit=16)
-                async for item in items:
-                    if item.type == "message":
-                        formatteded_message = await get_message_and_annotations(item)
-                        formatteded_message['role'] = item.role
-                        formatteded_message['created_at'] = conversation.metadata.get(get_created_at_label(item.id), "")
-                        content.append(formatteded_message)
-
-
-                logger.info(f"List message, conversation ID: {conversation_id}")
-                response = JSONResponse(content=content)
-            
-                # Update cookies to persist the conversation IDs.
-                response.set_cookie("conversation_id", conversation_id)
-                response.set_cookie("agent_id", agent_id)
-                return response
-            except Exception as e:
-                logger.error(f"Error listing message: {e}")
-                raise HTTPException(status_code=500, detail=f"Error list message: {e}")
+        # Get or create conversation using the reusable function
+        conversation = await get_or_create_conversation(
+            openai_client, conversation_id, agent_id, agent.id, conversation_cache, conversation_pool, session
+        )
+        conversation_id = conversation.id
+        try:
+            started = time.perf_counter()
+            messages, has_more = await load_history_page(openai_client, conversation, history_cache, before, limit)
+            record_stage("history", time.perf_counter() - started)
+        except Exception as e:
+            logger.error(f"Error listing message: {e}")
+            raise HTTPException(status_code=500, detail=f"Error list message: {e}")
+
+        logger.info(f"List message, conversation ID: {conversation_id}")
+        etag = compute_history_etag(conversation_id, messages, before, limit)
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if has_more and messages and messages[-1]['id']:
+            # Pass as ?before= to get the next, older page.
+            headers["X-Next-Before"] = messages[-1]['id']
+        if etag_matches(request.headers.get("If-None-Match", ""), etag):
+            response = fastapi.Response(status_code=304, headers=headers)
+        else:
+            response = JSONResponse(content=[render_history_message(m) for m in messages], headers=headers)
+
+        # Update cookies to persist the conversation IDs.
+        set_conversation_cookies(
+            response, conversation, agent, session_codec, pending=created_at_writer.is_pending(conversation_id),
+            secure=is_secure_connection(request)
+        )
+        return response
 
 @router.get("/agent")
 async def get_chat_agent(
@@ -294,50 +786,454 @@ async def get_chat_agent(
 @router.post("/chat")
 async def chat(
     request: Request,
-    project_client: AIProjectClient = Depends(get_project_client),
+    openai_client: AsyncOpenAI = Depends(get_openai_client),
     agent: AgentVersionObject = Depends(get_agent_version_obj),
+    conversation_cache: Optional[ConversationCache] = Depends(get_conversation_cache),
+    conversation_pool: Optional[ConversationPool] = Depends(get_conversation_pool),
+    created_at_writer: CreatedAtWriter = Depends(get_created_at_writer),
+    history_cache: Optional[HistoryCache] = Depends(get_history_cache),
+    answer_cache: Optional[AnswerCache] = Depends(get_answer_cache),
+    admission: AdmissionController = Depends(get_admission_controller),
+    upstream_canceller: UpstreamCanceller = Depends(get_upstream_canceller),
+    resumable_streams: Optional[ResumableStreams] = Depends(get_resumable_streams),
+    session_codec: Optional[SessionCodec] = Depends(get_session_codec),
     
 	_ = auth_dependency
 ):
     # Retrieve the conversation ID from the cookies (if available).
     conversation_id = request.cookies.get('conversation_id')
     agent_id = request.cookies.get('agent_id')    
+    session = read_session(request.cookies, session_codec)
 
     carrier = {}        
     TraceContextTextMapPropagator().inject(carrier)
 
-    with tracer.start_as_current_span("chat_request"):
-        async with project_client.get_openai_client() as openai_client:
+    # Set the Server-Sent Events (SSE) response headers.
+    headers = {
+        "Cache-Control": "no-cache",
+        "Connection": "keep-alive",
+        "Content-Type": "text/event-stream"
+    }
+
+    # A reconnecting client continues the stream it was reading instead of starting a new run.
+    last_event_id = parse_last_event_id(request.headers.get("Last-Event-ID"))
+    if last_event_id and resumable_streams:
+        stream_id, after = last_event_id
+        if not await resumable_streams.exists(stream_id, after):
+            # The stream expired; 204 tells the client to stop reconnecting.
+            logger.info(f"Stream {stream_id} cannot be resumed after event {after}")
+            return fastapi.Response(status_code=204)
+        logger.info(f"Resuming stream {stream_id} after event {after}")
+        return ReleasingStreamingResponse(resumable_streams.tail(stream_id, after), headers=headers)
+
+    # Parse the JSON from the request.
+    try:
+        user_message = await request.json()
+    except Exception as e:
+        logger.error(f"Invalid JSON in request: {e}")
+        raise HTTPException(status_code=400, detail=f"Invalid JSON in request: {e}")
+    message = user_message.get('message', '')
+
+    answer_cache_key, cached_answer, answer_cache_status = lookup_answer(
+        answer_cache, agent, message, request.headers.get(ANSWER_CACHE_HEADER, "").lower() == "bypass"
+    )
+    if answer_cache_status:
+        headers[ANSWER_CACHE_HEADER] = answer_cache_status
+
+    if cached_answer:
+        with tracer.start_as_current_span("chat_request"):
+            conversation = await get_or_create_conversation(
+                openai_client, conversation_id, agent_id, agent.id, conversation_cache, conversation_pool, session
+            )
+        # Answers are only cached and replayed without preceding context.
+        if not await is_first_turn(
+                openai_client, conversation, history_cache, session, created_at_writer,
+                created=conversation.id != conversation_id):
+            cached_answer = None
+            answer_cache_key = None
+            headers[ANSWER_CACHE_HEADER] = "miss"
+            conversation_id = conversation.id
+
+    if cached_answer:
+        # A cached answer needs no upstream stream, so no stream slot is taken.
+        input_created_at = datetime.now(timezone.utc).timestamp()
+        response = StreamingResponse(
+            replay_answer(cached_answer, conversation),
+            headers=headers,
+            background=BackgroundTask(
+                record_cached_turn, openai_client, conversation, message, cached_answer,
+                input_created_at, created_at_writer, history_cache
+            )
+        )
+        set_conversation_cookies(
+            response, conversation, agent, session_codec, pending=True, secure=is_secure_connection(request)
+        )
+        return response
+
+    # Wait for a slot of the worker's limit on concurrent upstream streams.
+    try:
+        await admission.acquire()
+    except AdmissionRejected as e:
+        logger.warning(f"Rejected chat request: {e}")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+    upstream = None
+    # Updated by get_result once it ends; the upstream stream is abandoned if it never started.
+    run_stats: Dict = {}
+    # The stream slot and the upstream stream are handed over to the run of a resumable stream.
+    owns_stream = True
+    try:
+        with tracer.start_as_current_span("chat_request"):
             # if the connection no longer exist or agent is changed, create a new one
             conversation = await get_or_create_conversation(
-                openai_client, conversation_id, agent_id, agent.id
+                openai_client, conversation_id, agent_id, agent.id, conversation_cache, conversation_pool, session
+            )
+            # Before the response adds the user message to the conversation.
+            if answer_cache_key and not await is_first_turn(
+                    openai_client, conversation, history_cache, session, created_at_writer,
+                    created=conversation.id != conversation_id):
+                answer_cache_key = None
+            # Before the cookies are set, since a deleted conversation is replaced by a new one.
+            requested_at = time.monotonic()
+            conversation, upstream = await start_response(
+                openai_client, agent, conversation, message, conversation_cache, conversation_pool
             )
             conversation_id = conversation.id
-            agent_id = agent.id
-        
-    # Parse the JSON from the request.
+
+        logger.info(f"Starting streaming response for conversation ID {conversation_id}")
+
+        if resumable_streams:
+            # The run is produced in the background and the response tails it, so a client
+            # can reconnect with Last-Event-ID; the stream slot is released when the run ends.
+            stream_id = uuid.uuid4().hex
+
+            def finish_stream() -> None:
+                admission.release()
+                created_at_writer.schedule_flush()
+
+            await resumable_streams.begin(
+                stream_id,
+                get_result(
+                    agent, conversation, message, openai_client, carrier, created_at_writer,
+                    upstream_canceller, history_cache, answer_cache, answer_cache_key, stream_id,
+                    upstream=upstream, requested_at=requested_at
+                ),
+                on_finish=finish_stream
+            )
+            owns_stream = False
+            response = ReleasingStreamingResponse(resumable_streams.tail(stream_id), headers=headers)
+        else:
+            def close_stream() -> None:
+                admission.release()
+                if 'completed' not in run_stats:
+                    # The client disconnected before the body was started.
+                    abandon_response(conversation, upstream, created_at_writer, upstream_canceller, history_cache)
+
+            # Create the streaming response using the generator; the stream slot is released when it is closed.
+            response = ReleasingStreamingResponse(
+                get_result(
+                    agent, conversation, message, openai_client, carrier, created_at_writer,
+                    upstream_canceller, history_cache, answer_cache, answer_cache_key,
+                    run_stats=run_stats, upstream=upstream, requested_at=requested_at
+                ),
+                headers=headers,
+                background=BackgroundTask(created_at_writer.schedule_flush),
+                on_close=close_stream
+            )
+
+        # Update cookies to persist the conversation and agent IDs; the turn's created_at is not known to the session yet.
+        set_conversation_cookies(
+            response, conversation, agent, session_codec, pending=True, secure=is_secure_connection(request)
+        )
+    except BaseException:
+        if owns_stream:
+            admission.release()
+            if upstream is not None:
+                abandon_response(conversation, upstream, created_at_writer, upstream_canceller, history_cache)
+        raise
+    return response
+
+def sse_data_payloads(chunk: bytes) -> List[str]:
+    """Return the JSON payloads of the SSE frames in the chunk."""
+    payloads = []
+    for frame in chunk.split(b"\n\n"):
+        start = frame.find(b"data: ")
+        if start != -1:
+            payloads.append(frame[start + 6:].decode("utf-8"))
+    return payloads
+
+async def run_websocket_turn(
+    websocket: WebSocket,
+    conversation: Conversation,
+    message: str,
+    bypass_answer_cache: bool,
+    session: Optional[Session] = None,
+    created: bool = False,
+    earlier_turns: int = 0
+) -> None:
+    """
+    Run one chat turn of a WebSocket connection and send its events.
+    ``created`` is set if the connection created the conversation, and ``earlier_turns``
+    counts the turns the connection ran before, which the metadata of the conversation lacks.
+    """
+    state = websocket.app.state
+    agent: AgentVersionObject = state.agent_version_obj
+    openai_client: AsyncOpenAI = state.openai_client
+    history_cache: Optional[HistoryCache] = getattr(state, "history_cache", None)
+    created_at_writer: CreatedAtWriter = state.created_at_writer
+    admission: AdmissionController = state.admission_controller
+
+    carrier = {}
+    with tracer.start_as_current_span("chat_websocket_turn"):
+        TraceContextTextMapPropagator().inject(carrier)
+
+    answer_cache_key, cached_answer, _ = lookup_answer(
+        getattr(state, "answer_cache", None), agent, message, bypass_answer_cache
+    )
+    # Answers are only cached and replayed without preceding context.
+    if (answer_cache_key or cached_answer) and (earlier_turns or not await is_first_turn(
+            openai_client, conversation, history_cache, session, created_at_writer, created)):
+        answer_cache_key, cached_answer = None, None
+    if session:
+        # The conversation of the session has a turn from now on.
+        session.pending = True
+
+    admitted = False
+    if cached_answer:
+        input_created_at = datetime.now(timezone.utc).timestamp()
+        body = replay_answer(cached_answer, conversation)
+    else:
+        try:
+            await admission.acquire()
+        except AdmissionRejected as e:
+            logger.warning(f"Rejected chat turn: {e}")
+            await websocket.send_text(dumps_json({'type': "error", 'content': str(e), 'retry_after': e.retry_after}).decode())
+            await websocket.send_text(dumps_json({'type': "stream_end"}).decode())
+            return
+        admitted = True
+        body = get_result(
+            agent, conversation, message, openai_client, carrier, created_at_writer,
+            state.upstream_canceller, history_cache, getattr(state, "answer_cache", None), answer_cache_key
+        )
+
+    cancelled = False
     try:
-        user_message = await request.json()
+        async with contextlib.aclosing(body):
+            async for chunk in body:
+                for payload in sse_data_payloads(chunk):
+                    await websocket.send_text(payload)
+    except asyncio.CancelledError:
+        cancelled = True
+    finally:
+        if admitted:
+            admission.release()
+            created_at_writer.schedule_flush()
+
+    if cancelled:
+        await websocket.send_text(dumps_json({'type': "stream_end", 'cancelled': True}).decode())
+    elif cached_answer:
+        # Shielded, so the turn is recorded even if the client disconnects meanwhile.
+        await asyncio.shield(record_cached_turn(
+            openai_client, conversation, message, cached_answer, input_created_at, created_at_writer, history_cache
+        ))
+
+@router.websocket("/ws/chat")
+async def chat_websocket(websocket: WebSocket):
+    """
+    Chat over one WebSocket connection per browser session.
+
+    The client sends {"type": "message", "message": ...} to start a turn and
+    {"type": "cancel"} to cancel the running turn. Each event of the turn is
+    sent as one JSON message with the schema of the /chat stream; a turn ends
+    with stream_end, which has "cancelled": true if the turn was cancelled.
+    """
+    if not authenticate_websocket(websocket):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    state = websocket.app.state
+    agent: AgentVersionObject = state.agent_version_obj
+    session_codec: Optional[SessionCodec] = getattr(state, "session_codec", None)
+    session = read_session(websocket.cookies, session_codec)
+    with tracer.start_as_current_span("chat_websocket"):
+        try:
+            conversation = await get_or_create_conversation(
+                state.openai_client, websocket.cookies.get('conversation_id'), websocket.cookies.get('agent_id'),
+                agent.id, getattr(state, "conversation_cache", None), getattr(state, "conversation_pool", None),
+                session
+            )
+        except HTTPException as e:
+            await websocket.close(code=status.WS_1011_INTERNAL_ERROR, reason=str(e.detail)[:120])
+            return
+
+    # Persist the conversation and agent IDs with the cookies of the handshake response;
+    # the session is pending as the turns of the connection do not update it.
+    cookies = fastapi.Response()
+    set_conversation_cookies(
+        cookies, conversation, agent, session_codec, pending=True, secure=is_secure_connection(websocket)
+    )
+    await websocket.accept(headers=[header for header in cookies.raw_headers if header[0] == b"set-cookie"])
+    logger.info(f"WebSocket chat connected for conversation ID {conversation.id}")
+
+    turn: Optional[asyncio.Task] = None
+    turns = 0
+    try:
+        while True:
+            try:
+                data = json.loads(await websocket.receive_text())
+                if not isinstance(data, dict):
+                    raise ValueError("expected a JSON object")
+            except ValueError as e:
+                await websocket.send_text(dumps_json({'type': "error", 'content': f"Invalid JSON: {e}"}).decode())
+                continue
+            if data.get('type') == "cancel":
+                if turn and not turn.done():
+                    turn.cancel()
+            elif data.get('type') == "message":
+                if turn and not turn.done():
+                    await websocket.send_text(dumps_json({'type': "error", 'content': "A turn is already running."}).decode())
+                    continue
+                turn = asyncio.create_task(run_websocket_turn(
+                    websocket, conversation, data.get('message', ''), data.get('answer_cache') == "bypass", session,
+                    created=conversation.id != websocket.cookies.get('conversation_id'), earlier_turns=turns
+                ))
+                turns += 1
+            else:
+                await websocket.send_text(dumps_json({'type': "error", 'content': f"Unknown message type: {data.get('type')}"}).decode())
+    except WebSocketDisconnect:
+        logger.info(f"WebSocket chat disconnected for conversation ID {conversation.id}")
+    finally:
+        if turn:
+            turn.cancel()
+            await asyncio.gather(turn, return_exceptions=True)
+
+async def run_batch_item(state, agent: AgentVersionObject, item: BatchItem) -> Dict:
+    """Run one item of a batch through get_result and return its NDJSON result."""
+    started = time.monotonic()
+    admission: AdmissionController = state.admission_controller
+    created_at_writer: CreatedAtWriter = state.created_at_writer
+    result = {'type': "result", 'index': item.index, 'id': item.id, 'conversation_id': item.conversation_id}
+    admitted = False
+    with tracer.start_as_current_span("chat_batch_item") as span:
+        span.set_attribute("batch.index", item.index)
+        carrier = {}
+        TraceContextTextMapPropagator().inject(carrier)
+        try:
+            # Batch items take stream slots like any chat turn; a rejected item is retried after Retry-After.
+            for attempt in range(BATCH_ADMISSION_ATTEMPTS):
+                try:
+                    await admission.acquire()
+                    admitted = True
+                    break
+                except AdmissionRejected as e:
+                    rejection = e
+                    if attempt + 1 < BATCH_ADMISSION_ATTEMPTS:
+                        await asyncio.sleep(e.retry_after)
+            if not admitted:
+                logger.warning(f"Rejected batch item {item.index}: {rejection}")
+                result.update(status="rejected", error=str(rejection), retry_after=rejection.retry_after)
+                return result
+
+            conversation = await get_or_create_conversation(
+                state.openai_client, item.conversation_id, agent.id, agent.id,
+                getattr(state, "conversation_cache", None), getattr(state, "conversation_pool", None)
+            )
+            result['conversation_id'] = conversation.id
+            run_stats: Dict = {}
+            messages = []
+            body = get_result(
+                agent, conversation, item.message, state.openai_client, carrier, created_at_writer,
+                state.upstream_canceller, getattr(state, "history_cache", None), run_stats=run_stats
+            )
+            async with contextlib.aclosing(body):
+                async for chunk in body:
+                    if 'first_frame_ms' not in result:
+                        result['first_frame_ms'] = round((time.monotonic() - started) * 1000, 1)
+                    for payload in sse_data_payloads(chunk):
+                        event = json.loads(payload)
+                        if event['type'] == "completed_message":
+                            messages.append({'content': event['content'], 'annotations': event['annotations']})
+            if run_stats.get('error') or not run_stats.get('completed'):
+                result.update(status="failed", error=run_stats.get('error', "The response did not complete."))
+            else:
+                result.update(status="completed", messages=messages)
+            result['usage'] = run_stats.get('usage')
+        except Exception as e:
+            logger.error(f"Error running batch item {item.index}: {e}")
+            result.update(status="failed", error=str(e.detail if isinstance(e, HTTPException) else e))
+        finally:
+            if admitted:
+                admission.release()
+                created_at_writer.schedule_flush()
+            result['latency_ms'] = round((time.monotonic() - started) * 1000, 1)
+            span.set_attribute("batch.status", result.get('status', "cancelled"))
+    return result
+
+@router.post("/chat/batch")
+async def chat_batch(
+    request: Request,
+    agent: AgentVersionObject = Depends(get_agent_version_obj),
+	_ = auth_dependency
+):
+    """
+    Run many messages and stream their results as NDJSON, one line per item as it completes.
+
+    The body is {"items": [...], "concurrency": n}, an item being a message
+    string or {"message": ..., "id": ..., "conversation_id": ...}. Items
+    without a conversation_id get a new conversation each; items sharing one
+    run in order. At most ``concurrency`` items run at a time, capped by
+    CHAT_BATCH_MAX_CONCURRENCY. Each result line has the item's index, id,
+    conversation_id, status, messages, usage, latency_ms and first_frame_ms;
+    a summary line ends the stream.
+    """
+    try:
+        data = await request.json()
     except Exception as e:
         logger.error(f"Invalid JSON in request: {e}")
         raise HTTPException(status_code=400, detail=f"Invalid JSON in request: {e}")
-    # Create a new message from the user's input.
+    try:
+        items = parse_batch_items(data, max_items=int(os.getenv("CHAT_BATCH_MAX_ITEMS", "100")))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid batch request: {e}")
+    concurrency = int(os.getenv("CHAT_BATCH_MAX_CONCURRENCY", "4"))
+    requested = data.get('concurrency')
+    if isinstance(requested, int) and requested > 0:
+        concurrency = min(requested, concurrency)
+    state = request.app.state
+    logger.info(f"Starting batch of {len(items)} items with concurrency {concurrency}")
 
-    # Set the Server-Sent Events (SSE) response headers.
-    headers = {
-        "Cache-Control": "no-cache",
-        "Connection": "keep-alive",
-        "Content-Type": "text/event-stream"
-    }
-    logger.info(f"Starting streaming response for conversation ID {conversation_id}")
+    async def stream() -> AsyncGenerator[bytes, None]:
+        started = time.monotonic()
+        counts = {'completed': 0, 'failed': 0, 'rejected': 0}
+        usage = {'input_tokens': 0, 'output_tokens': 0, 'total_tokens': 0}
+        results = run_bounded(
+            group_by_conversation(items), lambda item: run_batch_item(state, agent, item), concurrency
+        )
+        async with contextlib.aclosing(results):
+            async for result in results:
+                counts[result['status']] += 1
+                for key, value in (result.get('usage') or {}).items():
+                    usage[key] += value
+                yield dumps_json(result) + b"\n"
+        summary = {
+            'type': "summary", 'items': len(items), **counts, 'usage': usage,
+            'duration_ms': round((time.monotonic() - started) * 1000, 1)
+        }
+        logger.info(f"Batch finished: {summary}")
+        yield dumps_json(summary) + b"\n"
 
-    # Create the streaming response using the generator.
-    response = StreamingResponse(get_result(agent, conversation, user_message.get('message', ''), project_client, carrier), headers=headers)
+    # The items are cancelled if the client disconnects, see ReleasingStreamingResponse.
+    return ReleasingStreamingResponse(stream(), media_type=BATCH_MEDIA_TYPE, headers={"Cache-Control": "no-cache"})
 
-    # Update cookies to persist the conversation and agent IDs.
-    response.set_cookie("conversation_id", conversation_id)
-    response.set_cookie("agent_id", agent_id)
-    return response
+@router.get("/metrics")
+async def prometheus_metrics(
+    prometheus: Optional[PrometheusMetrics] = Depends(get_prometheus_metrics),
+	_ = auth_dependency
+):
+    """The metrics of all gunicorn workers in the Prometheus text format."""
+    if prometheus is None:
+        raise HTTPException(status_code=404, detail="Prometheus metrics are disabled.")
+    return fastapi.Response(content=prometheus.render(), media_type=PROMETHEUS_CONTENT_TYPE)
 
 def read_file(path: str) -> str:
     with open(path, 'r') as file:
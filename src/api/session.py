@@ -0,0 +1,160 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Dict, Optional
+
+from opentelemetry import metrics
+
+if TYPE_CHECKING:
+    from openai.types.conversations import Conversation
+
+from .created_at_writer import get_created_at_label
+
+logger = logging.getLogger("azureaiapp")
+meter = metrics.get_meter(__name__)
+
+SESSION_COOKIE = "session"
+_CREATED_AT_SUFFIX = get_created_at_label("")
+_SIGNATURE_SIZE = 16
+
+
+def load_session_secret() -> Optional[bytes]:
+    """Return the secret of the session cookies from SESSION_SECRET, None if it is not set."""
+    secret = os.getenv("SESSION_SECRET")
+    return secret.encode("utf-8") if secret else None
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+@dataclass
+class Session:
+    """
+    The conversation state carried by the session cookie.
+
+    ``timestamps`` maps the IDs of user messages to their created_at, as in
+    the conversation metadata. ``pending`` is set when the session was issued
+    before a turn whose created_at is not in ``timestamps`` yet.
+    """
+    conversation_id: str
+    agent_id: str
+    conversation_created_at: int
+    timestamps: Dict[str, str] = field(default_factory=dict)
+    pending: bool = False
+    issued_at: int = 0
+
+    def to_conversation(self) -> "Conversation":
+        """Return the conversation as the Conversations API would, with the timestamps as its metadata."""
+        from openai.types.conversations import Conversation
+        return Conversation(
+            id=self.conversation_id,
+            created_at=self.conversation_created_at,
+            metadata={get_created_at_label(message_id): value for message_id, value in self.timestamps.items()},
+            object="conversation",
+        )
+
+
+class SessionCodec:
+    """
+    Signs and verifies the session cookie.
+
+    The cookie is the compact JSON of the session and its HMAC-SHA256,
+    both base64url encoded. The signature is checked before anything is
+    parsed, so a tampered cookie costs one HMAC; sessions older than
+    ``max_age`` are rejected too.
+
+    :param secret: The HMAC key, shared by all workers.
+    :param max_age: The time in seconds a session is accepted after it was issued.
+    :param max_timestamps: The maximal number of created_at timestamps in a session, the newest are kept.
+    """
+
+    def __init__(self, secret: bytes, max_age: float = 3600.0, max_timestamps: int = 16) -> None:
+        """Constructor."""
+        self._secret = secret
+        self._max_age = max_age
+        self._max_timestamps = max_timestamps
+        self.issued = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.expired = 0
+
+        self._sessions_counter = meter.create_counter(
+            "session.cookies", description="Session cookies read by result (accepted, rejected, expired)")
+
+    def _sign(self, payload: bytes) -> bytes:
+        return hmac.new(self._secret, payload, hashlib.sha256).digest()[:_SIGNATURE_SIZE]
+
+    def encode(self, session: Session) -> str:
+        """Return the signed cookie value of the session."""
+        payload = json.dumps([
+            session.conversation_id, session.agent_id, session.conversation_created_at,
+            session.issued_at, int(session.pending), session.timestamps
+        ], separators=(",", ":")).encode("utf-8")
+        self.issued += 1
+        return f"{_b64encode(payload)}.{_b64encode(self._sign(payload))}"
+
+    def issue(self, conversation: "Conversation", agent_id: str, pending: bool = False) -> str:
+        """
+        Return the cookie value of a new session of the conversation.
+
+        :param conversation: The conversation, whose metadata has the created_at timestamps.
+        :param agent_id: The ID of the agent version the conversation is used with.
+        :param pending: True if a turn was started whose created_at is not in the metadata yet.
+        """
+        timestamps = {
+            key[:-len(_CREATED_AT_SUFFIX)]: value for key, value in (conversation.metadata or {}).items()
+            if key.endswith(_CREATED_AT_SUFFIX)
+        }
+        if len(timestamps) > self._max_timestamps:
+            newest = sorted(timestamps, key=timestamps.get, reverse=True)[:self._max_timestamps]
+            timestamps = {message_id: timestamps[message_id] for message_id in newest}
+        return self.encode(Session(
+            conversation.id, agent_id, conversation.created_at, timestamps, pending, int(time.time())
+        ))
+
+    def decode(self, value: Optional[str]) -> Optional[Session]:
+        """Return the session of a cookie value, None if it is missing, tampered with or expired."""
+        if not value:
+            return None
+        try:
+            encoded_payload, encoded_signature = value.split(".")
+            payload = _b64decode(encoded_payload)
+            if not hmac.compare_digest(self._sign(payload), _b64decode(encoded_signature)):
+                raise ValueError("invalid signature")
+            conversation_id, agent_id, created_at, issued_at, pending, timestamps = json.loads(payload)
+            session = Session(conversation_id, agent_id, created_at, dict(timestamps), bool(pending), issued_at)
+        except (ValueError, TypeError, binascii.Error) as e:
+            self.rejected += 1
+            self._sessions_counter.add(1, {"result": "rejected"})
+            logger.debug(f"Rejected session cookie: {e}")
+            return None
+        if session.issued_at + self._max_age < time.time():
+            self.expired += 1
+            self._sessions_counter.add(1, {"result": "expired"})
+            return None
+        self.accepted += 1
+        self._sessions_counter.add(1, {"result": "accepted"})
+        return session
+
+    def stats(self) -> Dict[str, float]:
+        """Return the counters of the codec."""
+        return {
+            "issued": self.issued,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "expired": self.expired,
+        }
@@ -0,0 +1,162 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+import asyncio
+import json
+import time
+from typing import AsyncIterator, Callable, Dict, List, Optional, TypeVar
+
+try:
+    import orjson
+except ModuleNotFoundError:
+    orjson = None
+
+T = TypeVar("T")
+
+
+def dumps_json(data: Dict) -> bytes:
+    """Serialize to JSON bytes, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+
+def encode_sse_event(data: Dict, event_id: Optional[str] = None) -> bytes:
+    """Encode the event as a pre-encoded SSE ``data:`` frame, with an ``id:`` line if an ID is given."""
+    if event_id is not None:
+        return b"id: " + event_id.encode("ascii") + b"\ndata: " + dumps_json(data) + b"\n\n"
+    return b"data: " + dumps_json(data) + b"\n\n"
+
+
+class SSEEncoder:
+    """
+    Encoder of SSE frames, which coalesces ``message`` deltas.
+
+    Deltas are buffered until ``window`` seconds passed since the first buffered
+    delta or ``max_bytes`` of UTF-8 text are buffered, then they are sent as one
+    ``message`` event. Any other event flushes the buffer first, so the order of
+    events and the message/completed_message/stream_end contract are kept.
+
+    :param window: The coalescing time window in seconds. 0 disables coalescing.
+    :param max_bytes: The number of buffered bytes, which triggers a flush.
+    :param stream_id: If given, frames get the event IDs "<stream_id>:<n>", n counting from 1.
+    """
+
+    def __init__(self, window: float = 0.03, max_bytes: int = 1024, stream_id: Optional[str] = None) -> None:
+        """Constructor."""
+        self._window = window
+        self._max_bytes = max_bytes
+        self._stream_id = stream_id
+        self._buffer: List[str] = []
+        self._buffered_bytes = 0
+        self._first_buffered_at = 0.0
+        self._started_at = time.monotonic()
+        self.deltas = 0
+        self.frames = 0
+        self.bytes = 0
+
+    def _frame(self, data: Dict) -> bytes:
+        self.frames += 1
+        event_id = f"{self._stream_id}:{self.frames}" if self._stream_id else None
+        frame = encode_sse_event(data, event_id)
+        self.bytes += len(frame)
+        return frame
+
+    def message(self, delta: str) -> Optional[bytes]:
+        """
+        Add a text delta.
+
+        :param delta: The text delta.
+        :return: The encoded frame if the buffer should be sent now, otherwise None.
+        """
+        self.deltas += 1
+        if not self._buffer:
+            self._first_buffered_at = time.monotonic()
+        self._buffer.append(delta)
+        self._buffered_bytes += len(delta.encode("utf-8"))
+        if self._buffered_bytes >= self._max_bytes or self.time_until_due() == 0:
+            return self.flush()
+        return None
+
+    def event(self, data: Dict) -> bytes:
+        """Encode a non-delta event, preceded by the buffered deltas."""
+        pending = self.flush()
+        frame = self._frame(data)
+        return pending + frame if pending else frame
+
+    def flush(self) -> Optional[bytes]:
+        """Encode the buffered deltas as one message event."""
+        if not self._buffer:
+            return None
+        content = "".join(self._buffer)
+        self._buffer.clear()
+        self._buffered_bytes = 0
+        return self._frame({'content': content, 'type': "message"})
+
+    def time_until_due(self) -> Optional[float]:
+        """Return the seconds until the buffer must be flushed, or None if it is empty."""
+        if not self._buffer:
+            return None
+        return max(0.0, self._window - (time.monotonic() - self._first_buffered_at))
+
+    def stats(self) -> Dict[str, float]:
+        """Return frame statistics of the stream."""
+        elapsed = max(time.monotonic() - self._started_at, 1e-9)
+        return {
+            "deltas": self.deltas,
+            "frames": self.frames,
+            "bytes": self.bytes,
+            "frames_per_second": self.frames / elapsed,
+            "bytes_per_frame": self.bytes / self.frames if self.frames else 0.0,
+        }
+
+
+async def iterate_with_deadline(
+        events: AsyncIterator[T],
+        get_timeout: Callable[[], Optional[float]]) -> AsyncIterator[Optional[T]]:
+    """
+    Iterate over the events and yield None whenever the deadline passes without a new event.
+
+    The events are read by one background task, so a timeout never cancels a
+    pending read of the source.
+
+    :param events: The source of the events.
+    :param get_timeout: Returns the time to wait for the next event, or None to wait indefinitely.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    end = object()
+
+    async def read() -> None:
+        try:
+            async for event in events:
+                queue.put_nowait(event)
+        except Exception as e:
+            # Re-raised by the consumer.
+            queue.put_nowait(e)
+            return
+        queue.put_nowait(end)
+
+    reader = asyncio.create_task(read())
+    try:
+        while True:
+            if queue.empty():
+                timeout = get_timeout()
+                if timeout is not None:
+                    try:
+                        async with asyncio.timeout(timeout):
+                            item = await queue.get()
+                    except TimeoutError:
+                        yield None
+                        continue
+                else:
+                    item = await queue.get()
+            else:
+                item = queue.get_nowait()
+            if item is end:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        if not reader.done():
+            reader.cancel()
@@ -0,0 +1,129 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger("azureaiapp")
+
+
+class StepSkipped(Exception):
+    """A startup step did not run because a step it depends on failed."""
+
+
+@dataclass
+class _StepTiming:
+    start: float = 0.0
+    end: Optional[float] = None
+    status: str = "pending"
+
+
+class StartupSteps:
+    """
+    Runs the steps of initialize_resources as concurrent tasks and times them.
+
+    A step starts once the steps it runs ``after`` have finished, and is called
+    with their results. Its own timeout only starts then. If one of them
+    failed, the step is skipped and fails with StepSkipped. An optional step
+    which fails or times out logs a warning and returns None instead.
+
+    :param timeout: The default timeout of a step in seconds.
+    """
+
+    def __init__(self, timeout: float = 30.0) -> None:
+        """Constructor."""
+        self._timeout = timeout
+        self._started = time.perf_counter()
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._timings: Dict[str, _StepTiming] = {}
+
+    def start(
+            self,
+            name: str,
+            func: Callable[..., Awaitable[Any]],
+            after: Sequence[str] = (),
+            timeout: Optional[float] = None,
+            optional: bool = False) -> asyncio.Task:
+        """
+        Start a step.
+
+        :param name: The name of the step in the report.
+        :param func: The coroutine function of the step, called with the results of ``after``.
+        :param after: The names of the steps this one depends on.
+        :param timeout: The timeout of the step in seconds, the default if None.
+        :param optional: Return None instead of raising if the step fails.
+        """
+        dependencies = [self._tasks[dependency] for dependency in after]
+        timing = self._timings[name] = _StepTiming()
+
+        async def run() -> Any:
+            try:
+                results = [await dependency for dependency in dependencies]
+            except asyncio.CancelledError:
+                if not asyncio.current_task().cancelling():
+                    # A dependency was cancelled, not this step.
+                    timing.status = "skipped"
+                    raise StepSkipped(f"{name} depends on a step that was cancelled")
+                timing.status = "cancelled"
+                raise
+            except Exception as e:
+                timing.status = "skipped"
+                raise StepSkipped(f"{name} depends on a step that failed: {e}") from e
+            timing.start = time.perf_counter()
+            try:
+                async with asyncio.timeout(timeout if timeout is not None else self._timeout):
+                    result = await func(*results)
+            except asyncio.CancelledError:
+                timing.status = "cancelled"
+                raise
+            except Exception as e:
+                timing.status = "timeout" if isinstance(e, TimeoutError) else "failed"
+                if not optional:
+                    raise
+                logger.warning(f"Startup step {name} {timing.status}, continuing without it: {e!r}")
+                return None
+            finally:
+                timing.end = time.perf_counter()
+            timing.status = "ok"
+            return result
+
+        task = self._tasks[name] = asyncio.create_task(run(), name=f"startup:{name}")
+        # The failure is raised to whoever awaits the step; this only keeps asyncio from logging it.
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return task
+
+    async def result(self, name: str) -> Any:
+        """Wait for the step and return its result, or raise its exception."""
+        return await self._tasks[name]
+
+    def cancel(self, name: str) -> None:
+        """Cancel a step whose result is not needed any more."""
+        self._tasks[name].cancel()
+
+    async def close(self) -> None:
+        """Cancel the steps which are still running and wait for them."""
+        pending = [task for task in self._tasks.values() if not task.done()]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    def report(self) -> List[str]:
+        """Return one line per step with its status, start and duration, then the total."""
+        lines = []
+        for name, timing in self._timings.items():
+            if timing.end is None:
+                lines.append(f"{name}: {timing.status}")
+            else:
+                lines.append(
+                    f"{name}: {timing.status}, started at +{timing.start - self._started:.2f}s, "
+                    f"took {timing.end - timing.start:.2f}s")
+        lines.append(f"total: {time.perf_counter() - self._started:.2f}s")
+        return lines
+
+    def log_report(self) -> None:
+        """Log the report; the total is the time gunicorn waited before forking the workers."""
+        for line in self.report():
+            logger.info(f"Startup step {line}")
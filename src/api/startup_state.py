@@ -0,0 +1,103 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+import dataclasses
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+logger = logging.getLogger("azureaiapp")
+
+# The environment variables which decide which resources initialize_resources finds or creates.
+STARTUP_CONFIG_VARIABLES = (
+    "AZURE_EXISTING_AIPROJECT_ENDPOINT",
+    "AZURE_EXISTING_AGENT_ID",
+    "AZURE_AI_AGENT_NAME",
+    "AZURE_AI_AGENT_DEPLOYMENT_NAME",
+    "AZURE_AI_SEARCH_ENDPOINT",
+    "AZURE_AI_SEARCH_INDEX_NAME",
+    "AZURE_AI_EMBED_DEPLOYMENT_NAME",
+    "AZURE_AI_EMBED_DIMENSIONS",
+    "SEARCH_CONNECTION_ID",
+)
+
+# In the user's cache directory, which, unlike the temporary directory, survives a reboot. A container's
+# file system does not survive a restart, so STARTUP_STATE_FILE should be on a mounted volume there.
+DEFAULT_STARTUP_STATE_FILE = os.path.join(
+    os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "azureaiapp", "startup-state.json")
+
+
+def hash_values(*values: Optional[str]) -> str:
+    """Return a short hash of the values, None included."""
+    return hashlib.sha256(json.dumps(values).encode("utf-8")).hexdigest()[:32]
+
+
+def startup_config_hash(paths: Iterable[str], variables: Iterable[str] = STARTUP_CONFIG_VARIABLES) -> str:
+    """
+    Return the hash of the startup configuration: the environment variables
+    and the contents of the files uploaded to the vector store or the index.
+
+    :param paths: The files; a missing file is hashed as missing.
+    :param variables: The names of the environment variables.
+    """
+    digest = hashlib.sha256()
+    for name in variables:
+        digest.update(f"{name}={os.environ.get(name)}\0".encode("utf-8"))
+    for path in sorted(paths):
+        digest.update(f"{os.path.basename(path)}\0".encode("utf-8"))
+        try:
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(chunk)
+        except FileNotFoundError:
+            digest.update(b"\0missing")
+    return digest.hexdigest()
+
+
+@dataclass
+class StartupState:
+    """
+    The resources initialize_resources resolved, for the next start with the same configuration.
+    Each of them is checked to exist before it is used.
+    """
+    config_hash: str
+    agent_id: Optional[str] = None
+    vector_store_id: Optional[str] = None
+    index_name: Optional[str] = None
+    index_schema_hash: Optional[str] = None
+    eval_rule_id: Optional[str] = None
+    updated_at: float = 0.0
+
+
+def load_startup_state(path: str, config_hash: str) -> Optional[StartupState]:
+    """Return the state saved at the path, or None if there is none, it is unreadable or the configuration changed."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            state = StartupState(**json.load(f))
+    except FileNotFoundError:
+        return None
+    except (OSError, TypeError, ValueError) as e:
+        logger.warning(f"Ignoring the startup state in {path}: {e}")
+        return None
+    if state.config_hash != config_hash:
+        logger.info("The configuration changed since the startup state was saved, ignoring it.")
+        return None
+    return state
+
+
+def save_startup_state(path: str, state: StartupState) -> None:
+    """Write the state to the path; the file is replaced at once, so a reader never sees half of it."""
+    state.updated_at = time.time()
+    directory = os.path.dirname(path) or "."
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile("w", dir=directory, delete=False, encoding="utf-8") as f:
+            json.dump(dataclasses.asdict(state), f)
+        os.replace(f.name, path)
+    except OSError as e:
+        logger.warning(f"Could not save the startup state to {path}: {e}")
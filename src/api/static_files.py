@@ -0,0 +1,282 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import stat
+import sys
+from dataclasses import dataclass, field
+from email.utils import formatdate
+from typing import Dict, List, Optional, Set, Tuple
+
+import anyio
+from fastapi.templating import Jinja2Templates
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+from .cache import TTLCache
+from .compression import select_encoding
+
+try:
+    import brotli
+except ModuleNotFoundError:
+    brotli = None
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+# The build-time variants, next to the file: main.js.br and main.js.gz.
+PRECOMPRESSED_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+COMPRESSIBLE_MEDIA_TYPES = (
+    "text/", "application/javascript", "application/json", "application/manifest+json",
+    "application/xml", "image/svg+xml", "application/wasm",
+)
+
+
+def is_compressible(media_type: str) -> bool:
+    return media_type.startswith(COMPRESSIBLE_MEDIA_TYPES)
+
+
+def guess_media_type(path: str) -> str:
+    return mimetypes.guess_type(path)[0] or "text/plain"
+
+
+def compress(body: bytes, encoding: str, best: bool = False) -> bytes:
+    """Compress the body; ``best`` is for the build, the default is cheap enough for a worker."""
+    if encoding == "br":
+        return brotli.compress(body, quality=11 if best else 5)
+    return gzip.compress(body, compresslevel=9 if best else 6, mtime=0)
+
+
+@dataclass
+class StaticAsset:
+    """
+    A response body held in memory with its compressed variants.
+
+    The ETag is derived from the content, so it is the same in every worker
+    and instance, and differs per encoding.
+    """
+    body: bytes
+    media_type: str
+    cache_control: str
+    digest: str
+    variants: Dict[str, bytes] = field(default_factory=dict)
+    last_modified: Optional[str] = None
+
+    @classmethod
+    def from_bytes(
+            cls,
+            body: bytes,
+            media_type: str,
+            cache_control: str,
+            variants: Optional[Dict[str, bytes]] = None,
+            last_modified: Optional[float] = None,
+            minimum_size: int = 500) -> "StaticAsset":
+        """
+        Create the asset, compressing the body if no variants are given and it is worth it.
+
+        :param body: The uncompressed body.
+        :param media_type: The media type of the body.
+        :param cache_control: The Cache-Control header of the responses.
+        :param variants: The compressed bodies by encoding, e.g. read from the build output.
+        :param last_modified: The modification time of the file, if it is one.
+        :param minimum_size: The minimal size of a body to be compressed.
+        """
+        if variants is None:
+            variants = {}
+            if is_compressible(media_type) and len(body) >= minimum_size:
+                for encoding in ("br", "gzip") if brotli is not None else ("gzip",):
+                    compressed = compress(body, encoding)
+                    if len(compressed) < len(body):
+                        variants[encoding] = compressed
+        return cls(
+            body=body,
+            media_type=media_type,
+            cache_control=cache_control,
+            digest=hashlib.sha256(body).hexdigest()[:20],
+            variants=variants,
+            last_modified=formatdate(last_modified, usegmt=True) if last_modified is not None else None,
+        )
+
+    def response(self, request_headers: Headers) -> Response:
+        """Return the variant accepted by the request, or 304 if the client has it."""
+        encoding = select_encoding(request_headers.get("accept-encoding", ""), self.variants) if self.variants else None
+        etag = f'"{self.digest}-{encoding}"' if encoding else f'"{self.digest}"'
+        headers = {"ETag": etag, "Cache-Control": self.cache_control}
+        if encoding:
+            # CompressionMiddleware adds Vary to the uncompressed responses it passes on.
+            headers["Vary"] = "Accept-Encoding"
+        if self.last_modified:
+            headers["Last-Modified"] = self.last_modified
+        if etag in [tag.strip(" W/") for tag in request_headers.get("if-none-match", "").split(",")]:
+            return NotModifiedResponse(Headers(headers))
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        return Response(self.variants[encoding] if encoding else self.body, media_type=self.media_type, headers=headers)
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    StaticFiles serving build-time brotli and gzip variants, with hot files kept in memory.
+
+    Files up to ``max_file_size`` are read once, together with their ``.br``
+    and ``.gz`` siblings if the build wrote them, or compressed on load
+    otherwise, and answered from memory until they expire from the cache.
+    The files in ``immutable`` have hashed names and are cached by browsers
+    for a year; the others are revalidated with their ETag.
+    Larger files and range requests are served by StaticFiles.
+
+    :param directory: The directory of the files.
+    :param immutable: The paths, relative to the directory, of the files with hashed names.
+    :param cache_size: The maximal number of files in memory. 0 disables the cache.
+    :param cache_ttl: The time in seconds a file stays in memory.
+    :param max_file_size: The maximal size of a file kept in memory.
+    """
+
+    def __init__(
+            self,
+            directory: str,
+            immutable: Optional[Set[str]] = None,
+            cache_size: int = 256,
+            cache_ttl: float = 300.0,
+            max_file_size: int = 1024 * 1024) -> None:
+        """Constructor."""
+        super().__init__(directory=directory)
+        self._immutable = immutable or set()
+        self._max_file_size = max_file_size
+        self._assets: TTLCache[str, StaticAsset] = TTLCache(max_size=cache_size, ttl=cache_ttl)
+
+    def cache_control(self, path: str) -> str:
+        return IMMUTABLE_CACHE_CONTROL if path.replace(os.sep, "/") in self._immutable else REVALIDATE_CACHE_CONTROL
+
+    def _load(self, path: str) -> Optional[StaticAsset]:
+        full_path, stat_result = self.lookup_path(path)
+        if not stat_result or not stat.S_ISREG(stat_result.st_mode) or stat_result.st_size > self._max_file_size:
+            return None
+        with open(full_path, "rb") as f:
+            body = f.read()
+        variants: Optional[Dict[str, bytes]] = None
+        for encoding, suffix in PRECOMPRESSED_SUFFIXES.items():
+            if encoding == "br" and brotli is None:
+                continue
+            try:
+                variant_stat = os.stat(full_path + suffix)
+                if variant_stat.st_mtime < stat_result.st_mtime:
+                    continue
+                with open(full_path + suffix, "rb") as f:
+                    variants = {**(variants or {}), encoding: f.read()}
+            except FileNotFoundError:
+                pass
+        return StaticAsset.from_bytes(
+            body, guess_media_type(full_path), self.cache_control(path), variants, stat_result.st_mtime
+        )
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        request_headers = Headers(scope=scope)
+        if self._assets.enabled and scope["method"] in ("GET", "HEAD") and "range" not in request_headers:
+            asset = self._assets.get(path)
+            if asset is None:
+                try:
+                    asset = await anyio.to_thread.run_sync(self._load, path)
+                except OSError:
+                    asset = None
+                if asset is not None:
+                    self._assets.set(path, asset)
+            if asset is not None:
+                return asset.response(request_headers)
+        return await super().get_response(path, scope)
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200) -> Response:
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        path = os.path.relpath(full_path, self.directory) if self.directory else ""
+        response.headers["Cache-Control"] = self.cache_control(path)
+        return response
+
+    def stats(self) -> Dict[str, float]:
+        """Return the counters of the in-memory cache."""
+        return self._assets.stats()
+
+
+def load_vite_manifest(build_directory: str) -> Dict[str, Dict]:
+    """Return the manifest of the Vite build in the directory, empty if there is none."""
+    for name in (os.path.join(".vite", "manifest.json"), "manifest.json"):
+        try:
+            with open(os.path.join(build_directory, name), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            continue
+    return {}
+
+
+def get_hashed_files(manifest: Dict[str, Dict], prefix: str = "") -> Set[str]:
+    """Return the paths of the files the Vite build gave hashed names, prefixed by ``prefix``."""
+    files = set()
+    for chunk in manifest.values():
+        for path in [chunk.get("file")] + chunk.get("css", []) + chunk.get("assets", []):
+            if path:
+                files.add(prefix + path)
+    return files
+
+
+def get_entry_files(manifest: Dict[str, Dict]) -> Tuple[Optional[str], List[str]]:
+    """Return the script and the stylesheets of the entry chunk of the Vite build."""
+    for chunk in manifest.values():
+        if chunk.get("isEntry"):
+            stylesheets = list(chunk.get("css", []))
+            if not stylesheets:
+                # With cssCodeSplit disabled the stylesheet is not attached to the entry.
+                stylesheets = [c["file"] for c in manifest.values() if c.get("file", "").endswith(".css")]
+            return chunk["file"], stylesheets
+    return None, []
+
+
+def render_index_page(templates: Jinja2Templates, manifest: Dict[str, Dict], base_url: str) -> StaticAsset:
+    """
+    Render index.html once, with the hashed file names of the Vite build.
+    Without a manifest the fixed names of earlier builds are used.
+    """
+    script, stylesheets = get_entry_files(manifest)
+    body = templates.get_template("index.html").render(
+        script=base_url + (script or "assets/main-react-app.js"),
+        stylesheets=[base_url + path for path in stylesheets] or [base_url + "assets/main-react-app.css"],
+    ).encode("utf-8")
+    return StaticAsset.from_bytes(body, "text/html", REVALIDATE_CACHE_CONTROL, minimum_size=0)
+
+
+def precompress_directory(directory: str, minimum_size: int = 1024) -> int:
+    """
+    Write the .br and .gz variants of the compressible files in the directory,
+    at the best compression levels; run after the frontend build.
+    Returns the number of variants written.
+    """
+    written = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            path = os.path.join(root, name)
+            if name.endswith(tuple(PRECOMPRESSED_SUFFIXES.values())) or not is_compressible(guess_media_type(path)):
+                continue
+            with open(path, "rb") as f:
+                body = f.read()
+            if len(body) < minimum_size:
+                continue
+            for encoding, suffix in PRECOMPRESSED_SUFFIXES.items():
+                if encoding == "br" and brotli is None:
+                    continue
+                compressed = compress(body, encoding, best=True)
+                if len(compressed) < len(body):
+                    with open(path + suffix, "wb") as f:
+                        f.write(compressed)
+                    written += 1
+    return written
+
+
+if __name__ == "__main__":
+    # python -m api.static_files api/static
+    target = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(__file__), "static")
+    print(f"Wrote {precompress_directory(target)} compressed variants in {target}")
@@ -0,0 +1,201 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+import openai
+from openai import AsyncOpenAI
+
+logger = logging.getLogger("azureaiapp")
+
+
+class FileIndexingError(RuntimeError):
+    """The vector store could not index a file."""
+
+
+# The errors after which a file is tried again.
+RETRIABLE_ERRORS = (
+    openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError, FileIndexingError,
+)
+
+
+def file_digest(path: str) -> str:
+    """Return the sha256 of the file contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def manifest_hash(manifest: Dict[str, str]) -> str:
+    """Return the hash of a manifest, the file digests by file name."""
+    return hashlib.sha256(
+        "\n".join(f"{name}\0{digest}" for name, digest in sorted(manifest.items())).encode("utf-8")
+    ).hexdigest()
+
+
+@dataclass
+class _FileTiming:
+    status: str = "pending"
+    seconds: float = 0.0
+    attempts: int = 0
+
+
+class VectorStoreUploader:
+    """
+    Keeps a vector store with the contents of a set of files, uploading only what changed.
+
+    Each file in the vector store carries the sha256 of its contents as an
+    attribute, and the vector store carries the hash of all of them, the
+    manifest, in its metadata once every file was added. A vector store with
+    the same manifest is reused as is. Otherwise a new vector store is
+    created: the files whose contents are in the previous vector store of the
+    corpus are added by their file ID, and only the new or changed files are
+    uploaded, ``concurrency`` at a time, each tried up to ``retries`` times.
+    The previous vector store is kept, since older agent versions may use it.
+
+    :param openai_client: The OpenAI client of the project.
+    :param corpus: The name of the vector stores of this set of files.
+    :param concurrency: The maximal number of files uploaded at the same time.
+    :param retries: The number of times a file is tried after a transient error.
+    :param backoff: The wait in seconds before the first retry, doubled for each next one.
+    """
+
+    def __init__(
+            self,
+            openai_client: AsyncOpenAI,
+            corpus: str = "agent-files",
+            concurrency: int = 4,
+            retries: int = 3,
+            backoff: float = 1.0) -> None:
+        """Constructor."""
+        self._client = openai_client
+        self._corpus = corpus
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        self._retries = retries
+        self._backoff = backoff
+        self._timings: Dict[str, _FileTiming] = {}
+
+    async def sync(self, paths: Sequence[str], vector_store_id: Optional[str] = None) -> str:
+        """
+        Return the ID of a vector store with the contents of the files.
+
+        :param paths: The files, named in the vector store by their base name.
+        :param vector_store_id: The vector store used last, if known; otherwise the latest of the corpus.
+        :raises: The error of the first file which could not be added.
+        """
+        paths_by_name = {os.path.basename(path): path for path in paths}
+        digests = await asyncio.gather(*[asyncio.to_thread(file_digest, path) for path in paths_by_name.values()])
+        manifest = dict(zip(paths_by_name, digests))
+        expected = manifest_hash(manifest)
+
+        previous = await self._find_previous(vector_store_id)
+        if previous is not None and (previous.metadata or {}).get("manifest") == expected:
+            logger.info(f"Vector store {previous.id} has the same files, no upload needed.")
+            for name in manifest:
+                self._timings[name] = _FileTiming(status="unchanged")
+            return previous.id
+        existing = await self._list_digests(previous.id) if previous is not None else {}
+
+        vector_store = await self._client.vector_stores.create(
+            name=self._corpus, metadata={"corpus": self._corpus})
+        results = await asyncio.gather(
+            *[self._add_file(vector_store.id, name, paths_by_name[name], digest, existing.get(digest))
+              for name, digest in manifest.items()],
+            return_exceptions=True)
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors:
+            raise errors[0]
+        # Only now the vector store is complete, so it can be matched by its manifest.
+        await self._client.vector_stores.update(
+            vector_store.id, metadata={"corpus": self._corpus, "manifest": expected})
+        return vector_store.id
+
+    async def _find_previous(self, vector_store_id: Optional[str]) -> Optional[Any]:
+        if vector_store_id:
+            try:
+                vector_store = await self._client.vector_stores.retrieve(vector_store_id)
+                if vector_store.status == "completed":
+                    return vector_store
+            except openai.NotFoundError:
+                logger.info(f"Vector store {vector_store_id} was deleted.")
+        async for vector_store in self._client.vector_stores.list(order="desc", limit=100):
+            metadata = vector_store.metadata or {}
+            if metadata.get("corpus") == self._corpus and metadata.get("manifest") and vector_store.status == "completed":
+                return vector_store
+        return None
+
+    async def _list_digests(self, vector_store_id: str) -> Dict[str, str]:
+        """Return the IDs of the files in the vector store by their digest."""
+        existing = {}
+        async for vector_store_file in self._client.vector_stores.files.list(
+                vector_store_id, filter="completed", limit=100):
+            digest = (vector_store_file.attributes or {}).get("sha256")
+            if digest:
+                existing[digest] = vector_store_file.id
+        return existing
+
+    async def _add_file(self, vector_store_id: str, name: str, path: str, digest: str, file_id: Optional[str]) -> None:
+        timing = self._timings[name] = _FileTiming()
+        attributes = {"file_name": name, "sha256": digest}
+
+        async def upload() -> str:
+            with open(path, "rb") as f:
+                return (await self._client.files.create(file=(name, f), purpose="assistants")).id
+
+        async def add() -> None:
+            nonlocal file_id
+            if file_id is None:
+                file_id = await upload()
+            vector_store_file = await self._client.vector_stores.files.create_and_poll(
+                file_id, vector_store_id=vector_store_id, attributes=attributes)
+            if vector_store_file.status != "completed":
+                raise FileIndexingError(f"{vector_store_file.status}: {vector_store_file.last_error}")
+
+        async with self._semaphore:
+            start = time.perf_counter()
+            timing.status = "reused" if file_id else "uploaded"
+            try:
+                await self._retry(name, timing, add)
+            except Exception as e:
+                timing.status = "failed"
+                logger.error(f"Could not add {name} to vector store {vector_store_id}: {e}")
+                raise
+            finally:
+                timing.seconds = time.perf_counter() - start
+
+    async def _retry(self, name: str, timing: _FileTiming, func: Callable[[], Awaitable[None]]) -> None:
+        for attempt in range(self._retries + 1):
+            timing.attempts = attempt + 1
+            try:
+                return await func()
+            except RETRIABLE_ERRORS as e:
+                if attempt == self._retries:
+                    raise
+                delay = self._backoff * 2 ** attempt
+                logger.warning(f"Adding {name} failed, retrying in {delay:.1f}s: {e!r}")
+                await asyncio.sleep(delay)
+
+    def report(self) -> List[str]:
+        """Return one line per file with its status, duration and attempts, then the counts."""
+        lines = [
+            f"{name}: {timing.status}, took {timing.seconds:.2f}s"
+            + (f" in {timing.attempts} attempts" if timing.attempts > 1 else "")
+            for name, timing in self._timings.items()
+        ]
+        counts: Dict[str, int] = {}
+        for timing in self._timings.values():
+            counts[timing.status] = counts.get(timing.status, 0) + 1
+        lines.append(", ".join(f"{status}: {count}" for status, count in sorted(counts.items())))
+        return lines
+
+    def log_report(self) -> None:
+        for line in self.report():
+            logger.info(f"Vector store file {line}")
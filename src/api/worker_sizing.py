@@ -0,0 +1,192 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
+
+import math
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+
+# The cgroup v1 CPU controller is mounted on its own or together with cpuacct; "cpu" is often
+# only a symlink to the combined directory, which some container runtimes do not create.
+_CGROUP_V1_CPU_DIRS = ("cpu", "cpu,cpuacct", "cpuacct,cpu")
+
+# cgroup v1 reports no memory limit as a number close to the maximal int64.
+_UNLIMITED_MEMORY = 1 << 60
+
+# The peak RSS of a worker relative to the RSS of the master with the app preloaded. Measured with
+# tests/benchmarks/bench_workers.py --users 64: a worker serving 32 streams against the stub peaked
+# at 147 MB, the master with the app and the SDKs imported was at 99 MB. Answers with long
+# conversations or large citations need more; measure them and set WORKER_RSS_MB.
+DEFAULT_WORKER_RSS_GROWTH = 1.5
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def get_cpu_count() -> int:
+    """Return the number of CPUs the process may run on."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def read_cpu_quota(root: str = CGROUP_ROOT) -> Optional[float]:
+    """Return the CPU quota of the container in CPUs, from cgroup v2 or v1, or None if there is none."""
+    cpu_max = _read(os.path.join(root, "cpu.max"))
+    if cpu_max:
+        quota, _, period = cpu_max.partition(" ")
+        if quota != "max" and period:
+            return int(quota) / int(period)
+        return None
+    for directory in _CGROUP_V1_CPU_DIRS:
+        quota = _read(os.path.join(root, directory, "cpu.cfs_quota_us"))
+        period = _read(os.path.join(root, directory, "cpu.cfs_period_us"))
+        if quota and period:
+            return int(quota) / int(period) if int(quota) > 0 else None
+    return None
+
+
+def read_memory_limit(root: str = CGROUP_ROOT) -> Optional[int]:
+    """Return the memory limit of the container in bytes, from cgroup v2 or v1, or None if there is none."""
+    limit = _read(os.path.join(root, "memory.max")) or _read(os.path.join(root, "memory", "memory.limit_in_bytes"))
+    if not limit or limit == "max" or int(limit) >= _UNLIMITED_MEMORY:
+        return None
+    return int(limit)
+
+
+def get_physical_memory() -> Optional[int]:
+    try:
+        return os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def get_rss(pid: str = "self") -> Optional[int]:
+    """Return the resident set size of the process in bytes."""
+    status = _read(f"/proc/{pid}/status")
+    for line in (status or "").splitlines():
+        if line.startswith("VmRSS:"):
+            return int(line.split()[1]) * 1024
+    return None
+
+
+@dataclass
+class WorkerPlan:
+    """
+    The number of workers and the limits of each, see plan_workers.
+    ``limited_by`` tells which resource decided the number of workers.
+    """
+    workers: int
+    cpus: float
+    memory: Optional[int]
+    worker_rss: int
+    limited_by: str
+    max_active_streams: int
+    max_queued_streams: int
+    openai_max_connections: int
+
+    def environment(self) -> Dict[str, str]:
+        """Return the per-worker limits as the environment variables read by the app."""
+        return {
+            "CHAT_MAX_ACTIVE_STREAMS": str(self.max_active_streams),
+            "CHAT_MAX_QUEUED_STREAMS": str(self.max_queued_streams),
+            "OPENAI_MAX_CONNECTIONS": str(self.openai_max_connections),
+        }
+
+    def describe(self) -> List[str]:
+        memory = f"{self.memory / 2**20:.0f} MB" if self.memory else "unknown"
+        return [
+            f"{self.workers} workers, limited by {self.limited_by} "
+            f"(cpus: {self.cpus:g}, memory: {memory}, worker rss: {self.worker_rss / 2**20:.0f} MB)",
+            f"per worker: {self.max_active_streams} active streams, {self.max_queued_streams} queued, "
+            f"{self.openai_max_connections} OpenAI connections",
+        ]
+
+
+def plan_workers(
+        cpus: float,
+        memory: Optional[int],
+        worker_rss: int,
+        master_rss: int = 0,
+        workers_per_cpu: float = 1.0,
+        memory_fraction: float = 0.75,
+        streams_per_cpu: int = 32,
+        workers: Optional[int] = None) -> WorkerPlan:
+    """
+    Size the uvicorn workers to the CPUs and the memory of the container.
+
+    The workers are asynchronous, so one per CPU keeps the CPUs busy; more
+    only cost memory. As many are started as fit in ``memory_fraction`` of
+    the memory next to the master. The streams of the CPUs are divided among
+    the workers, so fewer workers each take more streams.
+
+    :param cpus: The CPUs available, e.g. the CPU quota of the container.
+    :param memory: The memory available in bytes, or None if unknown.
+    :param worker_rss: The memory a worker is expected to use in bytes.
+    :param master_rss: The memory of the gunicorn master in bytes.
+    :param workers_per_cpu: The workers started per CPU.
+    :param memory_fraction: The part of the memory the processes may use.
+    :param streams_per_cpu: The concurrent chat streams per CPU.
+    :param workers: The number of workers, if set by the operator; only the limits are derived then.
+    """
+    if workers:
+        limited_by = "configuration"
+    else:
+        workers, limited_by = max(1, math.ceil(cpus * workers_per_cpu)), "cpu"
+        if memory:
+            memory_workers = max(1, int((memory * memory_fraction - master_rss) // max(worker_rss, 1)))
+            if memory_workers < workers:
+                workers, limited_by = memory_workers, "memory"
+    max_active_streams = max(1, math.ceil(streams_per_cpu * max(cpus, 1) / workers))
+    return WorkerPlan(
+        workers=workers,
+        cpus=cpus,
+        memory=memory,
+        worker_rss=worker_rss,
+        limited_by=limited_by,
+        max_active_streams=max_active_streams,
+        max_queued_streams=2 * max_active_streams,
+        # Each stream holds a connection; the rest serve the other calls of the requests.
+        openai_max_connections=max(100, 3 * max_active_streams),
+    )
+
+
+def plan_from_environment(master_rss: Optional[int] = None, workers: Optional[int] = None) -> WorkerPlan:
+    """
+    Plan the workers for this container, see plan_workers.
+
+    The CPUs are the CPU quota of the cgroup, or the CPUs of the process, and
+    the memory the memory limit of the cgroup, or the physical memory.
+    A worker is expected to grow to WORKER_RSS_GROWTH times the RSS of the
+    master with the app preloaded, see DEFAULT_WORKER_RSS_GROWTH, unless
+    WORKER_RSS_MB sets it.
+    WEB_CONCURRENCY or ``workers`` set the number of workers; the limits are still derived.
+    """
+    cpu_count = get_cpu_count()
+    quota = read_cpu_quota()
+    cpus = min(quota, cpu_count) if quota else float(cpu_count)
+    memory = read_memory_limit() or get_physical_memory()
+    if master_rss is None:
+        master_rss = get_rss() or 0
+    if os.getenv("WORKER_RSS_MB"):
+        worker_rss = int(float(os.environ["WORKER_RSS_MB"]) * 2**20)
+    else:
+        worker_rss = int(master_rss * float(os.getenv("WORKER_RSS_GROWTH", str(DEFAULT_WORKER_RSS_GROWTH)))) or 256 * 2**20
+    return plan_workers(
+        cpus,
+        memory,
+        worker_rss,
+        master_rss=master_rss,
+        workers_per_cpu=float(os.getenv("WORKERS_PER_CPU", "1")),
+        memory_fraction=float(os.getenv("WORKER_MEMORY_FRACTION", "0.75")),
+        streams_per_cpu=int(os.getenv("CHAT_STREAMS_PER_CPU", "32")),
+        workers=workers or int(os.getenv("WEB_CONCURRENCY", "0")) or None,
+    )
@@ -86,6 +86,10 @@ const preprocessContent = (
   return processedContent;
 };
 
+const sameAnnotations = (a: IAnnotation[], b: IAnnotation[]): boolean =>
+  a.length === b.length &&
+  a.every((annotation, i) => annotation.label === b[i].label && annotation.index === b[i].index);
+
 const formatTimestampToLocalTime = (timestampStr: string): string => {
   // Convert timestamp string to local timezone with specific format
   let localTime = new Date().toLocaleString();
@@ -270,6 +274,24 @@ export function AgentPreview({ agentDetails }: IAgentPreviewProps): ReactNode {
     }
   };
 
+  // Reconnect to an interrupted stream, continuing after the last received event.
+  const resumeStream = async (
+    lastEventId: string
+  ): Promise<ReadableStream<Uint8Array<ArrayBufferLike>> | null> => {
+    const response = await fetch("/chat", {
+      method: "POST",
+      headers: {
+        "Last-Event-ID": lastEventId,
+      },
+      credentials: "include",
+    });
+    // 204 means the stream cannot be resumed anymore.
+    if (response.status === 204 || !response.ok || !response.body) {
+      return null;
+    }
+    return response.body;
+  };
+
   const handleMessages = (
     stream: ReadableStream<Uint8Array<ArrayBufferLike>>
   ) => {
@@ -280,13 +302,44 @@ export function AgentPreview({ agentDetails }: IAgentPreviewProps): ReactNode {
     let annotations: IAnnotation[] = [];
     let hasReceivedCompletedMessage = false;
 
+    let lastEventId: string | null = null;
+    let pendingEventId: string | null = null;
+    let streamEnded = false;
+    let retries = 0;
+    const maxRetries = 3;
+
     // Create a reader for the SSE stream
-    const reader = stream.getReader();
-    const decoder = new TextDecoder();
+    let reader = stream.getReader();
+    let decoder = new TextDecoder();
 
     const readStream = async () => {
       while (true) {
-        const { done, value } = await reader.read();
+        let result: ReadableStreamReadResult<Uint8Array<ArrayBufferLike>>;
+        try {
+          result = await reader.read();
+          if (result.done && !streamEnded && lastEventId) {
+            throw new Error("SSE stream closed before the stream end marker.");
+          }
+        } catch (error) {
+          if (streamEnded || !lastEventId || retries >= maxRetries) {
+            throw error;
+          }
+          retries += 1;
+          console.warn(
+            `[ChatClient] Stream interrupted, resuming after ${lastEventId} (attempt ${retries}).`,
+            error
+          );
+          await new Promise((resolve) => setTimeout(resolve, 1000 * retries));
+          const resumed = await resumeStream(lastEventId).catch(() => null);
+          if (!resumed) {
+            throw error;
+          }
+          reader = resumed.getReader();
+          decoder = new TextDecoder();
+          buffer = "";
+          continue;
+        }
+        const { done, value } = result;
         if (done) {
           console.log("[ChatClient] SSE stream ended by server.");
           break;
@@ -306,7 +359,9 @@ export function AgentPreview({ agentDetails }: IAgentPreviewProps): ReactNode {
 
           console.log("[ChatClient] SSE line:", chunk); // log each line we extract
 
-          if (chunk.startsWith("data: ")) {
+          if (chunk.startsWith("id: ")) {
+            pendingEventId = chunk.slice(4);
+          } else if (chunk.startsWith("data: ")) {
             // Attempt to parse JSON
             const jsonStr = chunk.slice(6);
             let data;
@@ -319,16 +374,27 @@ export function AgentPreview({ agentDetails }: IAgentPreviewProps): ReactNode {
             }
 
             console.log("[ChatClient] Parsed SSE event:", data);
+            if (pendingEventId) {
+              lastEventId = pendingEventId;
+              pendingEventId = null;
+            }
 
             // Check the data type to decide how to update the UI
             if (data.type === "stream_end") {
               // End of the stream
               console.log("[ChatClient] Stream end marker received.");
+              streamEnded = true;
               setIsResponding(false);
               break;
             } else if (data.type === "thread_run") {
               // Log the run status info
               console.log("[ChatClient] Run status info:", data.content);
+            } else if (data.type === "citation") {
+              // Citations arrive while the message streams, before its completed_message.
+              annotations = [...annotations, { label: data.label, index: data.index }];
+              if (chatItem && !hasReceivedCompletedMessage) {
+                appendAssistantMessage(chatItem, accumulatedContent, true, annotations);
+              }
             } else {
               // If we have no messageDiv yet, create one
               if (!chatItem) {
@@ -350,6 +416,17 @@ export function AgentPreview({ agentDetails }: IAgentPreviewProps): ReactNode {
                   // Reset for the new message
                   accumulatedContent = data.content;
                   annotations = data.annotations || [];
+                } else if (
+                  data.content === accumulatedContent &&
+                  sameAnnotations(annotations, data.annotations || [])
+                ) {
+                  // The streamed text and citations are already shown, so the message is not rendered again.
+                  hasReceivedCompletedMessage = true;
+                  isStreaming = false;
+                  setIsResponding(false);
+                  scrollToMessage(chatItem);
+                  boundary = buffer.indexOf("\n");
+                  continue;
                 } else {
                   // First completed message in this stream
                   clearAssistantMessage(chatItem);
@@ -407,6 +484,7 @@ export function AgentPreview({ agentDetails }: IAgentPreviewProps): ReactNode {
     // Catch errors from the stream reading process
     readStream().catch((error) => {
       console.error("[ChatClient] Stream reading failed:", error);
+      setIsResponding(false);
     });
   };
 
@@ -444,21 +522,25 @@ export function AgentPreview({ agentDetails }: IAgentPreviewProps): ReactNode {
         return [...prev.slice(0, -1), { ...chatItem }];
       });
 
-      // Use requestAnimationFrame to ensure the DOM has updated before scrolling
       // Only scroll if stop streaming
       if (!isStreaming) {
-        requestAnimationFrame(() => {
-          const lastChild = document.getElementById(`msg-${chatItem.id}`);
-          if (lastChild) {
-            lastChild.scrollIntoView({ behavior: "smooth", block: "end" });
-          }
-        });
+        scrollToMessage(chatItem);
       }
     } catch (error) {
       console.error("Error in appendAssistantMessage:", error);
     }
   };
 
+  const scrollToMessage = (chatItem: IChatItem) => {
+    // Use requestAnimationFrame to ensure the DOM has updated before scrolling
+    requestAnimationFrame(() => {
+      const lastChild = document.getElementById(`msg-${chatItem.id}`);
+      if (lastChild) {
+        lastChild.scrollIntoView({ behavior: "smooth", block: "end" });
+      }
+    });
+  };
+
   const clearAssistantMessage = (chatItem: IChatItem) => {
     if (chatItem) {
       chatItem.content = "";
@@ -19,13 +19,14 @@ export default defineConfig({
         main: "./src/main.tsx",
       },
       output: {
-        entryFileNames: "assets/main-react-app.js",
-        chunkFileNames: "assets/[name].js",
+        // Hashed names, so the files can be cached for good; index.html gets them from the manifest.
+        entryFileNames: "assets/main-react-app-[hash].js",
+        chunkFileNames: "assets/[name]-[hash].js",
         assetFileNames: (assetInfo) => {
           if (assetInfo.name === "style.css") {
-            return "assets/main-react-app.css";
+            return "assets/main-react-app-[hash].css";
           }
-          return "assets/[name][extname]";
+          return "assets/[name]-[hash][extname]";
         },
       },
     },
@@ -4,8 +4,8 @@
 from typing import Dict, List, Optional
 
 import asyncio
-import multiprocessing
 import os
+import secrets
 
 from azure.ai.projects.aio import AIProjectClient
 from azure.ai.projects.models import ConnectionType, ApiKeyCredentials, AgentVersionObject
@@ -26,6 +26,16 @@ from azure.ai.projects.models import (
 
 from openai import AsyncOpenAI
 from dotenv import load_dotenv
+from api.startup import StartupSteps
+from api.worker_sizing import plan_from_environment
+from api.startup_state import (
+    DEFAULT_STARTUP_STATE_FILE,
+    StartupState,
+    hash_values,
+    load_startup_state,
+    save_startup_state,
+    startup_config_hash,
+)
 from logging_config import configure_logging
 from util import get_env_file_path
 
@@ -51,9 +61,31 @@ def list_files_in_files_directory() -> List[str]:
 
 FILES_NAMES = list_files_in_files_directory()
 
+# The timeout of the lookups of initialize_resources, and of the steps creating resources.
+STARTUP_STEP_TIMEOUT = float(os.getenv("STARTUP_STEP_TIMEOUT", "30"))
+STARTUP_CREATE_TIMEOUT = float(os.getenv("STARTUP_CREATE_TIMEOUT", "600"))
+# The resources resolved by the last start, see api.startup_state. An empty value disables it.
+STARTUP_STATE_FILE = os.getenv("STARTUP_STATE_FILE", DEFAULT_STARTUP_STATE_FILE)
+VECTOR_STORE_UPLOAD_CONCURRENCY = int(os.getenv("VECTOR_STORE_UPLOAD_CONCURRENCY", "4"))
+
+
+async def search_index_exists(endpoint: str, creds: AsyncTokenCredential, index_name: str) -> bool:
+    """Return True if the search index exists."""
+    from azure.core.exceptions import ResourceNotFoundError
+    from azure.search.documents.indexes.aio import SearchIndexClient
+    async with SearchIndexClient(endpoint=endpoint, credential=creds) as ix_client:
+        try:
+            await ix_client.get_index(index_name)
+            return True
+        except ResourceNotFoundError:
+            return False
+
 
 async def create_index_maybe(
-        ai_client: AIProjectClient, creds: AsyncTokenCredential) -> None:
+        ai_client: AIProjectClient,
+        creds: AsyncTokenCredential,
+        steps: StartupSteps,
+        state: StartupState) -> None:
     """
     Create the index and upload documents if the index does not exist.
 
@@ -61,19 +93,43 @@ async def create_index_maybe(
     called. This code ensures that the index is being populated only once.
     rag.create_index return True if the index was created, meaning that this
     docker node have started first and must populate index.
+    The index is looked up while the connection of the embedding model,
+    only needed to create the index, is fetched, unless the startup state
+    recorded the index with the same schema.
 
     :param ai_client: The project client to be used to create an index.
     :param creds: The credentials, used for the index.
+    :param steps: The startup steps, which time the lookups.
+    :param state: The startup state, which records the index.
     """
     from api.search_index_manager import SearchIndexManager
     endpoint = os.environ.get('AZURE_AI_SEARCH_ENDPOINT')
     embedding = os.getenv('AZURE_AI_EMBED_DEPLOYMENT_NAME')    
     if endpoint and embedding:
+        index_name = os.getenv('AZURE_AI_SEARCH_INDEX_NAME')
+        schema_hash = hash_values(index_name, embedding, os.getenv('AZURE_AI_EMBED_DIMENSIONS'))
+        recorded = state.index_name == index_name and state.index_schema_hash == schema_hash
+
+        def get_connection():
+            return steps.start("aoai_connection", lambda: ai_client.connections.get_default(
+                connection_type=ConnectionType.AZURE_OPEN_AI, include_credentials=True))
+
+        steps.start("search_index_check", lambda: search_index_exists(endpoint, creds, index_name))
+        if not recorded:
+            get_connection()
+        if await steps.result("search_index_check"):
+            logger.info(f"Index {index_name} exists, the documents are not uploaded.")
+            state.index_name, state.index_schema_hash = index_name, schema_hash
+            if not recorded:
+                steps.cancel("aoai_connection")
+            return
+        if recorded:
+            logger.info(f"Index {index_name} of the startup state was deleted, creating it.")
+            get_connection()
         try:
-            aoai_connection = await ai_client.connections.get_default(
-                connection_type=ConnectionType.AZURE_OPEN_AI, include_credentials=True)
+            aoai_connection = await steps.result("aoai_connection")
         except ValueError as e:
-            logger.error("Error creating index: {e}")
+            logger.error(f"Error creating index: {e}")
             return
         
         embed_api_key = None
@@ -83,7 +139,7 @@ async def create_index_maybe(
         search_mgr = SearchIndexManager(
             endpoint=endpoint,
             credential=creds,
-            index_name=os.getenv('AZURE_AI_SEARCH_INDEX_NAME'),
+            index_name=index_name,
             dimensions=None,
             model=embedding,
             deployment_name=embedding,
@@ -101,6 +157,7 @@ async def create_index_maybe(
             assert embeddings_path, f'File {embeddings_path} not found.'
             await search_mgr.upload_documents(embeddings_path)
             await search_mgr.close()
+        state.index_name, state.index_schema_hash = index_name, schema_hash
 
 
 def _get_file_path(file_name: str) -> str:
@@ -118,19 +175,23 @@ def _get_file_path(file_name: str) -> str:
 async def get_available_tool(
         project_client: AIProjectClient,
         openai_client: AsyncOpenAI,
-        creds: AsyncTokenCredential) -> Tool:
+        creds: AsyncTokenCredential,
+        steps: StartupSteps,
+        state: StartupState) -> Tool:
     """
     Get the toolset and tool definition for the agent.
 
     :param ai_client: The project client to be used to create an index.
     :param creds: The credentials, used for the index.
+    :param steps: The startup steps, which time the lookups.
+    :param state: The startup state, which records the index or the vector store.
     :return: The tool set, available based on the environment.
     """
     # First try to get an index search.
     conn_id = os.environ.get('SEARCH_CONNECTION_ID')
     search_index_name = os.environ.get('AZURE_AI_SEARCH_INDEX_NAME')
     if search_index_name and conn_id:
-        await create_index_maybe(project_client, creds)
+        await create_index_maybe(project_client, creds, steps, state)
 
         return AzureAISearchAgentTool(
             azure_ai_search=AzureAISearchToolResource(indexes=[AISearchIndexResource( 
@@ -142,31 +203,31 @@ async def get_available_tool(
     else:
         logger.info(
             "agent: index was not initialized, falling back to file search.")
-        
-        # Upload files for file search
-        file_streams = [open(_get_file_path(file_name), "rb") for file_name in FILES_NAMES]
 
+        # Upload the new or changed files for file search, see api.vector_store_uploader.
+        from api.vector_store_uploader import VectorStoreUploader
+        uploader = VectorStoreUploader(openai_client, concurrency=VECTOR_STORE_UPLOAD_CONCURRENCY)
         try:
-            vector_store = await openai_client.vector_stores.create()
-            await openai_client.vector_stores.file_batches.upload_and_poll(
-                vector_store_id=vector_store.id, files=file_streams
-            )
-            logger.info(f"File uploaded to vector store (id: {vector_store.id})")
-        except FileNotFoundError:
-            logger.warning(f"Asset file not found.")
-            logger.info("Creating vector store without file for demonstration...")
-
+            vector_store_id = await steps.start(
+                "vector_store_upload",
+                lambda: uploader.sync([_get_file_path(file_name) for file_name in FILES_NAMES], state.vector_store_id),
+                timeout=STARTUP_CREATE_TIMEOUT)
+        finally:
+            uploader.log_report()
 
-        logger.info("agent: file store and vector store success")
+        logger.info(f"agent: file store and vector store success (id: {vector_store_id})")
+        state.vector_store_id = vector_store_id
 
-        return FileSearchTool(vector_store_ids=[vector_store.id])
+        return FileSearchTool(vector_store_ids=[vector_store_id])
 
 
 async def create_agent(ai_project: AIProjectClient,
                        openai_client: AsyncOpenAI,
-                       creds: AsyncTokenCredential) -> AgentVersionObject:
+                       creds: AsyncTokenCredential,
+                       steps: StartupSteps,
+                       state: StartupState) -> AgentVersionObject:
     logger.info("Creating new agent with resources")
-    tool = await get_available_tool(ai_project, openai_client, creds)
+    tool = await get_available_tool(ai_project, openai_client, creds, steps, state)
 
     instructions = "Use File Search always with citations.  Avoid to use base knowledge."
     
@@ -188,17 +249,46 @@ async def create_agent(ai_project: AIProjectClient,
     return agent
 
 
-async def initialize_eval(project_client: AIProjectClient, openai_client: AsyncOpenAI, agent_obj: AgentVersionObject, credential: AsyncTokenCredential):
-    eval_rule_id = f"eval-rule-for-{agent_obj.name}"
+async def find_eval_rule(project_client: AIProjectClient, agent_name: str) -> Optional[str]:
+    """Return the ID of the continuous evaluation rule of the agent, or None if there is none."""
+    eval_rules = project_client.evaluation_rules.list(
+        action_type=EvaluationRuleActionType.CONTINUOUS_EVALUATION,
+        agent_name=agent_name)
+    rules_list = [rule async for rule in eval_rules]
+    return rules_list[0].id if rules_list else None
+
+
+async def get_eval_rule(project_client: AIProjectClient, eval_rule_id: str) -> Optional[str]:
+    """Return the ID if the evaluation rule exists, or None."""
+    from azure.core.exceptions import ResourceNotFoundError
     try:
-        eval_rules = project_client.evaluation_rules.list(
-            action_type=EvaluationRuleActionType.CONTINUOUS_EVALUATION,
-            agent_name=agent_obj.name)
-        rules_list = [rule async for rule in eval_rules]
+        return (await project_client.evaluation_rules.get(eval_rule_id)).id
+    except ResourceNotFoundError:
+        return None
+
+
+async def initialize_eval(
+        project_client: AIProjectClient,
+        openai_client: AsyncOpenAI,
+        agent_obj: AgentVersionObject,
+        credential: AsyncTokenCredential,
+        eval_rule_id: Optional[str] = None) -> Optional[str]:
+    """
+    Create the continuous evaluation rule of the agent, unless it exists.
+    Return the ID of the rule, or None if it could not be created.
 
-        if len(rules_list) >= 1:
+    :param eval_rule_id: The ID of the rule of the agent if it is known to exist;
+                         if None, the rules are looked up.
+    """
+    try:
+        if eval_rule_id is None:
+            eval_rule_id = await find_eval_rule(project_client, agent_obj.name)
+
+        if eval_rule_id:
             logger.info(f"Continuous Evaluation Rule for agent {agent_obj.name} already exists")
+            return eval_rule_id
         else:
+            eval_rule_id = f"eval-rule-for-{agent_obj.name}"
             # Create an evaluation with testing criteria
             data_source_config = {"type": "azure_ai_source", "scenario": "responses"}
             testing_criteria = [
@@ -232,61 +322,144 @@ async def initialize_eval(project_client: AIProjectClient, openai_client: AsyncO
             logger.info(
                 f"Continuous Evaluation Rule created (id: {continuous_eval_rule.id}, name: {continuous_eval_rule.display_name})"
             )
+            return continuous_eval_rule.id
     except Exception as e:
         logger.error(f"Error creating Continuous Evaluation Rule: {e}", exc_info=True)
+        return None
 
 async def initialize_resources():
+    """
+    Find or create the agent and its evaluation rule.
+
+    The lookups which do not depend on each other run concurrently, each with
+    STARTUP_STEP_TIMEOUT, and the time of every step is logged at the end,
+    so the cold start can be kept within the health probe window.
+    The resources found or created are saved to STARTUP_STATE_FILE; the next
+    start with the same configuration only checks that they still exist.
+    """
     proj_endpoint = os.environ.get("AZURE_EXISTING_AIPROJECT_ENDPOINT")
+    steps = StartupSteps(timeout=STARTUP_STEP_TIMEOUT)
+    config_hash = startup_config_hash(
+        [_get_file_path(file_name) for file_name in FILES_NAMES]
+        + [os.path.join(os.path.dirname(__file__), 'data', 'embeddings.csv')])
+    saved_state = load_startup_state(STARTUP_STATE_FILE, config_hash) if STARTUP_STATE_FILE else None
+    state = saved_state or StartupState(config_hash=config_hash)
     try:
         async with (
             DefaultAzureCredential() as credential,
             AIProjectClient(endpoint=proj_endpoint, credential=credential) as project_client,
             project_client.get_openai_client() as openai_client,
         ):
-            agent_obj: Optional[AgentVersionObject] = None
-
-            agentID = os.environ.get("AZURE_EXISTING_AGENT_ID")
-
-            if agentID:
+            # The agent of the last start with the same configuration is the first choice.
+            agentID = state.agent_id or os.environ.get("AZURE_EXISTING_AGENT_ID")
+            # The agent found or created is most likely this one, so its rule is looked up meanwhile.
+            expected_name = agentID.split(":")[0] if agentID else os.environ.get("AZURE_AI_AGENT_NAME")
+
+            async def get_agent_by_id() -> Optional[AgentVersionObject]:
+                if not agentID:
+                    logger.info("No existing agent ID found.")
+                    return None
                 try:
                     agent_name = agentID.split(":")[0]
                     agent_version = agentID.split(":")[1]
                     agent_obj = await project_client.agents.get_version(agent_name, agent_version)
                     logger.info(f"Found agent by ID: {agent_obj.id}")
+                    return agent_obj
                 except Exception as e:
                     logger.warning(
                         "Could not retrieve agent by AZURE_EXISTING_AGENT_ID = "
                         f"{agentID}, error: {e}")
-            else:
-                logger.info("No existing agent ID found.")
+                    return None
 
             # Check if an agent with the same name already exists
-            if not agent_obj:
+            async def get_agent_by_name(agent_obj: Optional[AgentVersionObject]) -> Optional[AgentVersionObject]:
+                if agent_obj:
+                    return agent_obj
+                agent_name = os.environ.get("AZURE_AI_AGENT_NAME")
                 try:
-                    agent_name = os.environ["AZURE_AI_AGENT_NAME"]
                     logger.info(f"Retrieving agent by name: {agent_name}")
                     agents = await project_client.agents.get(agent_name)
                     agent_obj = agents.versions.latest
                     logger.info(f"Agent with agent id, {agent_obj.id} retrieved.")
+                    return agent_obj
                 except Exception as e:
                     logger.info(f"Agent name, {agent_name} not found.")
-                    
+                    return None
+
             # Create a new agent
-            if not agent_obj:
-                agent_obj = await create_agent(project_client, openai_client, credential)
+            async def get_or_create_agent(agent_obj: Optional[AgentVersionObject]) -> AgentVersionObject:
+                if agent_obj:
+                    return agent_obj
+                agent_obj = await create_agent(project_client, openai_client, credential, steps, state)
                 logger.info(f"Created agent, agent ID: {agent_obj.id}")
-
-            os.environ["AZURE_EXISTING_AGENT_ID"] = agent_obj.id
-
-            await initialize_eval(project_client, openai_client, agent_obj, credential)
+                return agent_obj
+
+            async def check_eval_rule() -> Optional[str]:
+                if state.eval_rule_id:
+                    return await get_eval_rule(project_client, state.eval_rule_id)
+                return await find_eval_rule(project_client, expected_name) if expected_name else None
+
+            async def create_eval_rule(agent_obj: AgentVersionObject, eval_rule_id: Optional[str]) -> Optional[str]:
+                if agent_obj.name != expected_name:
+                    eval_rule_id = None
+                return await initialize_eval(project_client, openai_client, agent_obj, credential, eval_rule_id)
+
+            steps.start("eval_rule_check", check_eval_rule, optional=True)
+            steps.start("agent_by_id", get_agent_by_id, optional=True)
+            steps.start("agent_by_name", get_agent_by_name, after=["agent_by_id"], optional=True)
+            steps.start("agent", get_or_create_agent, after=["agent_by_name"], timeout=STARTUP_CREATE_TIMEOUT)
+            steps.start("eval_rule", create_eval_rule, after=["agent", "eval_rule_check"],
+                        timeout=STARTUP_CREATE_TIMEOUT)
+
+            try:
+                agent_obj = await steps.result("agent")
+                os.environ["AZURE_EXISTING_AGENT_ID"] = agent_obj.id
+                state.agent_id = agent_obj.id
+
+                state.eval_rule_id = await steps.result("eval_rule")
+            finally:
+                # Stop the lookups still running before the clients are closed.
+                await steps.close()
+        if STARTUP_STATE_FILE:
+            save_startup_state(STARTUP_STATE_FILE, state)
     except Exception as e:
-        logger.info("Error creating agent: {e}", exc_info=True)
-        raise RuntimeError(f"Failed to create the agent: {e}")  
+        logger.info(f"Error creating agent: {e}", exc_info=True)
+        raise RuntimeError(f"Failed to create the agent: {e}")
+    finally:
+        steps.log_report()
 
 
 def on_starting(server):
     """This code runs once before the workers will start."""
+    from api.metrics import clear_metrics_directory, get_metrics_directory
+    clear_metrics_directory(get_metrics_directory())
+    # The workers inherit the environment, so they all verify the session cookies they sign.
+    if not os.getenv("SESSION_SECRET"):
+        os.environ["SESSION_SECRET"] = secrets.token_urlsafe(32)
     asyncio.get_event_loop().run_until_complete(initialize_resources())
+    size_workers(server)
+
+
+def size_workers(server):
+    """
+    Size the workers to the container, now that the RSS of the master with the app preloaded is known.
+    The workers inherit the per-worker limits, unless they are set in the environment.
+    """
+    # A --workers on the command line replaces the value of this file, and is kept.
+    override = server.num_workers if server.num_workers != workers else None
+    plan = plan_from_environment(workers=override)
+    server.num_workers = plan.workers
+    for line in plan.describe():
+        logger.info(f"Workers: {line}")
+    for name, value in plan.environment().items():
+        if os.environ.setdefault(name, value) != value:
+            logger.info(f"Workers: {name} is set to {os.environ[name]} in the environment, instead of {value}")
+
+
+def child_exit(server, worker):
+    """Keep the counters of an exited worker in the Prometheus metrics, see api.metrics."""
+    from api.metrics import mark_process_dead
+    mark_process_dead(worker.pid)
 
 
 max_requests = 1000
@@ -302,8 +475,10 @@ if not os.getenv("RUNNING_IN_PRODUCTION"):
 # Please see the documentation on gunicorn
 # https://docs.gunicorn.org/en/stable/settings.html
 preload_app = True
-num_cpus = multiprocessing.cpu_count()
-workers = (num_cpus * 2) + 1
+# The uvicorn workers are asynchronous, so they are sized to the CPU quota and the
+# memory limit of the container, see api.worker_sizing; on_starting refines the
+# number with the measured RSS. WEB_CONCURRENCY sets it.
+workers = plan_from_environment().workers
 worker_class = "uvicorn.workers.UvicornWorker"
 
 timeout = 120
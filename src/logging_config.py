@@ -1,14 +1,126 @@
 # Copyright (c) Microsoft. All rights reserved.
 # Licensed under the MIT license. See LICENSE.md file in the project root for full license information.
 
+import atexit
+import json
 import logging
+import logging.handlers
+import os
+import queue
 import sys
-from typing import Optional
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+# The queue listeners of the configured loggers; configure_logging is idempotent per logger name.
+_listeners: Dict[str, logging.handlers.QueueListener] = {}
+_lock = threading.Lock()
+
+_TEXT_FORMAT = "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+
+
+class JsonFormatter(logging.Formatter):
+    """Format log records as one JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Limit the number of records per second for the given loggers and their children.
+
+    Records over the limit are dropped; the number of dropped records is added
+    to the next record which passes the filter.
+
+    :param limits: The maximal number of records per second, keyed by logger name.
+    """
+
+    def __init__(self, limits: Dict[str, float]) -> None:
+        super().__init__()
+        self._limits = limits
+        # logger name -> (window start, records in window, suppressed records)
+        self._state: Dict[str, Tuple[float, int, int]] = {}
+
+    def _limit_for(self, name: str) -> Optional[Tuple[str, float]]:
+        while name:
+            if name in self._limits:
+                return name, self._limits[name]
+            name = name.rpartition(".")[0]
+        return None
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        limit = self._limit_for(record.name)
+        if limit is None:
+            return True
+        key, per_second = limit
+        now = time.monotonic()
+        window_start, count, suppressed = self._state.get(key, (now, 0, 0))
+        if now - window_start >= 1.0:
+            window_start, count = now, 0
+        if count >= per_second:
+            self._state[key] = (window_start, count, suppressed + 1)
+            return False
+        if suppressed:
+            record.msg = f"{record.getMessage()} ({suppressed} similar messages suppressed)"
+            record.args = None
+        self._state[key] = (window_start, count + 1, 0)
+        return True
+
+
+def parse_rate_limits(value: str) -> Dict[str, float]:
+    """Parse the rate limits in the format ``logger=records_per_second,...``."""
+    limits = {}
+    for part in value.split(","):
+        name, _, rate = part.partition("=")
+        if name.strip() and rate.strip():
+            limits[name.strip()] = float(rate)
+    return limits
+
+
+def _restart_listeners_after_fork() -> None:
+    # The listener thread does not survive fork (e.g. gunicorn workers with
+    # preload_app), so each child gets a new queue and listener thread.
+    for logger_name, listener in list(_listeners.items()):
+        new_queue = queue.SimpleQueue()
+        for handler in logging.getLogger(logger_name).handlers:
+            if isinstance(handler, logging.handlers.QueueHandler):
+                handler.queue = new_queue
+        new_listener = logging.handlers.QueueListener(
+            new_queue, *listener.handlers, respect_handler_level=True)
+        new_listener.start()
+        _listeners[logger_name] = new_listener
+
+
+def _stop_listeners() -> None:
+    for listener in _listeners.values():
+        listener.stop()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_listeners_after_fork)
+atexit.register(_stop_listeners)
+
 
 def configure_logging(log_file_name: Optional[str] = None, logger_name: str = "azureaiapp") -> logging.Logger:
     """
     Configure and return a logger with both stream (stdout) and optional file handlers.
 
+    The handlers run on a background thread fed by a queue, so logging never
+    blocks the event loop on I/O. Calling this function again for the same
+    logger returns it unchanged. The output is tuned with environment variables:
+    APP_LOG_FORMAT ("text" or "json"), APP_LOG_RATE_LIMITS (records per second
+    per logger, e.g. "azureaiapp.stream=5"), APP_LOG_FILE_MAX_BYTES and
+    APP_LOG_FILE_BACKUP_COUNT for the rotation of the log file.
+
     :param log_file_name: The path to the log file. If provided, logs will also be written to this file.
     :type log_file_name: Optional[str]
     :param logger_name: The name of the logger to configure.
@@ -17,21 +129,41 @@ def configure_logging(log_file_name: Optional[str] = None, logger_name: str = "a
     :rtype: logging.Logger
     """
     logger = logging.getLogger(logger_name)
-    logger.setLevel(logging.INFO)
-
-    # Stream handler (stdout)
-    stream_handler = logging.StreamHandler(sys.stdout)
-    stream_handler.setLevel(logging.INFO)
-    stream_formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s")
-    stream_handler.setFormatter(stream_formatter)
-    logger.addHandler(stream_handler)
-
-    # File handler if a log file is specified
-    if log_file_name:
-        file_handler = logging.FileHandler(log_file_name)
-        file_handler.setLevel(logging.INFO)
-        file_formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s")
-        file_handler.setFormatter(file_formatter)
-        logger.addHandler(file_handler)
-
-    return logger
\ No newline at end of file
+    with _lock:
+        if logger_name in _listeners:
+            return logger
+        logger.setLevel(logging.INFO)
+
+        if os.getenv("APP_LOG_FORMAT", "text").lower() == "json":
+            formatter: logging.Formatter = JsonFormatter()
+        else:
+            formatter = logging.Formatter(_TEXT_FORMAT)
+
+        # Stream handler (stdout)
+        stream_handler = logging.StreamHandler(sys.stdout)
+        stream_handler.setLevel(logging.INFO)
+        stream_handler.setFormatter(formatter)
+        handlers = [stream_handler]
+
+        # Rotating file handler if a log file is specified
+        if log_file_name:
+            file_handler = logging.handlers.RotatingFileHandler(
+                log_file_name,
+                maxBytes=int(os.getenv("APP_LOG_FILE_MAX_BYTES", str(10 * 1024 * 1024))),
+                backupCount=int(os.getenv("APP_LOG_FILE_BACKUP_COUNT", "5")),
+            )
+            file_handler.setLevel(logging.INFO)
+            file_handler.setFormatter(formatter)
+            handlers.append(file_handler)
+
+        handler_queue = queue.SimpleQueue()
+        queue_handler = logging.handlers.QueueHandler(handler_queue)
+        queue_handler.addFilter(RateLimitFilter(
+            parse_rate_limits(os.getenv("APP_LOG_RATE_LIMITS", f"{logger_name}.stream=5"))))
+        logger.addHandler(queue_handler)
+
+        listener = logging.handlers.QueueListener(handler_queue, *handlers, respect_handler_level=True)
+        listener.start()
+        _listeners[logger_name] = listener
+
+    return logger
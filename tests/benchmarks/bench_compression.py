@@ -0,0 +1,91 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+
+"""
+Measure response bytes and p95 latency of a /chat/history load per encoding.
+
+The history payload is built from the documents in src/files (16 messages with
+annotations) and served through CompressionMiddleware in-process. The latency
+adds the transfer time on a link of --link-kbps to the server time.
+
+    python tests/benchmarks/bench_compression.py --requests 200 --link-kbps 2000
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import httpx
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+SRC = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src"))
+sys.path.insert(0, SRC)
+
+from api.compression import CompressionMiddleware  # noqa: E402
+
+
+def build_history():
+    files_dir = os.path.join(SRC, "files")
+    names = sorted(os.listdir(files_dir))
+    history = []
+    for i in range(16):
+        name = names[i % len(names)]
+        with open(os.path.join(files_dir, name), encoding="utf-8") as f:
+            text = f.read()
+        if i % 2:
+            history.append({"content": text[:200], "annotations": [], "role": "user", "created_at": "1760000000.0"})
+        else:
+            history.append({
+                "content": text[:2000],
+                "annotations": [{"label": name, "index": j * 100} for j in range(4)],
+                "role": "assistant",
+                "created_at": "",
+            })
+    return history
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+async def run(encoding: str, requests: int, link_kbps: float):
+    history = build_history()
+
+    async def history_route(request):
+        return JSONResponse(history)
+
+    app = CompressionMiddleware(Starlette(routes=[Route("/chat/history", history_route)]))
+    latencies = []
+    size = 0
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        for _ in range(requests):
+            start = time.perf_counter()
+            response = await client.get("/chat/history", headers={"Accept-Encoding": encoding})
+            server_time = time.perf_counter() - start
+            size = response.num_bytes_downloaded  # the body as sent on the wire
+            latencies.append(server_time + size * 8 / (link_kbps * 1000))
+    return size, latencies
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--link-kbps", type=float, default=2000.0)
+    args = parser.parse_args()
+
+    for encoding in ("identity", "gzip", "br"):
+        size, latencies = asyncio.run(run(encoding, args.requests, args.link_kbps))
+        print(f"{encoding:>8}: {size:7d} bytes, p50 {statistics.median(latencies) * 1000:7.2f} ms, "
+              f"p95 {percentile(latencies, 95) * 1000:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
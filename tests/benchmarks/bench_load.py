@@ -0,0 +1,307 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+
+"""
+Load test of the app under gunicorn, against the local stub of the Foundry APIs.
+
+Starts stub_foundry.py and the app under gunicorn with WORKERS uvicorn workers,
+whose AIProjectClient is replaced by one returning an OpenAI client of the stub,
+so everything from the connection pool to the created_at write-back runs as
+deployed. USERS virtual users each load /chat/history and then chat TURNS turns
+with THINK seconds between them, keeping their cookies as a browser does.
+
+Reports for /chat the time to the response headers (TTFB), to the first delta
+and to stream_end, at p50/p95/p99, the tokens/s each stream was read at, the
+/chat/history latencies, the errors, and the CPU time and peak RSS of every
+worker. The stub answers with words " tok<n>", so the words of the answer are
+its tokens.
+
+    python tests/benchmarks/bench_load.py --workers 2 --users 32 --turns 5 --tokens 200 --token-rate 100
+
+With --target the app is not started and the given URL is load tested, e.g. a
+local deployment; worker statistics are not available then.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+import httpx
+
+BENCHMARKS = os.path.abspath(os.path.dirname(__file__))
+SRC = os.path.abspath(os.path.join(BENCHMARKS, "../../src"))
+sys.path.insert(0, SRC)
+sys.path.insert(0, BENCHMARKS)
+
+from stub_foundry import add_stub_arguments  # noqa: E402
+
+
+class StubCredential:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        pass
+
+
+class StubProjectClient:
+    """The AIProjectClient calls of the app's lifespan, pointed at the stub."""
+
+    def __init__(self, endpoint: str, credential: StubCredential) -> None:
+        self.endpoint = endpoint
+
+        async def get_version(agent_name: str, agent_version: str):
+            return SimpleNamespace(
+                id=f"{agent_name}:{agent_version}", name=agent_name, version=agent_version, metadata={})
+
+        self.agents = SimpleNamespace(get_version=get_version)
+
+    def get_openai_client(self, **kwargs):
+        from openai import AsyncOpenAI
+        return AsyncOpenAI(base_url=f"{self.endpoint}/openai/v1", api_key="stub")
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        pass
+
+
+def create_app():
+    """The gunicorn application: the app, whose project client talks to the stub at AZURE_EXISTING_AIPROJECT_ENDPOINT."""
+    import azure.ai.projects.aio
+    import azure.identity.aio
+    import api.main
+
+    # The lifespan imports the clients from the SDKs when the app starts.
+    azure.identity.aio.DefaultAzureCredential = StubCredential
+    azure.ai.projects.aio.AIProjectClient = StubProjectClient
+    return api.main.create_app()
+
+
+def wait_for(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.TransportError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def children(pid: int) -> List[int]:
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return [int(child) for child in f.read().split()]
+
+
+def process_stats(pid: int) -> Dict[str, float]:
+    """Return the CPU seconds and the RSS and peak RSS in MB of a process."""
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    stats = {"cpu": (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                stats["rss"] = int(line.split()[1]) / 1024
+            elif line.startswith("VmHWM:"):
+                stats["peak_rss"] = int(line.split()[1]) / 1024
+    return stats
+
+
+def iter_events(buffer: bytearray) -> List[Dict]:
+    """Remove the complete SSE frames from the buffer and return their data."""
+    events = []
+    while True:
+        end = buffer.find(b"\n\n")
+        if end == -1:
+            return events
+        frame = bytes(buffer[:end])
+        del buffer[:end + 2]
+        for line in frame.split(b"\n"):
+            if line.startswith(b"data: "):
+                events.append(json.loads(line[6:]))
+
+
+class Results:
+    def __init__(self) -> None:
+        self.ttfb: List[float] = []
+        self.first_delta: List[float] = []
+        self.latency: List[float] = []
+        self.tokens_per_second: List[float] = []
+        self.history: List[float] = []
+        self.tokens = 0
+        self.errors: Dict[str, int] = {}
+
+    def error(self, kind: str) -> None:
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+
+async def chat_turn(client: httpx.AsyncClient, url: str, message: str, results: Results) -> None:
+    start = time.perf_counter()
+    first_delta: Optional[float] = None
+    streamed = ""
+    answer = ""
+    ended = False
+    async with client.stream("POST", f"{url}/chat", json={"message": message}) as response:
+        ttfb = time.perf_counter() - start
+        if response.status_code != 200:
+            results.error(f"chat {response.status_code}")
+            await response.aread()
+            return
+        buffer = bytearray()
+        async for chunk in response.aiter_bytes():
+            buffer.extend(chunk)
+            for event in iter_events(buffer):
+                if event["type"] == "message":
+                    if first_delta is None:
+                        first_delta = time.perf_counter()
+                    streamed += event["content"]
+                elif event["type"] == "completed_message":
+                    answer += event["content"]
+                elif event["type"] == "stream_end":
+                    ended = True
+    client.cookies.update(response.cookies)
+    end = time.perf_counter()
+    if not ended or first_delta is None or streamed != answer:
+        # get_result sends an error as a completed_message, which is not the text of the deltas.
+        results.error("chat stream")
+        return
+    tokens = len(answer.split())
+    results.ttfb.append(ttfb)
+    results.first_delta.append(first_delta - start)
+    results.latency.append(end - start)
+    results.tokens += tokens
+    if end > first_delta:
+        results.tokens_per_second.append(tokens / (end - first_delta))
+
+
+async def user(url: str, args: argparse.Namespace, index: int, results: Results) -> None:
+    # Browsers set TCP_NODELAY; without it the request body waits for a delayed ACK.
+    transport = httpx.AsyncHTTPTransport(socket_options=[(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)])
+    async with httpx.AsyncClient(timeout=120, transport=transport) as client:
+        start = time.perf_counter()
+        try:
+            response = await client.get(f"{url}/chat/history")
+            if response.status_code == 200:
+                results.history.append(time.perf_counter() - start)
+                client.cookies.update(response.cookies)
+            else:
+                results.error(f"history {response.status_code}")
+        except httpx.HTTPError as e:
+            results.error(f"history {type(e).__name__}")
+        for turn in range(args.turns):
+            try:
+                await chat_turn(client, url, f"user {index} question {turn}", results)
+            except httpx.HTTPError as e:
+                results.error(f"chat {type(e).__name__}")
+            if args.think:
+                await asyncio.sleep(args.think)
+
+
+def percentiles(values: List[float]) -> str:
+    if len(values) < 2:
+        return "n/a"
+    cuts = statistics.quantiles(values, n=100)
+    return f"p50 {cuts[49] * 1000:7.1f} ms, p95 {cuts[94] * 1000:7.1f} ms, p99 {cuts[98] * 1000:7.1f} ms"
+
+
+async def warm_up(url: str, args: argparse.Namespace) -> None:
+    # The first turns of a worker import and connect lazily; they are not measured.
+    warmup = argparse.Namespace(**{**vars(args), "turns": 1, "think": 0})
+    await asyncio.gather(*(user(url, warmup, -1, Results()) for _ in range(args.warmup)))
+
+
+async def run(url: str, args: argparse.Namespace, workers: List[int]) -> None:
+    await warm_up(url, args)
+    results = Results()
+    before = {pid: process_stats(pid) for pid in workers}
+    start = time.perf_counter()
+    await asyncio.gather(*(user(url, args, index, results) for index in range(args.users)))
+    wall = time.perf_counter() - start
+    turns = len(results.latency)
+    print(f"{args.users} users x {args.turns} turns in {wall:.1f}s: {turns / wall:.1f} turns/s, "
+          f"{results.tokens / wall:.0f} tokens/s")
+    print(f"  ttfb         {percentiles(results.ttfb)}")
+    print(f"  first delta  {percentiles(results.first_delta)}")
+    print(f"  stream end   {percentiles(results.latency)}")
+    print(f"  history      {percentiles(results.history)}")
+    if results.tokens_per_second:
+        print(f"  tokens/s per stream: median {statistics.median(results.tokens_per_second):.1f}, "
+              f"min {min(results.tokens_per_second):.1f}")
+    print(f"  errors: {results.errors or 'none'}")
+    for pid in workers:
+        after = process_stats(pid)
+        cpu = after["cpu"] - before[pid]["cpu"]
+        print(f"  worker {pid}: cpu {cpu:.2f}s ({cpu / wall * 100:.0f}%), "
+              f"{cpu / max(turns, 1) * 1000:.2f} ms/turn, rss {after['rss']:.0f} MB, peak {after['peak_rss']:.0f} MB")
+
+
+def main(args: argparse.Namespace) -> None:
+    if args.target:
+        asyncio.run(run(args.target.rstrip("/"), args, []))
+        return
+
+    stub_url = f"http://127.0.0.1:{args.stub_port}"
+    url = f"http://127.0.0.1:{args.port}"
+    stub = subprocess.Popen(
+        [sys.executable, os.path.join(BENCHMARKS, "stub_foundry.py"), "--port", str(args.stub_port),
+         "--tokens", str(args.tokens), "--token-rate", str(args.token_rate), "--ttft", str(args.ttft),
+         "--api-latency", str(args.api_latency), "--error-rate", str(args.error_rate),
+         "--error-status", str(args.error_status), "--stream-error-rate", str(args.stream_error_rate),
+         "--seed", str(args.seed)])
+    env = {
+        **os.environ,
+        "AZURE_EXISTING_AIPROJECT_ENDPOINT": stub_url,
+        "AZURE_EXISTING_AGENT_ID": "stub-agent:1",
+        "ENABLE_AZURE_MONITOR_TRACING": "false",
+        "WEB_APP_USERNAME": "",
+        "WEB_APP_PASSWORD": "",
+        "APP_LOG_RATE_LIMITS": os.environ.get("APP_LOG_RATE_LIMITS", "azureaiapp=0"),
+        # gunicorn.conf.py is not loaded, so the workers are given the secret of the session cookies here.
+        "SESSION_SECRET": os.environ.get("SESSION_SECRET", "bench-load"),
+    }
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "bench_load:create_app()", "--pythonpath", f"{BENCHMARKS},{SRC}",
+         "--worker-class", "uvicorn.workers.UvicornWorker", "--workers", str(args.workers),
+         "--bind", f"127.0.0.1:{args.port}", "--preload", "--log-level", "warning"],
+        env=env)
+    try:
+        wait_for(f"{stub_url}/stats")
+        wait_for(f"{url}/agent")
+        # Every worker must be up, so the first requests do not measure their startup.
+        while len(children(server.pid)) < args.workers:
+            time.sleep(0.1)
+        time.sleep(1.0)
+        asyncio.run(run(url, args, children(server.pid)))
+        print(f"  stub: {httpx.get(f'{stub_url}/stats').json()}")
+    finally:
+        server.terminate()
+        server.wait()
+        stub.terminate()
+        stub.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--users", type=int, default=32)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--think", type=float, default=0.0, help="seconds between the turns of a user")
+    parser.add_argument("--warmup", type=int, default=8, help="unmeasured turns before the test")
+    parser.add_argument("--port", type=int, default=8941)
+    parser.add_argument("--stub-port", type=int, default=8940)
+    parser.add_argument("--target", help="load test a running app at this URL instead")
+    add_stub_arguments(parser)
+    main(parser.parse_args())
@@ -0,0 +1,73 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+
+"""
+Measure the event-loop time spent in logging while streaming deltas.
+
+"sync" reproduces the former setup (StreamHandler and FileHandler called on the
+event loop, every delta logged at INFO on the app logger). "queued" uses
+configure_logging with its queue listener and the rate limited stream logger.
+stdout is redirected to a temporary file in both cases.
+
+    python tests/benchmarks/bench_logging.py --deltas 20000
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src")))
+
+from logging_config import configure_logging  # noqa: E402
+
+
+def configure_sync(log_file: str) -> logging.Logger:
+    logger = logging.getLogger("bench_sync")
+    logger.setLevel(logging.INFO)
+    formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    for handler in (logging.StreamHandler(sys.stdout), logging.FileHandler(log_file)):
+        handler.setFormatter(formatter)
+        logger.addHandler(handler)
+    return logger
+
+
+async def stream(deltas: int, log) -> float:
+    spent = 0.0
+    for i in range(deltas):
+        start = time.perf_counter()
+        log(i)
+        spent += time.perf_counter() - start
+        if i % 50 == 0:
+            await asyncio.sleep(0)
+    return spent
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--deltas", type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp, open(os.path.join(tmp, "stdout"), "w") as stdout:
+        real_stdout, sys.stdout = sys.stdout, stdout
+        try:
+            sync_logger = configure_sync(os.path.join(tmp, "sync.log"))
+            sync_time = asyncio.run(stream(args.deltas, lambda i: sync_logger.info(f"Delta: tok{i}")))
+
+            configure_logging(os.path.join(tmp, "queued.log"), logger_name="bench_queued")
+            stream_logger = logging.getLogger("bench_queued.stream")
+            queued_time = asyncio.run(stream(args.deltas, lambda i: stream_logger.info("Delta: %s", f"tok{i}")))
+        finally:
+            sys.stdout = real_stdout
+
+    print(f"  sync: {sync_time * 1000:8.1f} ms in logging on the event loop ({args.deltas} deltas)")
+    print(f"queued: {queued_time * 1000:8.1f} ms in logging on the event loop ({args.deltas} deltas)")
+
+
+if __name__ == "__main__":
+    main()
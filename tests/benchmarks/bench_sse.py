@@ -0,0 +1,81 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+
+"""
+Compare the per-delta SSE framing with the coalescing SSEEncoder.
+
+Replays a synthetic answer of DELTAS tokens arriving at RATE tokens per second
+and reports the CPU time, frames/sec and bytes/frame of both paths. Every frame is written to /dev/null, so the
+reported CPU time includes one write syscall per frame, as with a socket.
+
+    python tests/benchmarks/bench_sse.py --deltas 4000 --rate 200
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src")))
+
+from api.sse import SSEEncoder, iterate_with_deadline  # noqa: E402
+
+
+async def upstream(deltas: int, rate: float):
+    # Tokens arrive in bursts, as they do from the Responses API.
+    for i in range(deltas):
+        yield f" tok{i}"
+        if rate and i % 4 == 3:
+            await asyncio.sleep(4 / rate)
+
+
+async def per_delta(deltas: int, rate: float, sink: int):
+    frames = 0
+    size = 0
+    async for delta in upstream(deltas, rate):
+        frame = f"data: {json.dumps({'content': delta, 'type': 'message'})}\n\n"
+        size += os.write(sink, frame.encode("utf-8"))
+        frames += 1
+    return frames, size
+
+
+async def coalesced(deltas: int, rate: float, sink: int, window: float, max_bytes: int):
+    encoder = SSEEncoder(window=window, max_bytes=max_bytes)
+    async for delta in iterate_with_deadline(upstream(deltas, rate), encoder.time_until_due):
+        frame = encoder.message(delta) if delta is not None else encoder.flush()
+        if frame:
+            os.write(sink, frame)
+    os.write(sink, encoder.event({'type': "stream_end"}))
+    return encoder.frames, encoder.bytes
+
+
+def report(name: str, frames: int, size: int, cpu: float, wall: float) -> None:
+    print(f"{name:>10}: {frames:6d} frames, {frames / wall:8.1f} frames/s, "
+          f"{size / frames:7.1f} bytes/frame, cpu {cpu * 1000:8.1f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--deltas", type=int, default=4000)
+    parser.add_argument("--rate", type=float, default=200.0, help="Tokens per second, 0 for no pacing.")
+    parser.add_argument("--window-ms", type=float, default=30.0)
+    parser.add_argument("--max-bytes", type=int, default=1024)
+    args = parser.parse_args()
+
+    sink = os.open(os.devnull, os.O_WRONLY)
+    for name, coro in (
+        ("per-delta", lambda: per_delta(args.deltas, args.rate, sink)),
+        ("coalesced", lambda: coalesced(args.deltas, args.rate, sink, args.window_ms / 1000, args.max_bytes)),
+    ):
+        wall, cpu = time.perf_counter(), time.process_time()
+        frames, size = asyncio.run(coro())
+        report(name, frames, size, time.process_time() - cpu, time.perf_counter() - wall)
+    os.close(sink)
+
+
+if __name__ == "__main__":
+    main()
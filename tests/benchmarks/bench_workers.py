@@ -0,0 +1,80 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+
+"""
+Throughput of the app at different numbers of gunicorn workers, against the local stub of the Foundry APIs.
+
+Runs bench_load.py once per number of workers, each worker with the limits
+api.worker_sizing derives for that number, and prints the turns/s, tokens/s,
+p95 time to stream_end, errors and the summed peak RSS of the workers side by
+side. "auto" is the number of workers gunicorn.conf.py would start in this
+container; set WORKER_RSS_MB to size it for the RSS of a worker measured here.
+
+    python tests/benchmarks/bench_workers.py --counts 1,2,4,auto --users 64 --turns 3
+
+The other arguments are passed to bench_load.py.
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+from typing import Dict, List
+
+BENCHMARKS = os.path.abspath(os.path.dirname(__file__))
+SRC = os.path.abspath(os.path.join(BENCHMARKS, "../../src"))
+sys.path.insert(0, SRC)
+
+from api.worker_sizing import get_cpu_count, plan_from_environment, plan_workers, read_cpu_quota  # noqa: E402
+
+SUMMARY = re.compile(r"in ([\d.]+)s: ([\d.]+) turns/s, (\d+) tokens/s")
+STREAM_END = re.compile(r"stream end\s+p50\s+[\d.]+ ms, p95\s+([\d.]+) ms")
+WORKER = re.compile(r"worker \d+: .* peak (\d+) MB")
+
+
+def run_bench_load(workers: int, extra: List[str]) -> Dict[str, str]:
+    quota = read_cpu_quota()
+    cpus = min(quota, get_cpu_count()) if quota else float(get_cpu_count())
+    plan = plan_workers(cpus, None, 0, workers=workers)
+    env = {**plan.environment(), **os.environ}
+    result = subprocess.run(
+        [sys.executable, os.path.join(BENCHMARKS, "bench_load.py"), "--workers", str(workers), *extra],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    output = result.stdout
+    summary = SUMMARY.search(output)
+    stream_end = STREAM_END.search(output)
+    errors = re.search(r"errors: (.*)", output)
+    return {
+        "workers": str(workers),
+        "streams/worker": env["CHAT_MAX_ACTIVE_STREAMS"],
+        "turns/s": summary.group(2) if summary else "n/a",
+        "tokens/s": summary.group(3) if summary else "n/a",
+        "p95 stream end ms": stream_end.group(1) if stream_end else "n/a",
+        "errors": errors.group(1) if errors else "n/a",
+        "peak rss MB": str(sum(int(peak) for peak in WORKER.findall(output))),
+    }
+
+
+def main(args: argparse.Namespace, extra: List[str]) -> None:
+    counts = []
+    for count in args.counts.split(","):
+        counts.append(plan_from_environment().workers if count == "auto" else int(count))
+    rows = []
+    for workers in counts:
+        print(f"Running with {workers} workers...", flush=True)
+        rows.append(run_bench_load(workers, extra))
+    columns = list(rows[0])
+    widths = [max(len(column), *(len(row[column]) for row in rows)) for column in columns]
+    print("  ".join(column.rjust(width) for column, width in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(row[column].rjust(width) for column, width in zip(columns, widths)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--counts", default="1,2,4,auto", help="the numbers of workers, comma separated")
+    main(*parser.parse_known_args())
@@ -0,0 +1,224 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+
+"""
+Compare the per-turn overhead of the SSE /chat path with the /ws/chat WebSocket.
+
+Runs the app in a uvicorn child process against an in-memory upstream, which
+answers instantly with --deltas deltas, so the measured time is the transport
+and request handling of the app. CLIENTS concurrent sessions run TURNS turns
+each; SSE posts every turn (reusing keep-alive connections, as a browser does,
+or with new connections with --no-keep-alive), WebSocket sends every turn over
+one connection. Reports turns/s, p50/p95 turn latency, time to first event and
+the server CPU time per turn.
+
+    python tests/benchmarks/bench_ws.py --clients 16 --turns 50 --deltas 40
+"""
+
+import argparse
+import asyncio
+import functools
+import itertools
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from types import SimpleNamespace
+
+import httpx
+import websockets
+
+SRC = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../src"))
+sys.path.insert(0, SRC)
+
+
+class InMemoryUpstream:
+    """The Conversations and Responses calls of the app, answered from memory."""
+
+    def __init__(self, deltas: int) -> None:
+        from openai.types.conversations import Conversation
+        from openai.types.responses import ResponseOutputMessage, ResponseOutputText
+
+        ids = itertools.count()
+        conversations = {}
+        text = "".join(f" tok{i}" for i in range(deltas))
+
+        async def create(**kwargs):
+            conversation = Conversation(id=f"conv_{next(ids)}", created_at=0, metadata={}, object="conversation")
+            conversations[conversation.id] = conversation
+            return conversation
+
+        async def retrieve(conversation_id):
+            return conversations[conversation_id]
+
+        async def update(conversation_id, metadata=None, **kwargs):
+            conversations[conversation_id].metadata = dict(metadata or {})
+            return conversations[conversation_id]
+
+        async def events():
+            item_id = f"msg_{next(ids)}"
+            yield SimpleNamespace(type="response.created", response=SimpleNamespace(id=f"resp_{next(ids)}"))
+            yield SimpleNamespace(type="response.output_item.added", item=SimpleNamespace(id=item_id, type="message"))
+            for i in range(deltas):
+                yield SimpleNamespace(type="response.output_text.delta", delta=f" tok{i}")
+            item = ResponseOutputMessage(
+                id=item_id, type="message", role="assistant", status="completed",
+                content=[ResponseOutputText(type="output_text", text=text, annotations=[])])
+            yield SimpleNamespace(type="response.output_item.done", item=item)
+            yield SimpleNamespace(type="response.completed", response=SimpleNamespace(
+                output_text=text, usage=SimpleNamespace(output_tokens=deltas)))
+
+        async def create_response(**kwargs):
+            return events()
+
+        async def cancel(response_id):
+            pass
+
+        class Items:
+            async def list(self, conversation_id, **kwargs):
+                return _EmptyPage()
+
+        self.conversations = SimpleNamespace(create=create, retrieve=retrieve, update=update, items=Items())
+        self.responses = SimpleNamespace(create=create_response, cancel=cancel)
+
+    async def close(self) -> None:
+        pass
+
+
+class _EmptyPage:
+    data = []
+    has_more = False
+    last_id = None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        raise StopAsyncIteration
+
+
+async def serve(port: int, deltas: int, resume: bool) -> None:
+    import uvicorn
+    from api.admission import AdmissionController
+    from api.cancellation import UpstreamCanceller
+    from api.conversation_cache import ConversationCache
+    from api.created_at_writer import CreatedAtWriter
+    from api.history_cache import HistoryCache
+    from api.main import create_app
+    from api.resumable import MemoryStreamStore, ResumableStreams
+
+    app = create_app()
+    upstream = InMemoryUpstream(deltas)
+    state = app.state
+    state.agent_version_obj = SimpleNamespace(id="agent:1", name="agent", version="1")
+    state.openai_client = upstream
+    state.conversation_cache = ConversationCache(max_size=1024, ttl=300)
+    state.history_cache = HistoryCache(max_size=256, ttl=300)
+    state.admission_controller = AdmissionController(max_active=0)
+    state.upstream_canceller = UpstreamCanceller(upstream)
+    state.created_at_writer = CreatedAtWriter(upstream, history_cache=state.history_cache)
+    state.resumable_streams = ResumableStreams(MemoryStreamStore()) if resume else None
+    state.created_at_writer.start()
+    if resume:
+        state.resumable_streams.start()
+    server = uvicorn.Server(uvicorn.Config(app, port=port, log_level="warning", lifespan="off"))
+    await server.serve()
+
+
+def process_cpu(pid: int) -> float:
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+async def sse_session(url: str, turns: int, keep_alive: bool, latencies, firsts) -> None:
+    # Browsers set TCP_NODELAY; without it the request body waits for a delayed ACK.
+    transport = httpx.AsyncHTTPTransport(
+        limits=httpx.Limits(max_keepalive_connections=1 if keep_alive else 0),
+        socket_options=[(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)])
+    async with httpx.AsyncClient(timeout=60, transport=transport) as client:
+        for i in range(turns):
+            start = time.perf_counter()
+            first = None
+            async with client.stream("POST", f"{url}/chat", json={"message": f"q{i}"}) as response:
+                async for chunk in response.aiter_bytes():
+                    if first is None:
+                        first = time.perf_counter() - start
+                    if b'"stream_end"' in chunk:
+                        break
+            client.cookies.update(response.cookies)
+            latencies.append(time.perf_counter() - start)
+            firsts.append(first)
+
+
+async def ws_session(url: str, turns: int, latencies, firsts) -> None:
+    async with websockets.connect(f"{url.replace('http', 'ws', 1)}/ws/chat") as ws:
+        for i in range(turns):
+            start = time.perf_counter()
+            first = None
+            await ws.send(json.dumps({"type": "message", "message": f"q{i}"}))
+            while True:
+                event = json.loads(await ws.recv())
+                if first is None:
+                    first = time.perf_counter() - start
+                if event["type"] == "stream_end":
+                    break
+            latencies.append(time.perf_counter() - start)
+            firsts.append(first)
+
+
+async def run(name: str, session, args, pid: int) -> None:
+    latencies, firsts = [], []
+    cpu = process_cpu(pid)
+    start = time.perf_counter()
+    await asyncio.gather(*(session(latencies, firsts) for _ in range(args.clients)))
+    wall = time.perf_counter() - start
+    cpu = process_cpu(pid) - cpu
+    turns = len(latencies)
+    p95 = statistics.quantiles(latencies, n=20)[-1]
+    print(f"{name:>14}: {turns / wall:7.1f} turns/s, p50 {statistics.median(latencies) * 1000:6.1f} ms, "
+          f"p95 {p95 * 1000:6.1f} ms, first event p50 {statistics.median(firsts) * 1000:6.1f} ms, "
+          f"server cpu {cpu / turns * 1000:5.2f} ms/turn")
+
+
+async def main(args) -> None:
+    url = f"http://127.0.0.1:{args.port}"
+    server = subprocess.Popen(
+        [sys.executable, __file__, "--serve", "--port", str(args.port), "--deltas", str(args.deltas)]
+        + (["--no-resume"] if args.no_resume else []),
+        env={**os.environ, "APP_LOG_RATE_LIMITS": "azureaiapp=0"})
+    try:
+        async with httpx.AsyncClient() as client:
+            for _ in range(100):
+                try:
+                    await client.get(f"{url}/")
+                    break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.1)
+        print(f"{args.clients} clients x {args.turns} turns, {args.deltas} deltas per answer")
+        await run("sse", functools.partial(sse_session, url, args.turns, True), args, server.pid)
+        await run("sse (no k-a)", functools.partial(sse_session, url, args.turns, False), args, server.pid)
+        await run("websocket", functools.partial(ws_session, url, args.turns), args, server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--deltas", type=int, default=40)
+    parser.add_argument("--port", type=int, default=8931)
+    parser.add_argument("--no-resume", action="store_true", help="serve /chat without resumable streams")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        asyncio.run(serve(args.port, args.deltas, not args.no_resume))
+    else:
+        asyncio.run(main(args))
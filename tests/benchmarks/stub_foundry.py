@@ -0,0 +1,234 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+
+"""
+Local stand-in for the Conversations and Responses APIs used by src/api/routes.py.
+
+Serves the OpenAI REST paths under /openai/v1: conversations (create, retrieve,
+update, delete), conversation items (list, create), streamed responses and
+response cancellation. Answers are TOKENS tokens " tok<n>" streamed at
+TOKEN_RATE tokens per second after TTFT seconds; every other call takes
+API_LATENCY seconds. ERROR_RATE of the requests fail with ERROR_STATUS, and
+STREAM_ERROR_RATE of the streams fail with an error event halfway.
+
+Used by bench_load.py; it can also be run on its own:
+
+    python tests/benchmarks/stub_foundry.py --port 8940 --tokens 200 --token-rate 100 --ttft 0.3
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+from typing import AsyncGenerator, Dict, List
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+
+class StubFoundry:
+    """The state and the handlers of the stub."""
+
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args = args
+        self.random = random.Random(args.seed)
+        self._ids = itertools.count()
+        self.conversations: Dict[str, Dict] = {}
+        self.items: Dict[str, List[Dict]] = {}
+        self.requests = 0
+        self.failed = 0
+
+    def new_id(self, prefix: str) -> str:
+        return f"{prefix}_{next(self._ids):08d}"
+
+    async def delay(self, seconds: float) -> None:
+        if seconds > 0:
+            await asyncio.sleep(seconds)
+
+    def injected_error(self) -> Response | None:
+        self.requests += 1
+        if self.random.random() < self.args.error_rate:
+            self.failed += 1
+            return JSONResponse(
+                {"error": {"message": "Injected error", "type": "server_error", "code": None}},
+                status_code=self.args.error_status)
+        return None
+
+    def not_found(self, conversation_id: str) -> Response:
+        return JSONResponse(
+            {"error": {"message": f"Conversation {conversation_id} not found", "type": "invalid_request_error"}},
+            status_code=404)
+
+    def message_item(self, role: str, text: str) -> Dict:
+        content_type = "input_text" if role == "user" else "output_text"
+        content = {"type": content_type, "text": text}
+        if role != "user":
+            content["annotations"] = []
+        return {"id": self.new_id("msg"), "type": "message", "role": role, "status": "completed", "content": [content]}
+
+    async def create_conversation(self, request: Request) -> Response:
+        await self.delay(self.args.api_latency)
+        if error := self.injected_error():
+            return error
+        body = await request.json() if await request.body() else {}
+        conversation = {
+            "id": self.new_id("conv"), "object": "conversation",
+            "created_at": int(time.time()), "metadata": body.get("metadata") or {}
+        }
+        self.conversations[conversation["id"]] = conversation
+        self.items[conversation["id"]] = []
+        return JSONResponse(conversation)
+
+    async def conversation(self, request: Request) -> Response:
+        conversation_id = request.path_params["conversation_id"]
+        await self.delay(self.args.api_latency)
+        if error := self.injected_error():
+            return error
+        conversation = self.conversations.get(conversation_id)
+        if conversation is None:
+            return self.not_found(conversation_id)
+        if request.method == "POST":
+            conversation["metadata"] = (await request.json()).get("metadata") or {}
+        elif request.method == "DELETE":
+            del self.conversations[conversation_id]
+            del self.items[conversation_id]
+            return JSONResponse({"id": conversation_id, "object": "conversation.deleted", "deleted": True})
+        return JSONResponse(conversation)
+
+    async def conversation_items(self, request: Request) -> Response:
+        conversation_id = request.path_params["conversation_id"]
+        await self.delay(self.args.api_latency)
+        if error := self.injected_error():
+            return error
+        items = self.items.get(conversation_id)
+        if items is None:
+            return self.not_found(conversation_id)
+        if request.method == "POST":
+            created = [self.message_item(item["role"], item["content"]) for item in (await request.json())["items"]]
+            items.extend(created)
+            return JSONResponse({
+                "object": "list", "data": created, "has_more": False,
+                "first_id": created[0]["id"] if created else None, "last_id": created[-1]["id"] if created else None
+            })
+        ordered = list(reversed(items)) if request.query_params.get("order", "desc") == "desc" else list(items)
+        after = request.query_params.get("after")
+        if after:
+            ids = [item["id"] for item in ordered]
+            ordered = ordered[ids.index(after) + 1:] if after in ids else []
+        limit = int(request.query_params.get("limit", "20"))
+        page = ordered[:limit]
+        return JSONResponse({
+            "object": "list", "data": page, "has_more": len(ordered) > limit,
+            "first_id": page[0]["id"] if page else None, "last_id": page[-1]["id"] if page else None
+        })
+
+    async def create_response(self, request: Request) -> Response:
+        await self.delay(self.args.api_latency)
+        if error := self.injected_error():
+            return error
+        body = await request.json()
+        conversation_id = body.get("conversation")
+        if isinstance(conversation_id, dict):
+            conversation_id = conversation_id.get("id")
+        items = self.items.get(conversation_id)
+        if items is None:
+            return self.not_found(conversation_id)
+        user_input = body.get("input")
+        items.append(self.message_item("user", user_input if isinstance(user_input, str) else json.dumps(user_input)))
+        fail = self.random.random() < self.args.stream_error_rate
+        return StreamingResponse(self.stream(conversation_id, fail), media_type="text/event-stream")
+
+    async def stream(self, conversation_id: str, fail: bool) -> AsyncGenerator[bytes, None]:
+        sequence = itertools.count()
+        response_id = self.new_id("resp")
+        item_id = self.new_id("msg")
+        response = {
+            "id": response_id, "object": "response", "created_at": int(time.time()), "status": "in_progress",
+            "model": "stub", "output": [], "parallel_tool_calls": True, "tool_choice": "auto", "tools": []
+        }
+
+        def event(data: Dict) -> bytes:
+            data["sequence_number"] = next(sequence)
+            return f"event: {data['type']}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+
+        yield event({"type": "response.created", "response": response})
+        yield event({"type": "response.output_item.added", "output_index": 0, "item": {
+            "id": item_id, "type": "message", "role": "assistant", "status": "in_progress", "content": []}})
+        await self.delay(self.args.ttft)
+        interval = 1 / self.args.token_rate if self.args.token_rate > 0 else 0
+        started = time.monotonic()
+        tokens = []
+        for i in range(self.args.tokens):
+            if fail and i == self.args.tokens // 2:
+                yield event({"type": "error", "error": {"message": "Injected stream error", "type": "server_error"}})
+                return
+            # Sleep until the token is due, so the rate holds however late the loop wakes up.
+            await self.delay(started + i * interval - time.monotonic())
+            tokens.append(f" tok{i}")
+            yield event({
+                "type": "response.output_text.delta", "item_id": item_id, "output_index": 0,
+                "content_index": 0, "delta": tokens[-1], "logprobs": []
+            })
+        text = "".join(tokens)
+        item = {
+            "id": item_id, "type": "message", "role": "assistant", "status": "completed",
+            "content": [{"type": "output_text", "text": text, "annotations": []}]
+        }
+        self.items[conversation_id].append(item)
+        yield event({"type": "response.output_item.done", "output_index": 0, "item": item})
+        input_tokens = 20
+        yield event({"type": "response.completed", "response": {
+            **response, "status": "completed", "output": [item],
+            "usage": {
+                "input_tokens": input_tokens, "output_tokens": len(tokens), "total_tokens": input_tokens + len(tokens),
+                "input_tokens_details": {"cached_tokens": 0}, "output_tokens_details": {"reasoning_tokens": 0}
+            }
+        }})
+
+    async def cancel_response(self, request: Request) -> Response:
+        # Only background responses can be cancelled, as with the real API.
+        return JSONResponse(
+            {"error": {"message": "Only background responses can be cancelled.", "type": "invalid_request_error"}},
+            status_code=400)
+
+    async def stats(self, request: Request) -> Response:
+        return JSONResponse({"requests": self.requests, "failed": self.failed, "conversations": len(self.conversations)})
+
+
+def create_stub_app(args: argparse.Namespace) -> Starlette:
+    stub = StubFoundry(args)
+    return Starlette(routes=[
+        Route("/openai/v1/conversations", stub.create_conversation, methods=["POST"]),
+        Route("/openai/v1/conversations/{conversation_id}", stub.conversation, methods=["GET", "POST", "DELETE"]),
+        Route("/openai/v1/conversations/{conversation_id}/items", stub.conversation_items, methods=["GET", "POST"]),
+        Route("/openai/v1/responses", stub.create_response, methods=["POST"]),
+        Route("/openai/v1/responses/{response_id}/cancel", stub.cancel_response, methods=["POST"]),
+        Route("/stats", stub.stats),
+    ])
+
+
+def add_stub_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--tokens", type=int, default=200, help="tokens per answer")
+    parser.add_argument("--token-rate", type=float, default=100.0, help="tokens per second per stream, 0 for no delay")
+    parser.add_argument("--ttft", type=float, default=0.3, help="seconds before the first token")
+    parser.add_argument("--api-latency", type=float, default=0.02, help="seconds taken by the other calls")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of the requests failing")
+    parser.add_argument("--error-status", type=int, default=500, help="HTTP status of the failing requests")
+    parser.add_argument("--stream-error-rate", type=float, default=0.0, help="fraction of the streams failing halfway")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8940)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(create_stub_app(args), port=args.port, log_level="warning")
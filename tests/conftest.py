@@ -0,0 +1,170 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+
+import asyncio
+import itertools
+import os
+import sys
+from types import SimpleNamespace
+from typing import Callable, Dict, List
+
+import pytest
+
+# The app is imported as the package "api", as gunicorn does from src.
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
+
+
+class FakeStream:
+    """An upstream event stream, which records whether it was closed."""
+
+    def __init__(self, events) -> None:
+        self._events = events
+        self.closed = False
+
+    def __aiter__(self):
+        return self._events
+
+    async def close(self) -> None:
+        self.closed = True
+        await self._events.aclose()
+
+
+class FakePage:
+    """A page of conversation items, iterated like the AsyncCursorPage of the SDK."""
+
+    def __init__(self, data: List, has_more: bool) -> None:
+        self.data = data
+        self.has_more = has_more
+        self.last_id = data[-1].id if data else None
+
+    async def __aiter__(self):
+        for item in self.data:
+            yield item
+
+
+class FakeUpstream:
+    """The Conversations and Responses APIs, answering every message with "Hi"."""
+
+    def __init__(self) -> None:
+        from openai.types.conversations import Conversation
+        from openai.types.conversations.message import Message
+        from openai.types.responses import ResponseOutputMessage, ResponseOutputText
+
+        ids = itertools.count(1)
+        self.conversations_by_id: Dict[str, Conversation] = {}
+        # The items of each conversation, newest first.
+        self.items: Dict[str, List[Message]] = {}
+        self.responded: List[str] = []
+        self.streams: List[FakeStream] = []
+        self.calls: List[str] = []
+        # Set to make the responses wait forever after their first delta.
+        self.hang = False
+        # Set to report the input items in response.created, as the service may.
+        self.report_input = False
+
+        def add_item(conversation_id: str, role: str, text: str, item_id: str = "") -> Message:
+            item = Message(
+                id=item_id or f"msg_{next(ids)}", type="message", role=role, status="completed",
+                content=[{"type": "input_text" if role == "user" else "output_text", "text": text, "annotations": []}])
+            self.items.setdefault(conversation_id, []).insert(0, item)
+            return item
+
+        async def create(**kwargs):
+            self.calls.append("conversations.create")
+            conversation = Conversation(id=f"conv_{next(ids)}", created_at=0, metadata={}, object="conversation")
+            self.conversations_by_id[conversation.id] = conversation
+            return conversation.model_copy(deep=True)
+
+        async def retrieve(conversation_id):
+            self.calls.append("conversations.retrieve")
+            if conversation_id not in self.conversations_by_id:
+                raise self.not_found()
+            return self.conversations_by_id[conversation_id].model_copy(deep=True)
+
+        async def update(conversation_id, metadata=None):
+            self.calls.append("conversations.update")
+            self.conversations_by_id[conversation_id] = self.conversations_by_id[conversation_id].model_copy(
+                update={"metadata": dict(metadata or {})})
+
+        async def events(item_id: str, user_item: Message):
+            response = SimpleNamespace(id=f"resp_{next(ids)}")
+            if self.report_input:
+                response.input = [user_item.model_dump()]
+            yield SimpleNamespace(type="response.created", response=response)
+            yield SimpleNamespace(type="response.output_item.added", item=SimpleNamespace(id=item_id, type="message"))
+            yield SimpleNamespace(type="response.output_text.delta", delta="Hi")
+            if self.hang:
+                await asyncio.Event().wait()
+            yield SimpleNamespace(type="response.output_item.done", item=ResponseOutputMessage(
+                id=item_id, type="message", role="assistant", status="completed",
+                content=[ResponseOutputText(type="output_text", text="Hi", annotations=[])]))
+            yield SimpleNamespace(type="response.completed", response=SimpleNamespace(
+                output_text="Hi", usage=SimpleNamespace(input_tokens=1, output_tokens=1, total_tokens=2)))
+
+        async def create_response(conversation, input, **kwargs):
+            self.calls.append("responses.create")
+            if conversation not in self.conversations_by_id:
+                raise self.not_found()
+            self.responded.append(conversation)
+            user_item = add_item(conversation, "user", input)
+            stream = FakeStream(events(add_item(conversation, "assistant", "Hi").id, user_item))
+            self.streams.append(stream)
+            return stream
+
+        async def list_items(conversation_id, order="desc", limit=20, after=None):
+            self.calls.append("conversations.items.list")
+            items = self.items.get(conversation_id, [])
+            start = [item.id for item in items].index(after) + 1 if after else 0
+            return FakePage(items[start:start + limit], start + limit < len(items))
+
+        async def create_items(conversation_id, items):
+            self.calls.append("conversations.items.create")
+            return SimpleNamespace(data=[
+                add_item(conversation_id, item["role"], item["content"]) for item in items])
+
+        self.conversations = SimpleNamespace(
+            create=create, retrieve=retrieve, update=update,
+            items=SimpleNamespace(list=list_items, create=create_items))
+        self.responses = SimpleNamespace(create=create_response)
+
+    @staticmethod
+    def not_found():
+        import httpx
+        import openai
+        request = httpx.Request("POST", "https://example.com/openai/responses")
+        return openai.NotFoundError("Conversation not found", response=httpx.Response(404, request=request), body=None)
+
+
+@pytest.fixture
+def upstream() -> FakeUpstream:
+    return FakeUpstream()
+
+
+@pytest.fixture
+def make_client() -> Callable:
+    """Return a factory of TestClients of an app with the chat routes and the given upstream."""
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    from api.admission import AdmissionController
+    from api.cancellation import UpstreamCanceller
+    from api.conversation_cache import ConversationCache
+    from api.created_at_writer import CreatedAtWriter
+    from api.routes import router
+    from api.session import SessionCodec
+
+    def make(upstream: FakeUpstream, base_url: str = "http://testserver") -> TestClient:
+        app = FastAPI()
+        app.include_router(router)
+        app.state.agent_version_obj = SimpleNamespace(id="agent:1", name="agent", version="1")
+        app.state.openai_client = upstream
+        app.state.conversation_cache = ConversationCache()
+        app.state.admission_controller = AdmissionController(max_active=0)
+        app.state.upstream_canceller = UpstreamCanceller(upstream)
+        app.state.created_at_writer = CreatedAtWriter(upstream)
+        app.state.session_codec = SessionCodec(b"secret")
+        return TestClient(app, base_url=base_url)
+
+    return make
@@ -0,0 +1,152 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from api.admission import AdmissionController, AdmissionRejected, ReleasingStreamingResponse
+
+
+def run(main):
+    return asyncio.run(main())
+
+
+def test_requests_over_the_limit_wait_for_a_slot():
+    async def main():
+        admission = AdmissionController(max_active=2, max_queue=1, queue_timeout=5)
+        await admission.acquire()
+        await admission.acquire()
+        waiter = asyncio.create_task(admission.acquire())
+        await asyncio.sleep(0)
+        assert (admission.active, admission.waiting) == (2, 1)
+        admission.release()
+        await waiter
+        return admission.stats()
+
+    stats = run(main)
+    assert stats["active"] == 2
+    assert stats["waiting"] == 0
+    assert stats["admitted"] == 3
+    assert stats["rejected"] == 0
+
+
+def test_full_queue_is_rejected_with_retry_after():
+    async def main():
+        admission = AdmissionController(max_active=1, max_queue=1, queue_timeout=2.5)
+        await admission.acquire()
+        waiter = asyncio.create_task(admission.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await admission.acquire()
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        return admission, rejected.value
+
+    admission, rejected = run(main)
+    assert rejected.retry_after == 3
+    assert admission.rejected == 1
+    assert admission.timed_out == 0
+    assert admission.waiting == 0
+
+
+def test_wait_times_out():
+    async def main():
+        admission = AdmissionController(max_active=1, max_queue=4, queue_timeout=0.05)
+        await admission.acquire()
+        with pytest.raises(AdmissionRejected):
+            await admission.acquire()
+        return admission
+
+    admission = run(main)
+    assert admission.timed_out == 1
+    assert admission.rejected == 1
+    assert admission.waiting == 0
+    assert admission.wait_time_max >= 0.05
+    # The slot of the timed out request was never taken.
+    assert admission.active == 1
+
+
+def test_disabled_limit_admits_everything():
+    async def main():
+        admission = AdmissionController(max_active=0, max_queue=0)
+        for _ in range(100):
+            await admission.acquire()
+        return admission
+
+    assert run(main).active == 100
+
+
+def make_app(admission: AdmissionController) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/stream")
+    async def stream():
+        await admission.acquire()
+
+        async def body():
+            yield b"first\n"
+            yield b"second\n"
+
+        return ReleasingStreamingResponse(body(), on_close=admission.release)
+
+    return app
+
+
+def test_slot_is_released_when_the_response_ends():
+    admission = AdmissionController(max_active=1, max_queue=0)
+    response = TestClient(make_app(admission)).get("/stream")
+    assert response.text == "first\nsecond\n"
+    assert admission.active == 0
+
+
+def test_slot_is_released_on_disconnect():
+    admission = AdmissionController(max_active=1, max_queue=0)
+    app = make_app(admission)
+
+    async def main():
+        disconnected = asyncio.Event()
+        received = [{"type": "http.request", "body": b"", "more_body": False}]
+        sent = []
+
+        async def receive():
+            if received:
+                return received.pop(0)
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+            if message["type"] == "http.response.body":
+                # The client leaves after the first chunk.
+                disconnected.set()
+                await asyncio.sleep(0.01)
+
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+            "scheme": "http", "path": "/stream", "raw_path": b"/stream", "root_path": "", "query_string": b"",
+            "headers": [(b"host", b"testserver")], "client": ("testclient", 50000), "server": ("testserver", 80),
+        }
+        await app(scope, receive, send)
+        return sent
+
+    sent = run(main)
+    assert [message.get("body") for message in sent if message["type"] == "http.response.body"] == [b"first\n"]
+    assert admission.active == 0
+    # The released slot admits the next request right away.
+    assert TestClient(app).get("/stream").status_code == 200
+
+
+def test_chat_is_rejected_with_429(upstream, make_client):
+    client = make_client(upstream)
+    admission = client.app.state.admission_controller = AdmissionController(max_active=1, max_queue=0, queue_timeout=7)
+    run(admission.acquire)
+
+    response = client.post("/chat", json={"message": "Hello"})
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "7"
+    assert upstream.responded == []
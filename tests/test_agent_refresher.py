@@ -0,0 +1,104 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+
+import asyncio
+from types import SimpleNamespace
+from typing import Dict, List
+
+import pytest
+from azure.core.exceptions import ResourceNotModifiedError
+
+from api import routes
+from api.agent_refresher import AgentVersionRefresher, same_agent_name
+
+
+def agent_version(version: str) -> SimpleNamespace:
+    return SimpleNamespace(id=f"agent:{version}", name="agent", version=version)
+
+
+class FakeAgents:
+    """agents.get of the project client, answering 304 to the ETag of the latest version."""
+
+    def __init__(self) -> None:
+        self.latest = agent_version("1")
+        self.requests: List[Dict[str, str]] = []
+
+    @property
+    def etag(self) -> str:
+        return f'"v{self.latest.version}"'
+
+    async def get(self, agent_name, headers, cls):
+        self.requests.append(headers)
+        if headers.get("If-None-Match") == self.etag:
+            raise ResourceNotModifiedError()
+        response = SimpleNamespace(http_response=SimpleNamespace(headers={"ETag": self.etag}))
+        return cls(response, SimpleNamespace(name=agent_name, versions=SimpleNamespace(latest=self.latest)), {})
+
+
+@pytest.fixture
+def agents() -> FakeAgents:
+    return FakeAgents()
+
+
+def make_refresher(agents: FakeAgents) -> AgentVersionRefresher:
+    state = SimpleNamespace(agent_version_obj=agent_version("1"))
+    return AgentVersionRefresher(SimpleNamespace(agents=agents), state)
+
+
+def test_unchanged_agent_is_not_modified(agents: FakeAgents):
+    refresher = make_refresher(agents)
+    current = refresher._state.agent_version_obj
+    assert not asyncio.run(refresher.refresh())
+    assert not asyncio.run(refresher.refresh())
+
+    assert agents.requests == [{}, {"If-None-Match": '"v1"'}]
+    assert refresher.stats() == {"polls": 2, "not_modified": 1, "swaps": 0, "errors": 0}
+    assert refresher._state.agent_version_obj is current
+
+
+def test_new_version_is_swapped_in(agents: FakeAgents):
+    refresher = make_refresher(agents)
+    asyncio.run(refresher.refresh())
+    started_with = refresher._state.agent_version_obj
+
+    agents.latest = agent_version("2")
+    assert asyncio.run(refresher.refresh())
+    assert refresher._state.agent_version_obj is agents.latest
+    # A running stream keeps the version object it was started with.
+    assert started_with.version == "1"
+    assert refresher.swaps == 1
+    # The ETag of the new version is sent from now on.
+    assert not asyncio.run(refresher.refresh())
+    assert agents.requests[-1] == {"If-None-Match": '"v2"'}
+
+
+def test_errors_keep_the_version(agents: FakeAgents):
+    async def fail(*args, **kwargs):
+        raise ConnectionError("unreachable")
+
+    agents.get = fail
+    refresher = make_refresher(agents)
+    assert not asyncio.run(refresher.refresh())
+    assert refresher.errors == 1
+    assert refresher._state.agent_version_obj.version == "1"
+
+
+def test_same_agent_name():
+    assert same_agent_name("agent:1", "agent:2")
+    assert not same_agent_name("other:1", "agent:2")
+    assert not same_agent_name(None, "agent:2")
+    assert not same_agent_name("", "agent:2")
+
+
+@pytest.mark.parametrize("keep, kept", [(True, True), (False, False)])
+def test_conversations_of_earlier_versions(monkeypatch, upstream, keep, kept):
+    monkeypatch.setattr(routes, "keep_conversations_across_versions", keep)
+    conversation = asyncio.run(upstream.conversations.create())
+
+    used = asyncio.run(routes.get_or_create_conversation(upstream, conversation.id, "agent:1", "agent:2"))
+    assert (used.id == conversation.id) is kept
+    # A conversation of another agent is never kept.
+    used = asyncio.run(routes.get_or_create_conversation(upstream, conversation.id, "other:1", "agent:2"))
+    assert used.id != conversation.id
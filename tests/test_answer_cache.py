@@ -0,0 +1,92 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from openai.types.conversations import Conversation
+
+from api.answer_cache import ANSWER_CACHE_HEADER, AnswerCache
+from api.created_at_writer import CreatedAtWriter
+from api.routes import is_first_turn
+
+
+@pytest.fixture
+def make_worker(make_client):
+    """Return a factory of workers without sessions and conversation cache, sharing one answer cache."""
+    answer_cache = AnswerCache(max_size=10)
+
+    def make(upstream) -> TestClient:
+        client = make_client(upstream)
+        client.app.state.session_codec = None
+        client.app.state.conversation_cache = None
+        client.app.state.answer_cache = answer_cache
+        return client
+
+    return make
+
+
+def answer_cache_status(client: TestClient, message: str) -> str:
+    response = client.post("/chat", json={"message": message})
+    assert response.status_code == 200
+    return response.headers[ANSWER_CACHE_HEADER]
+
+
+def test_first_turn_is_replayed(upstream, make_worker):
+    assert answer_cache_status(make_worker(upstream), "Hello") == "miss"
+    assert answer_cache_status(make_worker(upstream), "hello?") == "hit"
+    assert len(upstream.responded) == 1
+
+
+def test_later_turn_is_not_replayed(upstream, make_worker):
+    client = make_worker(upstream)
+    answer_cache_status(client, "Hello")
+    answer_cache_status(make_worker(upstream), "Hello")
+    assert answer_cache_status(client, "Hello") == "miss"
+    assert len(upstream.responded) == 2
+
+
+def test_later_turn_on_another_worker_is_not_replayed(upstream, make_worker):
+    client = make_worker(upstream)
+    answer_cache_status(client, "Hello")
+    # The created_at of the first turn is not written yet, so the metadata knows of no turn.
+    other = make_worker(upstream)
+    other.cookies.update(client.cookies)
+    assert answer_cache_status(other, "Hello") == "miss"
+    assert len(upstream.responded) == 2
+
+
+def test_later_turn_of_a_websocket_is_not_replayed(upstream, make_worker):
+    client = make_worker(upstream)
+    with client.websocket_connect("/ws/chat") as websocket:
+        for _ in range(2):
+            websocket.send_text(json.dumps({"type": "message", "message": "Hello"}))
+            while json.loads(websocket.receive_text())["type"] != "stream_end":
+                pass
+            # The timestamps are written; the metadata of the connection's conversation is not updated.
+            asyncio.run(client.app.state.created_at_writer.flush())
+    assert len(upstream.responded) == 2
+
+
+def test_is_first_turn(upstream):
+    conversation = asyncio.run(upstream.conversations.create())
+    writer = CreatedAtWriter(upstream)
+    assert asyncio.run(is_first_turn(upstream, conversation, None, created_at_writer=writer))
+    assert asyncio.run(is_first_turn(upstream, conversation, None, created=True))
+
+    upstream.calls.clear()
+    with_timestamp = conversation.model_copy(update={"metadata": {"msg_1_created_at": "1.0"}})
+    assert not asyncio.run(is_first_turn(upstream, with_timestamp, None))
+    cached = conversation.model_copy(update={"metadata": None})
+    assert not asyncio.run(is_first_turn(upstream, cached, None))
+    writer.enqueue(conversation, 1.0)
+    assert not asyncio.run(is_first_turn(upstream, conversation, None, created_at_writer=writer))
+    assert upstream.calls == []
+
+    # A turn of another worker, whose timestamp is not written yet.
+    asyncio.run(upstream.responses.create(conversation=conversation.id, input="Hello"))
+    assert not asyncio.run(is_first_turn(upstream, conversation, None))
@@ -0,0 +1,104 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+
+import asyncio
+from typing import Dict, List
+
+import pytest
+
+from api.batch import BatchItem, group_by_conversation, parse_batch_items, run_bounded
+
+
+def test_parse_strings_and_objects():
+    items = parse_batch_items({"items": [
+        "Hello",
+        {"message": "Hi", "id": 7, "conversation_id": "conv_1"},
+        {"message": "Hey", "conversation_id": ""},
+    ]}, max_items=10)
+    assert items == [
+        BatchItem(index=0, message="Hello"),
+        BatchItem(index=1, message="Hi", id="7", conversation_id="conv_1"),
+        BatchItem(index=2, message="Hey"),
+    ]
+
+
+@pytest.mark.parametrize("data, error", [
+    (None, "non-empty 'items' list"),
+    ([], "non-empty 'items' list"),
+    ({"items": []}, "non-empty 'items' list"),
+    ({"items": "Hello"}, "non-empty 'items' list"),
+    ({"items": ["a", "b", "c"]}, "at most 2 items, got 3"),
+    ({"items": ["a", 1]}, "item 1 has no 'message' string"),
+    ({"items": [{"id": "x"}]}, "item 0 has no 'message' string"),
+    ({"items": [{"message": None}]}, "item 0 has no 'message' string"),
+])
+def test_parse_errors(data, error):
+    with pytest.raises(ValueError, match=error):
+        parse_batch_items(data, max_items=2)
+
+
+def test_group_by_conversation():
+    items = parse_batch_items({"items": [
+        {"message": "a", "conversation_id": "c1"},
+        "b",
+        {"message": "c", "conversation_id": "c2"},
+        {"message": "d", "conversation_id": "c1"},
+        "e",
+    ]}, max_items=10)
+    groups = group_by_conversation(items)
+    assert [[item.message for item in group] for group in groups] == [["a", "d"], ["b"], ["c"], ["e"]]
+
+
+def test_run_bounded_limits_concurrency_and_orders_groups():
+    items = parse_batch_items({"items": [
+        {"message": "a", "conversation_id": "c1"},
+        {"message": "b", "conversation_id": "c1"},
+        "c",
+        "d",
+        "e",
+    ]}, max_items=10)
+    running = 0
+    max_running = 0
+    finished: List[str] = []
+
+    async def run_item(item: BatchItem) -> Dict:
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        finished.append(item.message)
+        return {"index": item.index}
+
+    async def run() -> List[Dict]:
+        return [result async for result in run_bounded(group_by_conversation(items), run_item, concurrency=2)]
+
+    results = asyncio.run(run())
+    assert sorted(result["index"] for result in results) == [0, 1, 2, 3, 4]
+    assert max_running == 2
+    # The items of one conversation run one after the other.
+    assert finished.index("a") < finished.index("b")
+
+
+def test_closing_run_bounded_cancels_items():
+    items = parse_batch_items({"items": ["a", "b", "c"]}, max_items=10)
+    cancelled = []
+
+    async def run_item(item: BatchItem) -> Dict:
+        try:
+            await asyncio.sleep(0 if item.index == 0 else 10)
+        except asyncio.CancelledError:
+            cancelled.append(item.index)
+            raise
+        return {"index": item.index}
+
+    async def run() -> Dict:
+        results = run_bounded(group_by_conversation(items), run_item, concurrency=3)
+        first = await results.__anext__()
+        await results.aclose()
+        return first
+
+    assert asyncio.run(run()) == {"index": 0}
+    assert sorted(cancelled) == [1, 2]
@@ -0,0 +1,77 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+
+from api import cache
+from api.cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+def test_entry_expires_after_ttl(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache.time, "monotonic", clock.monotonic)
+    entries = TTLCache(max_size=8, ttl=10)
+    entries.set("a", 1)
+    clock.now += 9
+    assert entries.get("a") == 1
+    clock.now += 2
+    assert entries.peek("a") is None
+    assert entries.get("a") is None
+    assert entries.stats() == {"hits": 1, "misses": 1, "size": 0}
+
+
+def test_least_recently_used_is_evicted():
+    entries = TTLCache(max_size=2)
+    entries.set("a", 1)
+    entries.set("b", 2)
+    # Reading "a" makes "b" the least recently used.
+    assert entries.get("a") == 1
+    entries.set("c", 3)
+    assert entries.get("b") is None
+    assert entries.get("a") == 1
+    assert entries.get("c") == 3
+
+
+def test_peek_does_not_refresh_position_or_count():
+    entries = TTLCache(max_size=2)
+    entries.set("a", 1)
+    entries.set("b", 2)
+    assert entries.peek("a") == 1
+    entries.set("c", 3)
+    assert entries.peek("a") is None
+    assert entries.stats() == {"hits": 0, "misses": 0, "size": 2}
+
+
+def test_set_refreshes_ttl(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache.time, "monotonic", clock.monotonic)
+    entries = TTLCache(ttl=10)
+    entries.set("a", 1)
+    clock.now += 8
+    entries.set("a", 2)
+    clock.now += 8
+    assert entries.get("a") == 2
+
+
+def test_invalidate():
+    entries = TTLCache()
+    entries.set("a", 1)
+    entries.invalidate("a")
+    entries.invalidate("missing")
+    assert entries.get("a") is None
+
+
+def test_size_zero_disables_cache():
+    entries = TTLCache(max_size=0)
+    assert not entries.enabled
+    entries.set("a", 1)
+    assert entries.get("a") is None
+    assert entries.stats()["size"] == 0
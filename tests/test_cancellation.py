@@ -0,0 +1,58 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+
+import asyncio
+from types import SimpleNamespace
+from typing import List
+
+import pytest
+
+from api.cancellation import UpstreamCanceller
+
+
+class FakeStream:
+    def __init__(self) -> None:
+        self.closed = False
+
+    async def close(self) -> None:
+        self.closed = True
+
+
+class FakeOpenAI:
+    def __init__(self) -> None:
+        self.cancelled: List[str] = []
+
+        async def cancel(response_id):
+            self.cancelled.append(response_id)
+
+        self.responses = SimpleNamespace(cancel=cancel)
+
+
+@pytest.mark.parametrize("cancel_responses, cancelled", [(None, []), (False, []), (True, ["resp_1"])])
+def test_stream_is_closed_and_response_cancelled_only_if_enabled(cancel_responses, cancelled):
+    client = FakeOpenAI()
+    stream = FakeStream()
+
+    async def main():
+        kwargs = {} if cancel_responses is None else {"cancel_responses": cancel_responses}
+        canceller = UpstreamCanceller(client, **kwargs)
+        canceller.cancel(stream, "resp_1", streamed_tokens=5, elapsed=0.5)
+        await canceller.close()
+
+    asyncio.run(main())
+    assert stream.closed
+    assert client.cancelled == cancelled
+
+
+def test_savings_are_estimated_from_completed_responses():
+    async def main():
+        canceller = UpstreamCanceller(FakeOpenAI(), smoothing=0.5)
+        canceller.record_completed(output_tokens=100, duration=4.0)
+        canceller.record_completed(output_tokens=200, duration=6.0)
+        canceller.cancel(None, None, streamed_tokens=50, elapsed=1.0)
+        await canceller.close()
+        return canceller.stats()
+
+    assert asyncio.run(main()) == {"cancelled": 1, "tokens_saved": 100, "seconds_saved": 4.0}
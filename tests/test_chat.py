@@ -0,0 +1,111 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+
+import asyncio
+import json
+from typing import Dict
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from api.history_cache import HistoryCache
+from api.session import SESSION_COOKIE
+
+
+def send(client: TestClient, message: str) -> httpx.Response:
+    response = client.post("/chat", json={"message": message})
+    assert response.status_code == 200
+    return response
+
+
+def set_cookie_headers(response: httpx.Response) -> Dict[str, str]:
+    return {header.split("=", 1)[0]: header.lower() for header in response.headers.get_list("set-cookie")}
+
+
+def test_session_cookie_flags(upstream, make_client):
+    cookies = set_cookie_headers(send(make_client(upstream), "Hello"))
+    assert "httponly" in cookies[SESSION_COOKIE]
+    assert "samesite=lax" in cookies[SESSION_COOKIE]
+    assert "secure" not in cookies[SESSION_COOKIE]
+    # The page clears the conversation cookies for a new chat.
+    assert "httponly" not in cookies["conversation_id"]
+
+
+@pytest.mark.parametrize("base_url, headers", [
+    ("https://testserver", {}),
+    ("http://testserver", {"X-Forwarded-Proto": "https"}),
+])
+def test_cookies_are_secure_over_https(upstream, make_client, base_url, headers):
+    response = make_client(upstream, base_url).post("/chat", json={"message": "Hello"}, headers=headers)
+    assert all("; secure" in cookie for cookie in set_cookie_headers(response).values())
+
+
+def test_deleted_conversation_is_replaced(upstream, make_client):
+    client = make_client(upstream)
+    send(client, "Hello")
+    first = client.cookies["conversation_id"]
+    # Deleted upstream, while the session cookie and the cache still know it.
+    del upstream.conversations_by_id[first]
+
+    response = send(client, "Hello again")
+    frames = [json.loads(line[len("data: "):]) for line in response.text.splitlines() if line.startswith("data: ")]
+    assert frames[-1] == {"type": "stream_end"}
+    assert {"content": "Hi", "type": "message"} in frames
+    second = client.cookies["conversation_id"]
+    assert second != first
+    assert upstream.responded == [first, second]
+    assert client.app.state.conversation_cache.peek(first) is None
+
+
+def test_disconnect_before_the_body_closes_the_upstream(upstream, make_client):
+    app = make_client(upstream).app
+    body = json.dumps({"message": "Hello"}).encode()
+
+    async def run():
+        received = [{"type": "http.request", "body": body, "more_body": False}]
+        disconnected = asyncio.Event()
+
+        async def receive():
+            if received:
+                return received.pop(0)
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            # The client is gone before the headers could be sent, so the body is never started.
+            disconnected.set()
+            raise OSError("Connection reset by peer")
+
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+            "scheme": "http", "path": "/chat", "raw_path": b"/chat", "root_path": "", "query_string": b"",
+            "headers": [(b"host", b"testserver"), (b"content-type", b"application/json")],
+            "client": ("testclient", 50000), "server": ("testserver", 80),
+        }
+        await app(scope, receive, send)
+        await app.state.upstream_canceller.close()
+
+    asyncio.run(run())
+    assert [stream.closed for stream in upstream.streams] == [True]
+    assert app.state.upstream_canceller.cancelled == 1
+    assert app.state.admission_controller.active == 0
+    assert app.state.created_at_writer.is_pending(upstream.responded[0])
+
+
+def test_completed_turn_has_the_reported_user_message_id(upstream, make_client):
+    upstream.report_input = True
+    with make_client(upstream) as client:
+        client.app.state.history_cache = HistoryCache()
+        send(client, "Hello")
+        client.get("/chat/history")
+        send(client, "Again")
+
+        # The writer has not run, the ID comes from the response.
+        response = client.get("/chat/history", params={"limit": 1})
+        response = client.get("/chat/history", params={"limit": 1, "before": response.headers["X-Next-Before"]})
+        [message] = response.json()
+        assert message["content"] == "Again"
+        assert response.headers["X-Next-Before"] == message["id"]
@@ -0,0 +1,81 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+from openai.types.conversations import Conversation
+from openai.types.responses import ResponseOutputMessage, ResponseOutputText
+from openai.types.responses.response_output_text import AnnotationFileCitation, AnnotationURLCitation
+
+from api.cancellation import UpstreamCanceller
+from api.created_at_writer import CreatedAtWriter
+from api.routes import get_result
+
+FILE_CITATION = AnnotationFileCitation(type="file_citation", file_id="file_1", filename="a.pdf", index=5)
+URL_CITATION = AnnotationURLCitation(type="url_citation", start_index=2, end_index=4, title="Site", url="https://example.com")
+
+
+def part_events(item_id: str, content_index: int, text: str, annotations):
+    yield SimpleNamespace(type="response.output_text.delta", item_id=item_id, delta=text)
+    for annotation in annotations:
+        yield SimpleNamespace(
+            type="response.output_text.annotation.added", item_id=item_id, content_index=content_index,
+            annotation=annotation.model_dump())
+    yield SimpleNamespace(
+        type="response.content_part.done", item_id=item_id, content_index=content_index,
+        part=ResponseOutputText(type="output_text", text=text, annotations=annotations))
+
+
+def message_events(item_id: str, parts):
+    yield SimpleNamespace(type="response.output_item.added", item=SimpleNamespace(id=item_id, type="message"))
+    for content_index, (text, annotations) in enumerate(parts):
+        yield from part_events(item_id, content_index, text, annotations)
+    yield SimpleNamespace(type="response.output_item.done", item=ResponseOutputMessage(
+        id=item_id, type="message", role="assistant", status="completed",
+        content=[ResponseOutputText(type="output_text", text=text, annotations=annotations) for text, annotations in parts]))
+
+
+async def stream():
+    yield SimpleNamespace(type="response.created", response=SimpleNamespace(id="resp_1"))
+    for event in message_events("msg_1", [("Hello ", [FILE_CITATION]), ("world", [URL_CITATION])]):
+        yield event
+    # The offsets of a message start at its own first part.
+    for event in message_events("msg_2", [("Bye", [FILE_CITATION.model_copy(update={"index": 1})])]):
+        yield event
+    yield SimpleNamespace(type="response.completed", response=SimpleNamespace(output_text="", usage=None))
+
+
+def stream_frames():
+    async def main():
+        client = SimpleNamespace()
+        upstream = asyncio.get_running_loop().create_future()
+        upstream.set_result(stream())
+        body = get_result(
+            SimpleNamespace(id="agent:1", name="agent", version="1"),
+            Conversation(id="conv_1", created_at=0, metadata={}, object="conversation"),
+            "Hi", client, {}, CreatedAtWriter(client), UpstreamCanceller(client), upstream=upstream)
+        return b"".join([chunk async for chunk in body])
+
+    text = asyncio.run(main()).decode("utf-8")
+    return [json.loads(line[len("data: "):]) for line in text.splitlines() if line.startswith("data: ")]
+
+
+def test_citations_are_sent_with_the_offsets_of_their_parts():
+    frames = stream_frames()
+    assert [frame for frame in frames if frame["type"] == "citation"] == [
+        {"label": "a.pdf", "index": 5, "type": "citation"},
+        {"label": "Site", "index": 8, "type": "citation"},
+        {"label": "a.pdf", "index": 1, "type": "citation"},
+    ]
+
+
+def test_completed_messages_have_each_citation_once():
+    completed = [frame for frame in stream_frames() if frame["type"] == "completed_message"]
+    assert [(message["content"], message["annotations"]) for message in completed] == [
+        ("Hello world", [{"label": "a.pdf", "index": 5}, {"label": "Site", "index": 8}]),
+        ("Bye", [{"label": "a.pdf", "index": 1}]),
+    ]
@@ -0,0 +1,69 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from api.compression import CompressionMiddleware, parse_accept_encoding, select_encoding
+
+BODY = "Hello world! " * 100
+
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    ("gzip, deflate, br", "br"),
+    ("gzip", "gzip"),
+    ("br;q=0.5, gzip;q=0.8", "gzip"),
+    ("gzip;q=1.0, br;q=1.0", "br"),
+    ("*", "br"),
+    ("*;q=0.5, br;q=0", "gzip"),
+    ("br;q=0, gzip;q=0", None),
+    ("identity", None),
+    ("", None),
+])
+def test_select_encoding(accept_encoding, expected):
+    assert select_encoding(accept_encoding, ["br", "gzip"]) == expected
+
+
+def test_parse_accept_encoding():
+    assert parse_accept_encoding("GZIP;q=0.3, br, x;q=bad,,") == {"gzip": 0.3, "br": 1.0, "x": 0.0}
+
+
+def make_client() -> TestClient:
+    async def text(request):
+        return PlainTextResponse(BODY)
+
+    async def small(request):
+        return PlainTextResponse("Hello")
+
+    async def image(request):
+        return Response(BODY.encode(), media_type="image/png")
+
+    async def events(request):
+        async def stream():
+            yield b"data: {}\n\n"
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    app = Starlette(routes=[
+        Route("/text", text), Route("/small", small), Route("/image", image), Route("/events", events),
+    ])
+    app.add_middleware(CompressionMiddleware, minimum_size=500)
+    return TestClient(app)
+
+
+@pytest.mark.parametrize("accept_encoding, encoding", [("gzip, br", "br"), ("gzip", "gzip")])
+def test_compresses_with_selected_encoding(accept_encoding, encoding):
+    response = make_client().get("/text", headers={"Accept-Encoding": accept_encoding})
+    assert response.headers["content-encoding"] == encoding
+    # The client decodes the body.
+    assert response.text == BODY
+
+
+@pytest.mark.parametrize("path", ["/small", "/image", "/events"])
+def test_sent_as_is(path):
+    response = make_client().get(path, headers={"Accept-Encoding": "br, gzip"})
+    assert "content-encoding" not in response.headers
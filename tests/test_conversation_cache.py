@@ -0,0 +1,49 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+
+import asyncio
+from typing import Dict
+
+from openai.types.conversations import Conversation
+
+from api.conversation_cache import ConversationCache
+from api.routes import get_or_create_conversation, is_first_turn
+
+
+class FakeConversations:
+    def __init__(self, conversation: Conversation) -> None:
+        self.stored: Dict[str, Conversation] = {conversation.id: conversation}
+        self.retrieved = 0
+
+    async def retrieve(self, conversation_id: str) -> Conversation:
+        self.retrieved += 1
+        return self.stored[conversation_id].model_copy(deep=True)
+
+
+class FakeOpenAI:
+    def __init__(self, conversations: FakeConversations) -> None:
+        self.conversations = conversations
+
+
+def make_upstream() -> FakeConversations:
+    return FakeConversations(Conversation(id="conv_1", created_at=0, metadata={}, object="conversation"))
+
+
+def test_metadata_is_not_cached():
+    cache = ConversationCache()
+    cache.put(Conversation(id="conv_1", created_at=0, metadata={"msg_1_created_at": "1.0"}, object="conversation"))
+    assert cache.get("conv_1").metadata is None
+
+
+def test_cache_hit_does_not_retrieve():
+    upstream = make_upstream()
+    cache = ConversationCache()
+    cache.put(upstream.stored["conv_1"])
+    conversation = asyncio.run(get_or_create_conversation(FakeOpenAI(upstream), "conv_1", "agent:1", "agent:1", cache))
+    assert conversation.id == "conv_1"
+    assert upstream.retrieved == 0
+    # Another worker may have added turns, so the answer cache is not used.
+    assert not asyncio.run(is_first_turn(FakeOpenAI(upstream), conversation, None))
+
@@ -0,0 +1,88 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+
+import asyncio
+import itertools
+from types import SimpleNamespace
+from typing import List
+
+from openai.types.conversations import Conversation
+
+from api.conversation_pool import ConversationPool
+
+
+class FakeOpenAI:
+    def __init__(self) -> None:
+        ids = itertools.count(1)
+        self.deleted: List[str] = []
+
+        async def create():
+            return Conversation(id=f"conv_{next(ids)}", created_at=0, metadata={}, object="conversation")
+
+        async def delete(conversation_id):
+            self.deleted.append(conversation_id)
+
+        self.conversations = SimpleNamespace(create=create, delete=delete)
+
+
+def test_disabled_by_default():
+    assert not ConversationPool(FakeOpenAI()).enabled
+
+
+def test_take_and_refill():
+    client = FakeOpenAI()
+
+    async def main():
+        pool = ConversationPool(client, size=2)
+        pool.start()
+        await asyncio.sleep(0.01)
+        taken = pool.take()
+        await asyncio.sleep(0.01)
+        stats = pool.stats()
+        await pool.close()
+        return taken, stats
+
+    taken, stats = asyncio.run(main())
+    assert taken.id == "conv_1"
+    assert stats["depth"] == 2
+    assert stats["created"] == 3
+    # The conversations still pooled are deleted at shutdown.
+    assert sorted(client.deleted) == ["conv_2", "conv_3"]
+
+
+def test_expired_conversations_are_deleted():
+    client = FakeOpenAI()
+
+    async def main():
+        pool = ConversationPool(client, size=2, max_age=0.02)
+        pool.start()
+        await asyncio.sleep(0.03)
+        # Evicted and replaced by the refilling task, before any take.
+        deleted = list(client.deleted)
+        stats = pool.stats()
+        taken = pool.take()
+        await pool.close()
+        return taken, deleted, stats
+
+    taken, deleted, stats = asyncio.run(main())
+    assert {"conv_1", "conv_2"} <= set(deleted)
+    assert stats["expired"] >= 2
+    assert stats["depth"] == 2
+    assert taken.id not in ("conv_1", "conv_2")
+
+
+def test_take_skips_an_expired_conversation():
+    client = FakeOpenAI()
+
+    async def main():
+        pool = ConversationPool(client, size=1, max_age=0.0)
+        pool.start()
+        await asyncio.sleep(0)
+        # The conversation has expired, the refilling task has not run since.
+        taken = pool.take()
+        await pool.close()
+        return taken
+
+    assert asyncio.run(main()) is None
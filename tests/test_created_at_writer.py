@@ -0,0 +1,87 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+
+import asyncio
+import copy
+from types import SimpleNamespace
+from typing import Dict
+
+from openai.types.conversations import Conversation
+
+from api.created_at_writer import CreatedAtWriter, get_created_at_label, get_input_message_id
+
+
+class FakeConversations:
+    """The conversations API of one upstream, shared by the workers."""
+
+    def __init__(self, conversation: Conversation) -> None:
+        self.stored: Dict[str, Conversation] = {conversation.id: conversation}
+
+    async def retrieve(self, conversation_id: str) -> Conversation:
+        return copy.deepcopy(self.stored[conversation_id])
+
+    async def update(self, conversation_id: str, metadata: Dict[str, str]) -> Conversation:
+        # Like the service, the metadata is replaced as a whole.
+        self.stored[conversation_id].metadata = dict(metadata)
+        return copy.deepcopy(self.stored[conversation_id])
+
+
+class FakeOpenAI:
+    def __init__(self, conversations: FakeConversations) -> None:
+        self.conversations = conversations
+
+
+def test_workers_keep_each_others_created_at():
+    upstream = FakeConversations(Conversation(id="conv_1", created_at=0, metadata={}, object="conversation"))
+    # Each worker holds the conversation as it was before either write, e.g. from a session cookie.
+    stale = copy.deepcopy(upstream.stored["conv_1"])
+    writers = [CreatedAtWriter(FakeOpenAI(upstream)) for _ in range(2)]
+
+    async def write(writer: CreatedAtWriter, message_id: str, created_at: float) -> None:
+        writer.enqueue(stale, created_at, message_id=message_id)
+        await writer.flush()
+
+    asyncio.run(write(writers[0], "msg_1", 1.0))
+    asyncio.run(write(writers[1], "msg_2", 2.0))
+
+    metadata = upstream.stored["conv_1"].metadata
+    assert metadata[get_created_at_label("msg_1")] == "1.0"
+    assert metadata[get_created_at_label("msg_2")] == "2.0"
+
+
+def created_at_calls(client, upstream) -> list:
+    upstream.calls.clear()
+    client.portal.call(client.app.state.created_at_writer.flush)
+    return upstream.calls
+
+
+def test_reported_input_message_is_not_looked_up(upstream, make_client):
+    upstream.report_input = True
+    with make_client(upstream) as client:
+        client.post("/chat", json={"message": "Hello"})
+        assert created_at_calls(client, upstream) == ["conversations.retrieve", "conversations.update"]
+    [conversation] = upstream.conversations_by_id.values()
+    user_item = upstream.items[conversation.id][-1]
+    assert get_created_at_label(user_item.id) in conversation.metadata
+
+
+def test_input_message_is_looked_up_after_the_anchor(upstream, make_client):
+    with make_client(upstream) as client:
+        client.post("/chat", json={"message": "Hello"})
+        assert created_at_calls(client, upstream) == [
+            "conversations.retrieve", "conversations.items.list", "conversations.update"]
+    [conversation] = upstream.conversations_by_id.values()
+    user_item = upstream.items[conversation.id][-1]
+    assert list(conversation.metadata) == [get_created_at_label(user_item.id)]
+
+
+def test_get_input_message_id():
+    assert get_input_message_id(SimpleNamespace(id="resp_1")) is None
+    response = SimpleNamespace(input=[
+        {"type": "message", "role": "user", "id": "msg_1"},
+        SimpleNamespace(type="message", role="user", id="msg_2"),
+        {"type": "message", "role": "assistant", "id": "msg_3"},
+    ])
+    assert get_input_message_id(response) == "msg_2"
@@ -0,0 +1,155 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+
+import itertools
+from types import SimpleNamespace
+from typing import Dict, List
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from openai.types.conversations import Conversation
+
+from api.conversation_cache import ConversationCache
+from api.created_at_writer import CreatedAtWriter, get_created_at_label
+from api.history_cache import HistoryCache, etag_matches
+from api.routes import router
+
+
+class FakeUpstream:
+    """The Conversations API with one conversation, whose items can be added by "other workers"."""
+
+    def __init__(self) -> None:
+        self.ids = itertools.count(1)
+        self.conversation = Conversation(id="conv_1", created_at=0, metadata={}, object="conversation")
+        # Newest first.
+        self.items: List[SimpleNamespace] = []
+        self.listed: List[Dict] = []
+        self.retrieved = 0
+
+        async def retrieve(conversation_id):
+            self.retrieved += 1
+            return self.conversation.model_copy(deep=True)
+
+        async def list_items(conversation_id, order="desc", limit=20, after=None):
+            self.listed.append({"limit": limit, "after": after})
+            start = [item.id for item in self.items].index(after) + 1 if after else 0
+            data = self.items[start:start + limit]
+            return SimpleNamespace(
+                data=data, has_more=start + limit < len(self.items), last_id=data[-1].id if data else None)
+
+        self.conversations = SimpleNamespace(retrieve=retrieve, items=SimpleNamespace(list=list_items))
+
+    def add_message(self, role: str, text: str, created_at: str = "") -> str:
+        item_id = f"msg_{next(self.ids)}"
+        content_type = "input_text" if role == "user" else "output_text"
+        self.items.insert(0, SimpleNamespace(id=item_id, type="message", role=role, content=[
+            SimpleNamespace(type=content_type, text=text, annotations=[])]))
+        if created_at:
+            self.conversation.metadata[f"{item_id}_created_at"] = created_at
+        return item_id
+
+
+@pytest.fixture
+def upstream() -> FakeUpstream:
+    upstream = FakeUpstream()
+    upstream.add_message("user", "Hello", "1.0")
+    upstream.add_message("assistant", "Hi")
+    return upstream
+
+
+@pytest.fixture
+def client(upstream: FakeUpstream) -> TestClient:
+    app = FastAPI()
+    app.include_router(router)
+    app.state.agent_version_obj = SimpleNamespace(id="agent:1", name="agent", version="1")
+    app.state.openai_client = upstream
+    app.state.conversation_cache = ConversationCache()
+    app.state.history_cache = HistoryCache()
+    app.state.created_at_writer = CreatedAtWriter(upstream)
+    client = TestClient(app)
+    client.cookies.update({"conversation_id": "conv_1", "agent_id": "agent:1"})
+    return client
+
+
+def test_not_modified_round_trip(client: TestClient):
+    response = client.get("/chat/history")
+    assert response.status_code == 200
+    assert [message["content"] for message in response.json()] == ["Hi", "Hello"]
+    etag = response.headers["ETag"]
+
+    response = client.get("/chat/history", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+
+
+def test_mismatched_etag(client: TestClient):
+    etag = client.get("/chat/history").headers["ETag"]
+    # A tag whose text contains the ETag is a different tag.
+    response = client.get("/chat/history", headers={"If-None-Match": etag[:-1] + 'x"'})
+    assert response.status_code == 200
+    response = client.get("/chat/history", headers={"If-None-Match": f'"other", {etag}'})
+    assert response.status_code == 304
+
+
+def test_turn_of_another_worker_is_served(client: TestClient, upstream: FakeUpstream):
+    etag = client.get("/chat/history").headers["ETag"]
+    upstream.add_message("user", "Again", "2.0")
+    upstream.add_message("assistant", "Sure")
+
+    response = client.get("/chat/history", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert [message["content"] for message in response.json()] == ["Sure", "Again", "Hi", "Hello"]
+
+
+def test_cached_history_is_checked_with_one_item(client: TestClient, upstream: FakeUpstream):
+    client.get("/chat/history")
+    upstream.listed.clear()
+    upstream.retrieved = 0
+    client.get("/chat/history")
+    assert upstream.listed == [{"limit": 1, "after": None}]
+    assert upstream.retrieved == 0
+
+
+def test_created_at_written_later_is_served(client: TestClient, upstream: FakeUpstream):
+    message_id = upstream.add_message("user", "Again")
+    upstream.add_message("assistant", "Sure")
+    messages = client.get("/chat/history").json()
+    assert [message["created_at"] for message in messages] == ["", "", "", "1.0"]
+
+    upstream.conversation.metadata[get_created_at_label(message_id)] = "2.0"
+    messages = client.get("/chat/history").json()
+    assert [message["created_at"] for message in messages] == ["", "2.0", "", "1.0"]
+
+
+def test_user_message_without_id_starts_the_next_page(client: TestClient, upstream: FakeUpstream):
+    client.get("/chat/history")
+    # A turn of this worker, whose user message ID the writer has not set yet.
+    upstream.add_message("user", "Again", "2.0")
+    assistant_id = upstream.add_message("assistant", "Sure")
+    client.app.state.history_cache.add_turn("conv_1", [
+        {"id": None, "anchor": assistant_id, "role": "user", "content": "Again", "annotations": [],
+         "created_at": "2.0"},
+        {"id": assistant_id, "role": "assistant", "content": "Sure", "annotations": [], "created_at": ""},
+    ])
+
+    response = client.get("/chat/history", params={"limit": 2})
+    assert [message["content"] for message in response.json()] == ["Sure"]
+    response = client.get("/chat/history", params={"limit": 2, "before": response.headers["X-Next-Before"]})
+    assert [message["content"] for message in response.json()] == ["Again", "Hi"]
+    assert "X-Next-Before" in response.headers
+
+
+@pytest.mark.parametrize("if_none_match, expected", [
+    ('W/"abc"', True),
+    ('"abc"', True),
+    ('"x", W/"abc"', True),
+    ("*", True),
+    ('W/"abcd"', False),
+    ('W/"ab"', False),
+    ("", False),
+])
+def test_etag_matches(if_none_match, expected):
+    assert etag_matches(if_none_match, 'W/"abc"') is expected
@@ -0,0 +1,31 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+
+import json
+import os
+import subprocess
+import sys
+
+SRC_DIRECTORY = os.path.abspath(os.path.join(os.path.dirname(__file__), "../src"))
+
+# The time in seconds a cold import of api.main may take, e.g. on every reload of the development server.
+IMPORT_TIME_BUDGET = float(os.environ.get("IMPORT_TIME_BUDGET", "1.0"))
+
+
+def measure_import_time(module: str) -> float:
+    result = subprocess.run(
+        [sys.executable, "-m", "api.import_profile", module, "--json"],
+        cwd=SRC_DIRECTORY, capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout)["seconds"]
+
+
+def test_import_time():
+    # The fastest of a few runs, so a busy machine does not fail the test.
+    seconds = min(measure_import_time("api.main") for _ in range(3))
+    assert seconds <= IMPORT_TIME_BUDGET, (
+        f"Importing api.main took {seconds:.3f}s, over the budget of {IMPORT_TIME_BUDGET}s. "
+        "Run `python -m api.import_profile` in src to find the slow imports."
+    )
@@ -0,0 +1,98 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+
+import logging
+import logging.handlers
+import os
+
+import pytest
+
+import logging_config
+from logging_config import RateLimitFilter, configure_logging, parse_rate_limits
+
+
+def make_record(name: str, message: str = "message") -> logging.LogRecord:
+    return logging.LogRecord(name, logging.INFO, __file__, 1, message, None, None)
+
+
+def test_rate_limit_drops_records_within_the_window(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(logging_config.time, "monotonic", lambda: now[0])
+    rate_limit = RateLimitFilter({"app.stream": 2})
+
+    passed = [rate_limit.filter(make_record("app.stream.child")) for _ in range(5)]
+    assert passed == [True, True, False, False, False]
+    # Other loggers are not limited.
+    assert all(rate_limit.filter(make_record("app")) for _ in range(5))
+
+    now[0] += 1.0
+    record = make_record("app.stream", "next")
+    assert rate_limit.filter(record)
+    assert record.getMessage() == "next (3 similar messages suppressed)"
+    assert rate_limit.filter(make_record("app.stream"))
+    assert not rate_limit.filter(make_record("app.stream"))
+
+
+def test_parse_rate_limits():
+    assert parse_rate_limits("a=5, b.c=0.5,,d=") == {"a": 5.0, "b.c": 0.5}
+
+
+@pytest.fixture
+def logger_name(request):
+    name = f"test_logging.{request.node.name}"
+    yield name
+    listener = logging_config._listeners.pop(name, None)
+    if listener is not None:
+        listener.stop()
+    logging.getLogger(name).handlers.clear()
+
+
+def read_log(logger_name: str, path) -> str:
+    # Stopping the listener writes the queued records.
+    logging_config._listeners[logger_name].stop()
+    with open(path) as file:
+        text = file.read()
+    logging_config._listeners[logger_name].start()
+    return text
+
+
+def test_configure_logging_is_idempotent(logger_name, tmp_path):
+    path = tmp_path / "app.log"
+    logger = configure_logging(str(path), logger_name=logger_name)
+    listener = logging_config._listeners[logger_name]
+    assert configure_logging(str(tmp_path / "other.log"), logger_name=logger_name) is logger
+
+    assert len(logger.handlers) == 1
+    assert isinstance(logger.handlers[0], logging.handlers.QueueHandler)
+    assert logging_config._listeners[logger_name] is listener
+    logger.info("Hello")
+    assert read_log(logger_name, path).count("Hello") == 1
+    assert not (tmp_path / "other.log").exists()
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="fork is not available")
+def test_listener_is_restarted_after_fork(logger_name, tmp_path):
+    path = tmp_path / "app.log"
+    logger = configure_logging(str(path), logger_name=logger_name)
+    parent_listener = logging_config._listeners[logger_name]
+
+    pid = os.fork()
+    if pid == 0:
+        # The child: the listener thread of the parent did not survive the fork.
+        code = 1
+        try:
+            if logging_config._listeners[logger_name] is not parent_listener:
+                logger.info("From the child")
+                logging_config._listeners[logger_name].stop()
+                code = 0
+        finally:
+            os._exit(code)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+
+    logger.info("From the parent")
+    text = read_log(logger_name, path)
+    assert "From the child" in text
+    assert "From the parent" in text
@@ -0,0 +1,91 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+
+import json
+import os
+import subprocess
+import sys
+from typing import Dict
+
+from api.metrics import PrometheusMetrics, mark_process_dead, merge_snapshots, render_prometheus
+
+
+def make_snapshot(pid: int, requests: int, in_flight: int, durations: Dict[str, int]) -> Dict:
+    return {"pid": pid, "metrics": {
+        "chat.requests": {"kind": "counter", "unit": "", "description": "Requests", "points": [
+            {"attributes": {"route": "/chat"}, "value": requests}]},
+        "chat.streams.in_flight": {"kind": "updowncounter", "unit": "", "description": "Streams", "points": [
+            {"attributes": {}, "value": in_flight}]},
+        "chat.stage.duration": {"kind": "histogram", "unit": "s", "description": "Stages", "points": [
+            {"attributes": {"stage": stage}, "bounds": [0.1, 1.0], "counts": counts, "sum": sum(counts) * 0.5,
+             "count": sum(counts)} for stage, counts in (("stream", [0, durations["stream"], 0]),)]},
+    }}
+
+
+def write_snapshot(directory: str, name: str, snapshot: Dict) -> None:
+    with open(os.path.join(directory, name), "w") as f:
+        json.dump(snapshot, f)
+
+
+def dead_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def test_merge_sums_counters_histograms_and_live_gauges():
+    merged = merge_snapshots([
+        make_snapshot(1, requests=2, in_flight=1, durations={"stream": 3}),
+        make_snapshot(2, requests=5, in_flight=2, durations={"stream": 4}),
+    ])
+    assert merged["chat.requests"]["points"] == [{"attributes": {"route": "/chat"}, "value": 7}]
+    assert merged["chat.streams.in_flight"]["points"][0]["value"] == 3
+    histogram = merged["chat.stage.duration"]["points"][0]
+    assert histogram["counts"] == [0, 7, 0]
+    assert histogram["count"] == 7
+
+    exited = merge_snapshots([make_snapshot(1, requests=2, in_flight=1, durations={"stream": 3})], live=False)
+    assert "chat.streams.in_flight" not in exited
+
+
+def test_render_prometheus():
+    text = render_prometheus(merge_snapshots([make_snapshot(1, requests=2, in_flight=1, durations={"stream": 3})]))
+    assert 'chat_requests_total{route="/chat"} 2' in text
+    assert 'chat_stage_duration_seconds_bucket{stage="stream",le="1.0"} 3' in text
+    assert 'chat_stage_duration_seconds_bucket{stage="stream",le="+Inf"} 3' in text
+    assert "chat_streams_in_flight 1" in text
+
+
+def test_mark_process_dead_keeps_counters(tmp_path):
+    directory = str(tmp_path)
+    write_snapshot(directory, "worker-11.json", make_snapshot(11, requests=2, in_flight=1, durations={"stream": 3}))
+    write_snapshot(directory, "worker-12.json", make_snapshot(12, requests=5, in_flight=1, durations={"stream": 1}))
+    mark_process_dead(11, directory)
+    mark_process_dead(12, directory)
+    mark_process_dead(13, directory)
+
+    assert sorted(os.listdir(directory)) == ["exited.json"]
+    with open(os.path.join(directory, "exited.json")) as f:
+        exited = json.load(f)
+    assert exited["pid"] == os.getpid()
+    assert exited["metrics"]["chat.requests"]["points"][0]["value"] == 7
+    assert "chat.streams.in_flight" not in exited["metrics"]
+
+
+def test_render_ignores_files_of_processes_not_running(tmp_path):
+    directory = str(tmp_path)
+    # Left behind by a worker and a gunicorn master of a previous run.
+    worker_pid, master_pid = dead_pid(), dead_pid()
+    write_snapshot(directory, f"worker-{worker_pid}.json",
+                   make_snapshot(worker_pid, requests=100, in_flight=9, durations={"stream": 1}))
+    write_snapshot(directory, "exited.json", make_snapshot(master_pid, requests=1000, in_flight=0,
+                                                           durations={"stream": 1}))
+    # A live worker, e.g. another process of this run.
+    write_snapshot(directory, "worker-1.json", make_snapshot(os.getppid(), requests=2, in_flight=1,
+                                                             durations={"stream": 1}))
+
+    text = PrometheusMetrics(directory).render()
+    assert 'chat_requests_total{route="/chat"} 2' in text
+    assert "chat_streams_in_flight 1" in text
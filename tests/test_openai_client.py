@@ -0,0 +1,82 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+
+from types import SimpleNamespace
+from typing import List
+
+import azure.ai.projects.aio
+import azure.identity.aio
+import pytest
+from fastapi.testclient import TestClient
+from openai import AsyncOpenAI
+
+
+class FakeCredential:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+
+class FakeProjectClient:
+    """The project client of the lifespan, recording the OpenAI clients it creates."""
+
+    def __init__(self, endpoint, credential) -> None:
+        self.openai_clients: List[AsyncOpenAI] = []
+
+        async def get_version(agent_name, agent_version):
+            return SimpleNamespace(id=f"{agent_name}:{agent_version}", name=agent_name, version=agent_version, metadata={})
+
+        self.agents = SimpleNamespace(get_version=get_version)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    def get_openai_client(self) -> AsyncOpenAI:
+        client = AsyncOpenAI(api_key="key", base_url="http://127.0.0.1:9/openai")
+        self.openai_clients.append(client)
+        return client
+
+
+@pytest.fixture
+def project_clients(monkeypatch) -> List[FakeProjectClient]:
+    created = []
+
+    def make(endpoint, credential):
+        created.append(FakeProjectClient(endpoint, credential))
+        return created[-1]
+
+    monkeypatch.setattr(azure.ai.projects.aio, "AIProjectClient", make)
+    monkeypatch.setattr(azure.identity.aio, "DefaultAzureCredential", FakeCredential)
+    monkeypatch.setenv("AZURE_EXISTING_AIPROJECT_ENDPOINT", "https://example.com/api/projects/project")
+    monkeypatch.setenv("AZURE_EXISTING_AGENT_ID", "agent:1")
+    monkeypatch.setenv("OPENAI_MAX_CONNECTIONS", "7")
+    monkeypatch.delenv("ENABLE_AZURE_MONITOR_TRACING", raising=False)
+    return created
+
+
+def test_one_pooled_client_per_worker(project_clients):
+    from api.main import create_app
+
+    with TestClient(create_app()) as client:
+        openai_client = client.app.state.openai_client
+        for _ in range(3):
+            assert client.get("/agent").json()["name"] == "agent"
+
+        [project_client] = project_clients
+        # The client of the project is only the template of the pooled one, and is closed.
+        [template] = project_client.openai_clients
+        assert template.is_closed()
+        assert openai_client is not template
+        assert openai_client.base_url == template.base_url
+        assert openai_client._client._transport._pool._max_connections == 7
+        assert client.app.state.openai_client is openai_client
+        assert not openai_client.is_closed()
+
+    assert openai_client.is_closed()
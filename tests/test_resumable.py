@@ -0,0 +1,97 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+
+import asyncio
+from typing import AsyncGenerator, List
+
+from api.resumable import MemoryStreamStore, ResumableStreams, parse_last_event_id, split_frames
+from api.sse import SSEEncoder
+
+
+async def produce(stream_id: str, count: int, delay: float = 0.0) -> AsyncGenerator[bytes, None]:
+    encoder = SSEEncoder(window=0, stream_id=stream_id)
+    for i in range(count):
+        yield encoder.message(f"tok{i}")
+        await asyncio.sleep(delay)
+    yield encoder.event({"type": "stream_end"})
+
+
+def sequence_numbers(chunks: List[bytes]) -> List[int]:
+    return [seq for chunk in chunks for seq, _ in split_frames(chunk)]
+
+
+def test_parse_last_event_id():
+    assert parse_last_event_id("abc:12") == ("abc", 12)
+    assert parse_last_event_id("abc") is None
+    assert parse_last_event_id("abc:x") is None
+    assert parse_last_event_id(None) is None
+
+
+def test_resume_after_last_event():
+    async def main():
+        streams = ResumableStreams(MemoryStreamStore())
+        finished = asyncio.Event()
+        await streams.begin("s1", produce("s1", 5), on_finish=finished.set)
+        await finished.wait()
+        assert await streams.exists("s1", 3)
+        chunks = [chunk async for chunk in streams.tail("s1", 3)]
+        await streams.close()
+        return chunks, streams.stats()
+
+    chunks, stats = asyncio.run(main())
+    # Frames 4 and 5 are deltas, 6 is the stream_end.
+    assert sequence_numbers(chunks) == [4, 5, 6]
+    assert stats["resumed"] == 1
+
+
+def test_resume_miss():
+    async def main():
+        store = MemoryStreamStore(max_events=2)
+        streams = ResumableStreams(store)
+        finished = asyncio.Event()
+        await streams.begin("s1", produce("s1", 5), on_finish=finished.set)
+        await finished.wait()
+        # Unknown on this worker, e.g. started by another one.
+        unknown = await streams.exists("other", 1)
+        # The frames after 1 were dropped from the ring buffer.
+        dropped = await streams.exists("s1", 1)
+        await streams.close()
+        return unknown, dropped
+
+    assert asyncio.run(main()) == (False, False)
+
+
+def test_finished_stream_expires():
+    async def main():
+        streams = ResumableStreams(MemoryStreamStore(ttl=0.01))
+        finished = asyncio.Event()
+        await streams.begin("s1", produce("s1", 1), on_finish=finished.set)
+        await finished.wait()
+        await asyncio.sleep(0.02)
+        exists = await streams.exists("s1", 1)
+        await streams.close()
+        return exists
+
+    assert asyncio.run(main()) is False
+
+
+def test_stream_without_reader_is_cancelled_after_grace():
+    async def main():
+        streams = ResumableStreams(MemoryStreamStore(), grace=0.1, read_timeout=0.05)
+        streams.start()
+        finished = asyncio.Event()
+        await streams.begin("s1", produce("s1", 1000, delay=0.01), on_finish=finished.set)
+        async with asyncio.timeout(5):
+            await finished.wait()
+        stored = await streams.store.read("s1", 0)
+        await streams.close()
+        return stored, streams.stats()
+
+    stored, stats = asyncio.run(main())
+    assert stats["abandoned"] == 1
+    assert stats["running"] == 0
+    assert stored.finished
+    # Cancelled long before the body was exhausted.
+    assert len(stored.frames) < 1000
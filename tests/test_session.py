@@ -0,0 +1,61 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+
+import time
+
+from openai.types.conversations import Conversation
+
+from api import session as session_module
+from api.session import SessionCodec
+
+
+def make_conversation(timestamps: int = 2) -> Conversation:
+    return Conversation(id="conv_1", created_at=100, object="conversation", metadata={
+        **{f"msg_{i}_created_at": str(1000 + i) for i in range(timestamps)}, "other": "x"
+    })
+
+
+def test_round_trip():
+    codec = SessionCodec(b"secret")
+    session = codec.decode(codec.issue(make_conversation(), "agent:1", pending=True))
+    assert session.conversation_id == "conv_1"
+    assert session.agent_id == "agent:1"
+    assert session.pending
+    assert session.timestamps == {"msg_0": "1000", "msg_1": "1001"}
+    assert session.to_conversation().metadata == {"msg_0_created_at": "1000", "msg_1_created_at": "1001"}
+    assert codec.stats() == {"issued": 1, "accepted": 1, "rejected": 0, "expired": 0}
+
+
+def test_newest_timestamps_are_kept():
+    codec = SessionCodec(b"secret", max_timestamps=3)
+    session = codec.decode(codec.issue(make_conversation(timestamps=5), "agent:1"))
+    assert sorted(session.timestamps) == ["msg_2", "msg_3", "msg_4"]
+
+
+def test_tampered_cookie_is_rejected():
+    codec = SessionCodec(b"secret")
+    payload, signature = codec.issue(make_conversation(), "agent:1").split(".")
+    other_payload = SessionCodec(b"secret").issue(make_conversation(timestamps=0), "agent:2").split(".")[0]
+    assert codec.decode(f"{other_payload}.{signature}") is None
+    assert codec.decode(f"{payload}.{signature[:-2]}AA") is None
+    assert codec.decode(payload) is None
+    assert codec.decode("not a cookie") is None
+    assert codec.stats()["rejected"] == 4
+
+
+def test_expired_session_is_rejected(monkeypatch):
+    codec = SessionCodec(b"secret", max_age=60)
+    value = codec.issue(make_conversation(), "agent:1")
+    now = time.time()
+    monkeypatch.setattr(session_module.time, "time", lambda: now + 61)
+    assert codec.decode(value) is None
+    assert codec.stats()["expired"] == 1
+
+
+def test_wrong_secret_is_rejected():
+    value = SessionCodec(b"secret").issue(make_conversation(), "agent:1")
+    codec = SessionCodec(b"other secret")
+    assert codec.decode(value) is None
+    assert codec.stats()["rejected"] == 1
@@ -0,0 +1,75 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+
+import asyncio
+import json
+import time
+from typing import AsyncIterator, List
+
+from api.sse import SSEEncoder, iterate_with_deadline
+
+
+def parse_frames(data: bytes) -> List[dict]:
+    return [json.loads(frame[len(b"data: "):]) for frame in data.split(b"\n\n") if frame]
+
+
+def test_flushes_at_byte_threshold():
+    encoder = SSEEncoder(window=60, max_bytes=8)
+    # Three characters, but six bytes in UTF-8.
+    assert encoder.message("ééé") is None
+    frame = encoder.message("é")
+    assert parse_frames(frame) == [{"content": "éééé", "type": "message"}]
+    assert encoder.time_until_due() is None
+
+
+def test_flushes_after_window():
+    encoder = SSEEncoder(window=0.01, max_bytes=1024)
+    assert encoder.message("Hello") is None
+    assert 0 < encoder.time_until_due() <= 0.01
+    time.sleep(0.02)
+    assert encoder.time_until_due() == 0
+    # The next delta is sent right away together with the buffered one.
+    assert parse_frames(encoder.message(" world")) == [{"content": "Hello world", "type": "message"}]
+
+
+def test_deadline_flush_without_new_delta():
+    encoder = SSEEncoder(window=0.01, max_bytes=1024)
+
+    async def deltas() -> AsyncIterator[str]:
+        yield "Hello"
+        await asyncio.sleep(0.2)
+        yield " world"
+
+    async def run() -> List[dict]:
+        frames = []
+        async for delta in iterate_with_deadline(deltas(), encoder.time_until_due):
+            frame = encoder.message(delta) if delta is not None else encoder.flush()
+            if frame:
+                frames += parse_frames(frame)
+        frames += parse_frames(encoder.event({"type": "stream_end"}))
+        return frames
+
+    assert asyncio.run(run()) == [
+        {"content": "Hello", "type": "message"},
+        {"content": " world", "type": "message"},
+        {"type": "stream_end"},
+    ]
+
+
+def test_final_event_flushes_buffer_first():
+    encoder = SSEEncoder(window=60, max_bytes=1024)
+    encoder.message("Hello")
+    encoder.message(" world")
+    frames = parse_frames(encoder.event({"type": "completed_message"}))
+    assert frames == [{"content": "Hello world", "type": "message"}, {"type": "completed_message"}]
+    assert encoder.flush() is None
+    assert encoder.stats()["deltas"] == 2
+    assert encoder.stats()["frames"] == 2
+
+
+def test_event_ids():
+    encoder = SSEEncoder(window=0, stream_id="s1")
+    assert encoder.message("a").startswith(b"id: s1:1\n")
+    assert encoder.event({"type": "stream_end"}).startswith(b"id: s1:2\n")
@@ -0,0 +1,111 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+
+import asyncio
+
+import pytest
+
+from api.startup import StartupSteps, StepSkipped
+
+
+def run(main):
+    return asyncio.run(main())
+
+
+def test_steps_get_results_of_dependencies():
+    async def main():
+        steps = StartupSteps()
+        steps.start("a", lambda: asyncio.sleep(0, "A"))
+        steps.start("b", lambda: asyncio.sleep(0, "B"))
+        steps.start("c", lambda a, b: asyncio.sleep(0, a + b), after=["a", "b"])
+        return await steps.result("c"), steps.report()
+
+    result, report = run(main)
+    assert result == "AB"
+    assert [line.split(":")[0] for line in report] == ["a", "b", "c", "total"]
+    assert all(", took " in line for line in report[:3])
+
+
+def test_independent_steps_run_concurrently():
+    async def main():
+        steps = StartupSteps()
+        for name in ("a", "b", "c"):
+            steps.start(name, lambda: asyncio.sleep(0.1))
+        started = asyncio.get_running_loop().time()
+        await asyncio.gather(*(steps.result(name) for name in ("a", "b", "c")))
+        return asyncio.get_running_loop().time() - started
+
+    assert run(main) < 0.25
+
+
+def test_failure_skips_dependents():
+    async def fail():
+        raise RuntimeError("boom")
+
+    async def main():
+        steps = StartupSteps()
+        steps.start("a", fail)
+        steps.start("b", lambda a: asyncio.sleep(0), after=["a"])
+        with pytest.raises(RuntimeError, match="boom"):
+            await steps.result("a")
+        with pytest.raises(StepSkipped):
+            await steps.result("b")
+        return steps.report()
+
+    report = run(main)
+    assert report[0].startswith("a: failed")
+    assert report[1] == "b: skipped"
+
+
+def test_timeout_starts_after_dependencies():
+    async def main():
+        steps = StartupSteps(timeout=0.05)
+        steps.start("a", lambda: asyncio.sleep(0.1, "A"), timeout=1)
+        # Waiting for "a" does not count against the timeout of "b".
+        steps.start("b", lambda a: asyncio.sleep(0.01, a), after=["a"])
+        steps.start("c", lambda: asyncio.sleep(1))
+        with pytest.raises(TimeoutError):
+            await steps.result("c")
+        return await steps.result("b"), steps.report()
+
+    result, report = run(main)
+    assert result == "A"
+    assert report[2].startswith("c: timeout")
+
+
+def test_optional_step_returns_none():
+    async def main():
+        steps = StartupSteps(timeout=0.01)
+        steps.start("a", lambda: asyncio.sleep(1), optional=True)
+        steps.start("b", lambda a: asyncio.sleep(0, a), after=["a"])
+        return await steps.result("b")
+
+    assert run(main) is None
+
+
+def test_close_cancels_running_steps():
+    async def main():
+        steps = StartupSteps()
+        steps.start("a", lambda: asyncio.sleep(10))
+        steps.start("b", lambda a: asyncio.sleep(0), after=["a"])
+        await asyncio.sleep(0)
+        await steps.close()
+        return steps.report()
+
+    report = run(main)
+    assert report[0].startswith("a: cancelled")
+    assert report[1] == "b: cancelled"
+
+
+def test_cancelled_dependency_skips_step():
+    async def main():
+        steps = StartupSteps()
+        steps.start("a", lambda: asyncio.sleep(10))
+        steps.start("b", lambda a: asyncio.sleep(0), after=["a"])
+        steps.cancel("a")
+        with pytest.raises(StepSkipped):
+            await steps.result("b")
+
+    run(main)
@@ -0,0 +1,84 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+
+import os
+
+import pytest
+
+from api.startup_state import StartupState, load_startup_state, save_startup_state, startup_config_hash
+
+VARIABLES = ("TEST_STARTUP_AGENT", "TEST_STARTUP_INDEX")
+
+
+@pytest.fixture
+def files(tmp_path):
+    paths = [str(tmp_path / "a.md"), str(tmp_path / "b.md")]
+    for path, text in zip(paths, ["first", "second"]):
+        with open(path, "w") as f:
+            f.write(text)
+    return paths
+
+
+def config_hash(paths):
+    return startup_config_hash(paths, VARIABLES)
+
+
+def test_hash_changes_with_the_environment(monkeypatch, files):
+    monkeypatch.setenv("TEST_STARTUP_AGENT", "agent:1")
+    monkeypatch.delenv("TEST_STARTUP_INDEX", raising=False)
+    before = config_hash(files)
+    assert config_hash(list(reversed(files))) == before
+
+    monkeypatch.setenv("TEST_STARTUP_AGENT", "agent:2")
+    assert config_hash(files) != before
+    monkeypatch.setenv("TEST_STARTUP_AGENT", "agent:1")
+    # An empty variable is not an unset one.
+    monkeypatch.setenv("TEST_STARTUP_INDEX", "")
+    assert config_hash(files) != before
+    monkeypatch.delenv("TEST_STARTUP_INDEX")
+    assert config_hash(files) == before
+
+
+def test_hash_changes_with_the_files(files):
+    before = config_hash(files)
+    with open(files[1], "w") as f:
+        f.write("changed")
+    changed = config_hash(files)
+    assert changed != before
+
+    os.remove(files[1])
+    missing = config_hash(files)
+    assert missing != changed
+    open(files[1], "w").close()
+    assert config_hash(files) != missing
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "state" / "startup-state.json")
+    state = StartupState(config_hash="abc", agent_id="agent:1", vector_store_id="vs_1", index_name="index")
+    save_startup_state(path, state)
+
+    loaded = load_startup_state(path, "abc")
+    assert loaded == state
+    assert loaded.updated_at > 0
+    # The file was replaced at once, no temporary file is left.
+    assert os.listdir(tmp_path / "state") == ["startup-state.json"]
+
+
+def test_changed_configuration_is_ignored(tmp_path):
+    path = str(tmp_path / "startup-state.json")
+    save_startup_state(path, StartupState(config_hash="abc", agent_id="agent:1"))
+    assert load_startup_state(path, "def") is None
+
+
+@pytest.mark.parametrize("content", ["{not json", '{"config_hash": "abc", "unknown": 1}', "[]"])
+def test_corrupt_file_is_ignored(tmp_path, content):
+    path = tmp_path / "startup-state.json"
+    path.write_text(content)
+    assert load_startup_state(str(path), "abc") is None
+
+
+def test_missing_file(tmp_path):
+    assert load_startup_state(str(tmp_path / "startup-state.json"), "abc") is None
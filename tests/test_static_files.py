@@ -0,0 +1,116 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+
+import gzip
+import os
+
+import pytest
+from fastapi import FastAPI
+from fastapi.templating import Jinja2Templates
+from fastapi.testclient import TestClient
+from starlette.datastructures import Headers
+
+from api.static_files import (
+    IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL, PrecompressedStaticFiles, StaticAsset, get_entry_files,
+    render_index_page
+)
+
+SCRIPT = b"console.log('hello');\n" * 100
+TEMPLATES = Jinja2Templates(directory=os.path.join(os.path.dirname(__file__), "../src/api/templates"))
+
+
+@pytest.fixture
+def client(tmp_path) -> TestClient:
+    assets = tmp_path / "react" / "assets"
+    assets.mkdir(parents=True)
+    script = assets / "main-abc123.js"
+    script.write_bytes(SCRIPT)
+    (assets / "main-abc123.js.gz").write_bytes(gzip.compress(SCRIPT, compresslevel=1, mtime=0))
+    # A variant of an earlier build, older than the file.
+    (assets / "main-abc123.js.br").write_bytes(b"stale")
+    os.utime(assets / "main-abc123.js.br", (script.stat().st_mtime - 60,) * 2)
+    (tmp_path / "styles.css").write_bytes(b"body { color: black; }\n" * 100)
+
+    app = FastAPI()
+    app.mount("/static", PrecompressedStaticFiles(str(tmp_path), immutable={"react/assets/main-abc123.js"}))
+    return TestClient(app)
+
+
+def test_build_variant_is_served_with_its_etag(client: TestClient, tmp_path):
+    gzipped = client.get("/static/react/assets/main-abc123.js", headers={"Accept-Encoding": "gzip"})
+    assert gzipped.headers["Content-Encoding"] == "gzip"
+    # The variant written by the build, not one compressed on load.
+    assert int(gzipped.headers["Content-Length"]) == (tmp_path / "react/assets/main-abc123.js.gz").stat().st_size
+    assert gzipped.content == SCRIPT
+
+    identity = client.get("/static/react/assets/main-abc123.js", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in identity.headers
+    assert identity.headers["ETag"] != gzipped.headers["ETag"]
+    assert gzipped.headers["ETag"] == identity.headers["ETag"][:-1] + '-gzip"'
+
+
+def test_stale_variant_is_ignored(client: TestClient):
+    response = client.get("/static/react/assets/main-abc123.js", headers={"Accept-Encoding": "br"})
+    assert response.headers.get("Content-Encoding") != "br"
+    assert response.content == SCRIPT
+
+
+def test_matching_etag_is_not_modified(client: TestClient):
+    headers = {"Accept-Encoding": "gzip"}
+    etag = client.get("/static/react/assets/main-abc123.js", headers=headers).headers["ETag"]
+
+    response = client.get("/static/react/assets/main-abc123.js", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    # The ETag of another encoding is another representation.
+    response = client.get(
+        "/static/react/assets/main-abc123.js", headers={"Accept-Encoding": "identity", "If-None-Match": etag})
+    assert response.status_code == 200
+
+
+def test_cache_control(client: TestClient):
+    assert client.get("/static/react/assets/main-abc123.js").headers["Cache-Control"] == IMMUTABLE_CACHE_CONTROL
+    assert client.get("/static/styles.css").headers["Cache-Control"] == REVALIDATE_CACHE_CONTROL
+    # Range requests are served by StaticFiles, with the same headers.
+    response = client.get("/static/react/assets/main-abc123.js", headers={"Range": "bytes=0-9"})
+    assert response.status_code == 206
+    assert response.headers["Cache-Control"] == IMMUTABLE_CACHE_CONTROL
+
+
+def test_small_asset_is_not_compressed():
+    asset = StaticAsset.from_bytes(b"tiny", "text/plain", REVALIDATE_CACHE_CONTROL)
+    response = asset.response(Headers({"accept-encoding": "gzip"}))
+    assert asset.variants == {}
+    assert "content-encoding" not in response.headers
+
+
+MANIFEST = {
+    "index.html": {"file": "assets/main-abc123.js", "isEntry": True, "css": ["assets/main-def456.css"]},
+    "logo.svg": {"file": "assets/logo-789.svg"},
+}
+
+
+def test_get_entry_files():
+    assert get_entry_files(MANIFEST) == ("assets/main-abc123.js", ["assets/main-def456.css"])
+    # Without cssCodeSplit the stylesheet is a chunk of its own.
+    manifest = {
+        "index.html": {"file": "assets/main-abc123.js", "isEntry": True},
+        "style.css": {"file": "assets/style-def456.css"},
+    }
+    assert get_entry_files(manifest) == ("assets/main-abc123.js", ["assets/style-def456.css"])
+    assert get_entry_files({}) == (None, [])
+
+
+def test_render_index_page_with_manifest():
+    page = render_index_page(TEMPLATES, MANIFEST, base_url="/static/react/")
+    assert b'src="/static/react/assets/main-abc123.js"' in page.body
+    assert b'href="/static/react/assets/main-def456.css"' in page.body
+    assert page.cache_control == REVALIDATE_CACHE_CONTROL
+
+
+def test_render_index_page_without_manifest():
+    page = render_index_page(TEMPLATES, {}, base_url="/static/react/")
+    assert b'src="/static/react/assets/main-react-app.js"' in page.body
+    assert b'href="/static/react/assets/main-react-app.css"' in page.body
@@ -0,0 +1,135 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+
+import asyncio
+import itertools
+from types import SimpleNamespace
+from typing import Dict, List
+
+import pytest
+
+from api.vector_store_uploader import FileIndexingError, VectorStoreUploader, file_digest, manifest_hash
+
+
+async def iterate(items):
+    for item in items:
+        yield item
+
+
+class FakeVectorStoreFiles:
+    def __init__(self, client: "FakeOpenAI") -> None:
+        self._client = client
+
+    def list(self, vector_store_id: str, **kwargs):
+        return iterate(self._client.store_files[vector_store_id])
+
+    async def create_and_poll(self, file_id: str, vector_store_id: str, attributes: Dict[str, str]):
+        if self._client.failures:
+            self._client.failures -= 1
+            return SimpleNamespace(id=file_id, status="failed", last_error="server_error")
+        self._client.store_files[vector_store_id].append(SimpleNamespace(id=file_id, attributes=attributes))
+        return SimpleNamespace(id=file_id, status="completed", last_error=None)
+
+
+class FakeVectorStores:
+    def __init__(self, client: "FakeOpenAI") -> None:
+        self._client = client
+        self.files = FakeVectorStoreFiles(client)
+
+    async def create(self, name: str, metadata: Dict[str, str]):
+        store = SimpleNamespace(id=f"vs_{next(self._client.ids)}", metadata=metadata, status="completed")
+        self._client.stores.insert(0, store)
+        self._client.store_files[store.id] = []
+        return store
+
+    async def update(self, vector_store_id: str, metadata: Dict[str, str]):
+        store = next(store for store in self._client.stores if store.id == vector_store_id)
+        store.metadata = metadata
+        return store
+
+    async def retrieve(self, vector_store_id: str):
+        return next(store for store in self._client.stores if store.id == vector_store_id)
+
+    def list(self, **kwargs):
+        return iterate(self._client.stores)
+
+
+class FakeFiles:
+    def __init__(self, client: "FakeOpenAI") -> None:
+        self._client = client
+
+    async def create(self, file, purpose: str):
+        self._client.uploaded.append(file[0])
+        return SimpleNamespace(id=f"file_{next(self._client.ids)}")
+
+
+class FakeOpenAI:
+    def __init__(self) -> None:
+        self.ids = itertools.count(1)
+        self.stores: List[SimpleNamespace] = []
+        self.store_files: Dict[str, List[SimpleNamespace]] = {}
+        self.uploaded: List[str] = []
+        self.failures = 0
+        self.vector_stores = FakeVectorStores(self)
+        self.files = FakeFiles(self)
+
+
+@pytest.fixture
+def paths(tmp_path):
+    paths = []
+    for name, content in (("a.md", "alpha"), ("b.md", "beta")):
+        path = tmp_path / name
+        path.write_text(content)
+        paths.append(str(path))
+    return paths
+
+
+def test_manifest_hash_ignores_order(paths):
+    digests = {"a.md": file_digest(paths[0]), "b.md": file_digest(paths[1])}
+    assert manifest_hash(digests) == manifest_hash(dict(reversed(list(digests.items()))))
+    assert manifest_hash(digests) != manifest_hash({"a.md": digests["b.md"], "b.md": digests["a.md"]})
+
+
+def test_unchanged_files_are_not_uploaded(paths):
+    client = FakeOpenAI()
+    first = asyncio.run(VectorStoreUploader(client).sync(paths))
+    assert sorted(client.uploaded) == ["a.md", "b.md"]
+
+    uploader = VectorStoreUploader(client)
+    assert asyncio.run(uploader.sync(paths, first)) == first
+    assert sorted(client.uploaded) == ["a.md", "b.md"]
+    assert uploader.report()[-1] == "unchanged: 2"
+
+
+def test_only_changed_files_are_uploaded(paths):
+    client = FakeOpenAI()
+    first = asyncio.run(VectorStoreUploader(client).sync(paths))
+    with open(paths[1], "w") as f:
+        f.write("gamma")
+
+    uploaded = len(client.uploaded)
+    uploader = VectorStoreUploader(client)
+    second = asyncio.run(uploader.sync(paths))
+    assert second != first
+    assert client.uploaded[uploaded:] == ["b.md"]
+    assert len(client.store_files[second]) == 2
+    assert uploader.report()[-1] == "reused: 1, uploaded: 1"
+
+
+def test_indexing_failures_are_retried(paths):
+    client = FakeOpenAI()
+    client.failures = 1
+    uploader = VectorStoreUploader(client, retries=2, backoff=0)
+    vector_store_id = asyncio.run(uploader.sync(paths))
+    assert len(client.store_files[vector_store_id]) == 2
+    assert any("in 2 attempts" in line for line in uploader.report())
+
+
+def test_incomplete_vector_store_gets_no_manifest(paths):
+    client = FakeOpenAI()
+    client.failures = 10
+    with pytest.raises(FileIndexingError):
+        asyncio.run(VectorStoreUploader(client, retries=1, backoff=0).sync(paths))
+    assert "manifest" not in client.stores[0].metadata
@@ -0,0 +1,81 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+
+import json
+from typing import Dict, List
+
+from api.admission import AdmissionController
+
+
+def receive_turn(websocket) -> List[Dict]:
+    events = [json.loads(websocket.receive_text())]
+    while events[-1]["type"] not in ("stream_end", "error"):
+        events.append(json.loads(websocket.receive_text()))
+    return events
+
+
+def send_message(websocket, message: str) -> None:
+    websocket.send_text(json.dumps({"type": "message", "message": message}))
+
+
+def test_turn(upstream, make_client):
+    with make_client(upstream) as client:
+        with client.websocket_connect("/ws/chat") as websocket:
+            send_message(websocket, "Hello")
+            events = receive_turn(websocket)
+        assert events == [
+            {"content": "Hi", "type": "message"},
+            {"content": "Hi", "annotations": [], "type": "completed_message"},
+            {"type": "stream_end"},
+        ]
+        # The conversation was created on connect.
+        assert upstream.responded == list(upstream.conversations_by_id)
+        assert client.app.state.admission_controller.active == 0
+
+
+def test_error_frames(upstream, make_client):
+    with make_client(upstream) as client:
+        with client.websocket_connect("/ws/chat") as websocket:
+            websocket.send_text("not json")
+            assert json.loads(websocket.receive_text())["content"].startswith("Invalid JSON")
+            websocket.send_text(json.dumps({"type": "unknown"}))
+            assert json.loads(websocket.receive_text()) == {"type": "error", "content": "Unknown message type: unknown"}
+
+            # A turn rejected by the admission controller ends right away.
+            admission = client.app.state.admission_controller = AdmissionController(max_active=1, max_queue=0)
+            client.portal.call(admission.acquire)
+            send_message(websocket, "Hello")
+            error = json.loads(websocket.receive_text())
+            assert error["type"] == "error"
+            assert error["retry_after"] == admission.retry_after
+            assert json.loads(websocket.receive_text()) == {"type": "stream_end"}
+    assert upstream.responded == []
+
+
+def test_cancel(upstream, make_client):
+    upstream.hang = True
+    with make_client(upstream) as client:
+        with client.websocket_connect("/ws/chat") as websocket:
+            send_message(websocket, "Hello")
+            assert json.loads(websocket.receive_text()) == {"content": "Hi", "type": "message"}
+            websocket.send_text(json.dumps({"type": "cancel"}))
+            assert json.loads(websocket.receive_text()) == {"type": "stream_end", "cancelled": True}
+        client.portal.call(client.app.state.upstream_canceller.close)
+        assert [stream.closed for stream in upstream.streams] == [True]
+        assert client.app.state.admission_controller.active == 0
+
+
+def test_disconnect_cancels_the_turn(upstream, make_client):
+    upstream.hang = True
+    with make_client(upstream) as client:
+        client.app.state.admission_controller = AdmissionController(max_active=1)
+        with client.websocket_connect("/ws/chat") as websocket:
+            send_message(websocket, "Hello")
+            assert json.loads(websocket.receive_text()) == {"content": "Hi", "type": "message"}
+        client.portal.call(client.app.state.upstream_canceller.close)
+        assert [stream.closed for stream in upstream.streams] == [True]
+        assert client.app.state.upstream_canceller.cancelled == 1
+        assert client.app.state.admission_controller.active == 0
+        assert client.app.state.created_at_writer.is_pending(upstream.responded[0])
@@ -0,0 +1,69 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+
+import os
+
+import pytest
+
+from api.worker_sizing import plan_workers, read_cpu_quota, read_memory_limit
+
+MB = 2**20
+
+
+def write_files(root, files):
+    for name, content in files.items():
+        path = os.path.join(str(root), name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(content + "\n")
+    return str(root)
+
+
+@pytest.mark.parametrize("files, quota", [
+    ({"cpu.max": "150000 100000"}, 1.5),
+    ({"cpu.max": "max 100000"}, None),
+    ({"cpu/cpu.cfs_quota_us": "200000", "cpu/cpu.cfs_period_us": "100000"}, 2.0),
+    ({"cpu/cpu.cfs_quota_us": "-1", "cpu/cpu.cfs_period_us": "100000"}, None),
+    ({"cpu,cpuacct/cpu.cfs_quota_us": "50000", "cpu,cpuacct/cpu.cfs_period_us": "100000"}, 0.5),
+    ({"cpuacct,cpu/cpu.cfs_quota_us": "300000", "cpuacct,cpu/cpu.cfs_period_us": "100000"}, 3.0),
+    ({}, None),
+])
+def test_read_cpu_quota(tmp_path, files, quota):
+    assert read_cpu_quota(write_files(tmp_path, files)) == quota
+
+
+@pytest.mark.parametrize("files, limit", [
+    ({"memory.max": str(512 * MB)}, 512 * MB),
+    ({"memory.max": "max"}, None),
+    ({"memory/memory.limit_in_bytes": str(1024 * MB)}, 1024 * MB),
+    ({"memory/memory.limit_in_bytes": "9223372036854771712"}, None),
+    ({}, None),
+])
+def test_read_memory_limit(tmp_path, files, limit):
+    assert read_memory_limit(write_files(tmp_path, files)) == limit
+
+
+def test_one_worker_per_cpu():
+    plan = plan_workers(cpus=2, memory=None, worker_rss=150 * MB)
+    assert (plan.workers, plan.limited_by) == (2, "cpu")
+    assert plan.max_active_streams == 32
+    assert plan.environment() == {
+        "CHAT_MAX_ACTIVE_STREAMS": "32", "CHAT_MAX_QUEUED_STREAMS": "64", "OPENAI_MAX_CONNECTIONS": "100",
+    }
+
+
+def test_workers_limited_by_memory():
+    # 75% of 512 MB is 384 MB; 100 MB for the master leave room for one worker of 150 MB.
+    plan = plan_workers(cpus=4, memory=512 * MB, worker_rss=150 * MB, master_rss=100 * MB)
+    assert (plan.workers, plan.limited_by) == (1, "memory")
+    # The streams of the four CPUs all go to the one worker.
+    assert plan.max_active_streams == 128
+    assert plan.openai_max_connections == 384
+
+
+def test_configured_workers_are_kept():
+    plan = plan_workers(cpus=1, memory=256 * MB, worker_rss=150 * MB, workers=3)
+    assert (plan.workers, plan.limited_by) == (3, "configuration")
+    assert plan.max_active_streams == 11